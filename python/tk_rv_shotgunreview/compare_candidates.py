@@ -0,0 +1,139 @@
+import time
+
+
+# statuses which are under a version's 'sg_status_list' field (legacy support
+# for old version statuses); new style version status stores 'stc' in the
+# sg_delivery_status field on the Version
+OLD_STC_STATUSES = ["stc", "apr", "fin", "fp2k"]
+
+# what the compare hotkeys hand on to the comparison
+COMPARE_FIELDS = ['sg_uploaded_movie_frame_rate',
+                  'sg_first_frame',
+                  'sg_movie_has_slate',
+                  'sg_path_to_movie',
+                  'sg_path_to_frames',
+                  'entity']
+
+# what we need on top of that to pick candidates out of a prefetched list
+CANDIDATE_FIELDS = COMPARE_FIELDS + ['sg_last_frame',
+                                     'sg_layer',
+                                     'sg_greatest',
+                                     'sg_delivery_status',
+                                     'sg_status_list']
+
+
+def compare_key(version):
+    """
+    What a compare candidate has to share with the version it is compared
+    with: shot, and first and last frame.  None for versions not on a shot.
+    """
+    entity = version.get('entity')
+    if not entity or entity.get('type') != 'Shot':
+        return None
+
+    return (entity['id'], version.get('sg_first_frame'), version.get('sg_last_frame'))
+
+
+def find_compare_candidates(sg, project_entity, keys, steps):
+    """
+    Every Version with a movie matching one of the given compare keys, one
+    query per step, newest first.  The filters are those of
+    PopupUtils.retrieve_versions_for_compare, for all the keys at once.
+    Runs in a background thread.
+
+    :returns: dict of step short name -> list of Version dicts.
+    """
+    candidates = {}
+
+    key_filters = [{
+        'filter_operator': 'all',
+        'filters': [['entity', 'is', {'type': 'Shot', 'id': shot_id}],
+                    ['sg_first_frame', 'is', first_frame],
+                    ['sg_last_frame', 'is', last_frame]]
+    } for (shot_id, first_frame, last_frame) in keys]
+
+    for step in steps:
+        filters = [['project', 'is', project_entity],
+                   {'filter_operator': 'any', 'filters': key_filters},
+                   ['sg_step.Step.short_name', 'is', step],
+                   ['sg_path_to_movie', 'is_not', None]]
+
+        candidates[step] = sg.find('Version', filters, CANDIDATE_FIELDS,
+            order=[{'field_name': 'created_at', 'direction':'desc'}])
+
+    return candidates
+
+
+def is_sent_to_client(version):
+    status = version.get('sg_delivery_status')
+    if status is None:
+        return version.get('sg_status_list') in OLD_STC_STATUSES
+
+    return status == 'stc'
+
+
+class CompareCandidateCache(object):
+    """
+    Prefetched compare candidates per compare key (shot and frame range) and
+    step, so the compare hotkeys can usually answer without asking Shotgun.
+    A key's entry expires ttl seconds after it was fetched.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+
+        # compare key -> (fetch time, {step: [versions, newest first]})
+        self._entries = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def store(self, keys, candidates):
+        now = time.time()
+
+        fetched = dict((key, dict((step, []) for step in candidates)) for key in keys)
+
+        for (step, versions) in candidates.items():
+            for version in versions:
+                by_step = fetched.get(compare_key(version))
+                if by_step is not None:
+                    by_step[step].append(version)
+
+        for (key, by_step) in fetched.items():
+            self._entries[key] = (now, by_step)
+
+    def lookup(self, version, step, layer=None, greatest=None, stc=False):
+        """
+        Same answer as PopupUtils.retrieve_versions_for_compare, if we have
+        fresh candidates for this version's compare key and step.
+
+        :returns: None if we don't know, else a list holding the Version to
+            compare with, or an empty list if there isn't one.
+        """
+        entry = self._entries.get(compare_key(version))
+
+        if not entry or time.time() - entry[0] > self.ttl or step not in entry[1]:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+
+        for candidate in entry[1][step]:
+            if layer and candidate.get('sg_layer') != layer:
+                continue
+            if greatest and not candidate.get('sg_greatest'):
+                continue
+            if stc and not is_sent_to_client(candidate):
+                continue
+
+            return [dict((f, candidate.get(f)) for f in ['type', 'id'] + COMPARE_FIELDS)]
+
+        return []
+
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def clear(self):
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
@@ -0,0 +1,221 @@
+required_version_fields = [
+    "code",
+    "id",
+    "entity",
+    "project",
+    "sg_first_frame",
+    "sg_last_frame",
+    "sg_frames_aspect_ratio",
+    "sg_frames_have_slate",
+    "sg_movie_aspect_ratio",
+    "sg_movie_has_slate",
+    "sg_path_to_frames",
+    "sg_path_to_movie",
+    "sg_status_list",
+    "sg_uploaded_movie_frame_rate"
+    ]
+
+
+def data_from_cut_item(sg, rv, log_error=None):
+    version_data = {}
+    edit_data = {}
+
+    # We prefer the Version that resulted from filtering, fall back to the
+    # one attached to the CutItem, then fallback to the one attached to the
+    # Cut.
+
+    if   rv and rv.get("id"):
+
+        for f in required_version_fields:
+            version_data[f] = rv.get(f)
+
+        edit_data["in"]    = sg.get("cut_item_in")
+        edit_data["out"]   = sg.get("cut_item_out")
+
+    elif sg and sg.get("version.Version.id"):
+
+        for f in required_version_fields:
+            version_data[f] = sg.get("version.Version." + f)
+
+        edit_data["in"]    = sg.get("cut_item_in")
+        edit_data["out"]   = sg.get("cut_item_out")
+
+    else:
+        for f in required_version_fields:
+            version_data[f] = sg.get("cut.Cut.version.Version." + f)
+
+        edit_data["in"]    = sg.get("edit_in")
+        edit_data["out"]   = sg.get("edit_out")
+
+    edit_data["shot"] = sg.get("shot")
+
+    if version_data["id"] is None:
+        if log_error:
+            log_error("No Version data for CutItem id=%d." % sg.get("id"))
+        version_data["id"]   = 100000 + sg.get("cut.Cut.id", 0)
+        version_data["code"] = "Missing Version"
+
+    return (version_data, edit_data)
+
+
+def data_from_version(sg):
+    version_data = sg
+    edit_data = {}
+    edit_data["in"]  = sg.get("sg_first_frame", None)
+    edit_data["out"] = sg.get("sg_last_frame",  None)
+    edit_data["shot"] = None
+
+    # Note, we used to fallback to assuming range = 1-100 for sources
+    # that do not have first/last frame fields set, now we allow those
+    # "None"s to flow through here and we'll adjust later.
+
+    if sg.get("entity"):
+        if sg.get("entity").get("type") == "Shot":
+            edit_data["shot"] = sg.get("entity")
+
+    return (version_data, edit_data)
+
+
+def data_from_query_item(sg_item, rv_item, target_entity, log_error=None):
+    if target_entity["type"] == "Cut":
+        return data_from_cut_item(sg_item, rv_item, log_error)
+
+    return data_from_version(sg_item)
+
+
+class Edl(object):
+    """
+    The EDL of a tray load.  inputs holds the version_data of each distinct
+    Version, in order of first use; source, frame, in and out are the
+    sequence's edl arrays (with the terminating entry), source indexing
+    into inputs.
+
+    Clips whose Version has no first/last frame in Shotgun are listed in
+    unresolved; whoever makes their sources fills in the range with
+    resolve() and then calls compute_frames().
+    """
+
+    def __init__(self, clip_count):
+        self.inputs = []
+
+        self.source = [0] * (clip_count + 1)
+        self.frame  = [0] * (clip_count + 1)
+        self.ins    = [0] * (clip_count + 1)
+        self.outs   = [0] * (clip_count + 1)
+
+        # per clip
+        self.version_data = [None] * clip_count
+        self.edit_data    = [None] * clip_count
+
+        self.unresolved = []
+
+        # clip the mini-cut should focus on, or -1
+        self.mini_focus_clip = -1
+
+    def clip_count(self):
+        return len(self.edit_data)
+
+    def resolve(self, clip, start, end):
+        edit_data = self.edit_data[clip]
+        if edit_data["in"] is None:
+            edit_data["in"] = start
+        if edit_data["out"] is None:
+            edit_data["out"] = end
+
+        self.ins[clip]  = edit_data["in"]
+        self.outs[clip] = edit_data["out"]
+
+    def compute_frames(self):
+        accumulated_frames = 0
+        for clip in range(self.clip_count()):
+            self.frame[clip] = accumulated_frames + 1
+            accumulated_frames += self.outs[clip] - self.ins[clip] + 1
+
+        self.frame[-1] = accumulated_frames + 1
+
+
+def build_edl(rows, target_entity, pinned, mini_focus=None, log_error=None):
+    """
+    Build the EDL for a tray load, as plain data: nothing here touches the
+    RV graph, so it can be run (and timed) outside RV.
+
+    :param rows: (sg_item, rv_item) of each tray row, in cut order.
+    :param pinned: shot id string -> version_data of pinned Versions, which
+        replace the Versions of a Cut's clips.
+    :param mini_focus: entity (Version, or CutItem) the mini-cut should
+        focus on, if any.
+    :returns: Edl
+    """
+    edl = Edl(len(rows))
+    input_map = {}
+
+    is_cut = target_entity.get("type") == "Cut"
+
+    focus_item = focus_version = focus_shot = -1
+    if mini_focus:
+        if mini_focus.get("type") == "CutItem":
+            focus_item = mini_focus["id"]
+        else:
+            focus_version = mini_focus["id"]
+            if mini_focus.get("shot"):
+                focus_shot = mini_focus["shot"]["id"]
+
+    clip_from_item = clip_from_version = clip_from_shot = -1
+
+    for (clip, (sg_item, rv_item)) in enumerate(rows):
+
+        # Build unique version_data and edit_data dictionaries for this row.
+        # This contains all the logic for using different Versions etc.
+        (version_data, edit_data) = data_from_query_item(sg_item, rv_item, target_entity, log_error)
+
+        # If displaying a Cut and the shot of this CutItem corresponds to a
+        # pinned version, use that instead.
+        if is_cut:
+            shot_id = edit_data["shot"].get("id") if edit_data["shot"] else None
+            pinned_version_data = pinned.get(str(shot_id))
+            if pinned_version_data:
+                version_data = pinned_version_data
+                # XXX ok, we just swapped version_data out, but the old
+                # version might have been the "base layer" in which case
+                # the edit_data is wrong for this version ...
+
+        # If looking for mini-cut focus, check all possible methods of
+        # matching the clip.
+        if mini_focus:
+            if focus_version != -1 and clip_from_version == -1 and focus_version == version_data["id"]:
+                clip_from_version = clip
+
+            if (focus_shot != -1 and clip_from_shot == -1 and
+                    edit_data["shot"] and edit_data["shot"]["id"] == focus_shot):
+                clip_from_shot = clip
+
+            if focus_item != -1 and clip_from_item == -1 and focus_item == sg_item["id"]:
+                clip_from_item = clip
+
+        # input for this clip is just the nth input, unless we already have it.
+        input_num = input_map.get(version_data["id"])
+        if input_num is None:
+            input_num = len(edl.inputs)
+            input_map[version_data["id"]] = input_num
+            edl.inputs.append(version_data)
+
+        edl.source[clip] = input_num
+        edl.version_data[clip] = version_data
+        edl.edit_data[clip] = edit_data
+
+        if edit_data["in"] is None or edit_data["out"] is None:
+            edl.unresolved.append(clip)
+        else:
+            edl.ins[clip]  = edit_data["in"]
+            edl.outs[clip] = edit_data["out"]
+
+    # use "best" mini-cut focus clip detected above
+    for clip in (clip_from_item, clip_from_version, clip_from_shot):
+        if clip != -1:
+            edl.mini_focus_clip = clip
+            break
+
+    if not edl.unresolved:
+        edl.compute_frames()
+
+    return edl
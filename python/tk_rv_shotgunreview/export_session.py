@@ -0,0 +1,153 @@
+import re
+
+# "name : protocol (version)" opening each top level object of a GTO text
+# file; names with odd characters are quoted
+_OBJECT_HEADER = re.compile(r'^("(?:[^"\\]|\\.)*"|\S+)\s*:\s*(\S+)\s*\((\d+)\)\s*$')
+
+_QUOTED = re.compile(r'"((?:[^"\\]|\\.)*)"')
+
+
+def _unquote(name):
+    if name.startswith('"') and name.endswith('"'):
+        return name[1:-1]
+    return name
+
+
+def _quote(value):
+    return '"%s"' % value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def _brace_depth_change(line):
+    """
+    Net change in brace depth over line, ignoring braces in strings (our
+    properties hold JSON).
+    """
+    change = 0
+    in_string = False
+    escaped = False
+
+    for c in line:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif c == '\\':
+                escaped = True
+            elif c == '"':
+                in_string = False
+        elif c == '"':
+            in_string = True
+        elif c == '{':
+            change += 1
+        elif c == '}':
+            change -= 1
+
+    return change
+
+
+def split_objects(text):
+    """
+    Split the text of a saved session into its preamble ("GTOa (4)") and its
+    top level objects.
+
+    :returns: (preamble, [(name, protocol, object text)])
+    """
+    preamble = []
+    objects = []
+    current = None
+    depth = 0
+
+    for line in text.splitlines(True):
+        if current is None:
+            match = _OBJECT_HEADER.match(line.strip())
+            if match:
+                current = [_unquote(match.group(1)), match.group(2), [line]]
+                depth = 0
+            elif objects:
+                # blank lines between objects
+                objects[-1][2].append(line)
+            else:
+                preamble.append(line)
+            continue
+
+        current[2].append(line)
+        opened = depth > 0 or "{" in line
+        depth += _brace_depth_change(line)
+
+        if opened and depth == 0:
+            objects.append(current)
+            current = None
+
+    if current is not None:
+        objects.append(current)
+
+    return ("".join(preamble), [(name, protocol, "".join(lines)) for (name, protocol, lines) in objects])
+
+
+def _replace_string_array(object_text, component, prop, values):
+    """
+    Replace the values of the string property component.prop, written
+    either as one value or as a (possibly multi-line) [ ] array.
+    """
+    pattern = re.compile(
+        r'(\b%s\s*\{[^{}]*?string(?:\[\d+\])?\s+%s\s*=\s*)(\[(?:[^\]"]|"(?:[^"\\]|\\.)*")*\]|"(?:[^"\\]|\\.)*")' %
+        (re.escape(component), re.escape(prop)), re.S)
+
+    def replace(match):
+        # keep a single value written as one
+        if len(values) == 1 and match.group(2).startswith('"'):
+            return match.group(1) + _quote(values[0])
+        if not values:
+            return match.group(1) + "[ ]"
+        return match.group(1) + "[ %s ]" % " ".join(_quote(v) for v in values)
+
+    return pattern.sub(replace, object_text, count=1)
+
+
+def _string_array(object_text, component, prop):
+    pattern = re.compile(
+        r'\b%s\s*\{[^{}]*?string(?:\[\d+\])?\s+%s\s*=\s*(\[(?:[^\]"]|"(?:[^"\\]|\\.)*")*\]|"(?:[^"\\]|\\.)*")' %
+        (re.escape(component), re.escape(prop)), re.S)
+
+    match = pattern.search(object_text)
+    if not match:
+        return None
+
+    return [v.replace('\\"', '"').replace('\\\\', '\\') for v in _QUOTED.findall(match.group(1))]
+
+
+def minimal_session(text, view_node, drop_nodes):
+    """
+    Cut the text of a saved session down to what RVIO needs to render
+    view_node: the nodes in drop_nodes (other sources, sequences, compare
+    nodes ...) are removed along with their connections, and the session
+    views view_node.  Everything else (display and output setup, the
+    view node's own members) is passed through untouched.
+    """
+    drop_nodes = set(drop_nodes)
+    drop_nodes.discard(view_node)
+
+    (preamble, objects) = split_objects(text)
+    kept = [preamble]
+
+    for (name, protocol, object_text) in objects:
+        if name in drop_nodes:
+            continue
+
+        if protocol == "RVSession":
+            object_text = _replace_string_array(object_text, "session", "viewNode", [view_node])
+
+        elif protocol == "connection":
+            lhs = _string_array(object_text, "evaluation", "lhs") or []
+            rhs = _string_array(object_text, "evaluation", "rhs") or []
+            pairs = [(l, r) for (l, r) in zip(lhs, rhs) if l not in drop_nodes and r not in drop_nodes]
+            object_text = _replace_string_array(object_text, "evaluation", "lhs", [l for (l, r) in pairs])
+            object_text = _replace_string_array(object_text, "evaluation", "rhs", [r for (l, r) in pairs])
+
+            top = _string_array(object_text, "top", "nodes")
+            if top is not None:
+                object_text = _replace_string_array(object_text, "top", "nodes",
+                        [n for n in top if n not in drop_nodes])
+
+        kept.append(object_text)
+
+    return "".join(kept)
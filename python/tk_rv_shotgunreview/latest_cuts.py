@@ -0,0 +1,259 @@
+import tank
+from tank.platform.qt import QtCore
+
+shotgun_data = tank.platform.import_framework("tk-framework-shotgunutils", "shotgun_data")
+
+
+LATEST_CUT_FIELDS = ['id', 'created_at', 'cached_display_name']
+LATEST_CUT_ORDER = [ {'field_name':'created_at','direction':'desc'} ]
+LATEST_CUT_PRESETS = [ { "preset_name": "LATEST", "latest_by": "REVISION_NUMBER" } ]
+
+
+def latest_cut_filters(version_data):
+    """
+    original JS query here:
+    https://github.com/shotgunsoftware/shotgun/blob/develop/cut_support_2016/public/javascripts/util/cuts_helper.js#L167
+
+    Filters for the Cuts that use this version, or the version's shot.
+    """
+    version_entity = {}
+    version_entity['id'] = version_data['id']
+    version_entity['type'] = "Version"
+    version_entity['name'] = version_data['code']
+
+    shot_entity = None
+    if version_data.get("entity") and version_data.get("entity").get("type") == "Shot":
+        shot_entity = version_data.get("entity")
+
+    project_entity = version_data.get("project")
+
+    cut_filters = [
+        {
+            "filter_operator": "any",
+            "filters": [
+                ['cut_items.CutItem.version', 'is', version_entity],
+                ['version', 'is', version_entity]
+            ]
+        }
+    ]
+
+    if shot_entity:
+        cut_filters[0]['filters'].append(['cut_items.CutItem.shot', 'is', shot_entity])
+
+    if project_entity:
+        cut_filters.insert(0, ['project', 'is', project_entity] )
+
+    return cut_filters
+
+
+def latest_cut_entity(cut):
+    """
+    The trimmed down cut entity we store in the session, or None.
+    """
+    if cut:
+        return { "id" : cut['id'], "cached_display_name" : cut['cached_display_name'], "type" : "Cut" }
+
+    return None
+
+
+def find_latest_cuts(sg, versions):
+    """
+    Latest cut for each of a list of version data dicts, in two queries
+    rather than one per Version.  Runs in a background thread.
+
+    Same rules as latest_cut_filters: a Cut counts for a Version if it is the
+    Cut's version, or one of its CutItems uses the Version or the Version's
+    shot.  Of those, the most recently created latest revision wins.
+
+    :returns: dict of Version id -> cut entity, or None where there is no cut.
+    """
+    version_entities = []
+    shot_entities = {}
+    projects = set()
+
+    for version_data in versions:
+        version_entities.append({"type": "Version", "id": version_data["id"]})
+
+        shot = version_data.get("entity")
+        if shot and shot.get("type") == "Shot":
+            shot_entities[shot["id"]] = {"type": "Shot", "id": shot["id"]}
+
+        project = version_data.get("project")
+        projects.add(project["id"] if project else None)
+
+    if not version_entities:
+        return {}
+
+    usage_filters = [
+        ['cut_items.CutItem.version', 'in', version_entities],
+        ['version', 'in', version_entities]
+    ]
+
+    if shot_entities:
+        usage_filters.append(['cut_items.CutItem.shot', 'in', shot_entities.values()])
+
+    cut_filters = [ { "filter_operator": "any", "filters": usage_filters } ]
+
+    # the single-version query narrows by project, do the same if we can
+    if len(projects) == 1 and None not in projects:
+        cut_filters.insert(0, ['project', 'is', {"type": "Project", "id": projects.pop()}])
+
+    cuts = sg.find(
+        'Cut',
+        fields=LATEST_CUT_FIELDS + ['version'],
+        filters=cut_filters,
+        additional_filter_presets=LATEST_CUT_PRESETS,
+        order=LATEST_CUT_ORDER
+    )
+
+    # which of these cuts use which versions and shots
+    cuts_by_version = {}
+    cuts_by_shot = {}
+
+    for cut in cuts:
+        if cut.get('version'):
+            cuts_by_version.setdefault(cut['version']['id'], set()).add(cut['id'])
+
+    if cuts:
+        item_filters = [
+            ['cut', 'in', [{"type": "Cut", "id": c['id']} for c in cuts]],
+            {
+                "filter_operator": "any",
+                "filters": [ ['version', 'in', version_entities] ] +
+                    ([ ['shot', 'in', shot_entities.values()] ] if shot_entities else [])
+            }
+        ]
+
+        for item in sg.find('CutItem', filters=item_filters, fields=['cut', 'version', 'shot']):
+            if not item.get('cut'):
+                continue
+            if item.get('version'):
+                cuts_by_version.setdefault(item['version']['id'], set()).add(item['cut']['id'])
+            if item.get('shot'):
+                cuts_by_shot.setdefault(item['shot']['id'], set()).add(item['cut']['id'])
+
+    latest = {}
+    for version_data in versions:
+        cut_ids = set(cuts_by_version.get(version_data["id"], ()))
+
+        shot = version_data.get("entity")
+        if shot and shot.get("type") == "Shot":
+            cut_ids.update(cuts_by_shot.get(shot["id"], ()))
+
+        # cuts are newest first
+        found = None
+        for cut in cuts:
+            if cut['id'] in cut_ids:
+                found = cut
+                break
+
+        latest[version_data["id"]] = latest_cut_entity(found)
+
+    return latest
+
+
+class LatestCutFinder(QtCore.QObject):
+    """
+    Looks up the latest cut for a Version in the background.  Only one lookup
+    is kept running: asking about another source group stops the one in
+    flight.
+
+    prefetch() resolves a whole tray load at once, the answers come back
+    through cuts_prefetched.
+    """
+
+    # source group name, cut entity (or None if there is no cut)
+    cut_found = QtCore.Signal(str, object)
+
+    # source group name
+    cut_lookup_failed = QtCore.Signal(str)
+
+    # dict of Version id -> cut entity or None
+    cuts_prefetched = QtCore.Signal(object)
+
+    def __init__(self, engine, bg_task_manager, parent=None):
+        QtCore.QObject.__init__(self, parent)
+        self._engine = engine
+
+        self._sg_data_retriever = shotgun_data.ShotgunDataRetriever(self, bg_task_manager=bg_task_manager)
+        self._sg_data_retriever.work_completed.connect(self._on_work_completed)
+        self._sg_data_retriever.work_failure.connect(self._on_work_failure)
+        self._sg_data_retriever.start()
+
+        # uid of the find in flight, and the source group it is for
+        self._request_uid = None
+        self._request_group = None
+
+        # uid of the batch lookup in flight
+        self._prefetch_uid = None
+
+    def is_pending(self, group_name):
+        return self._request_uid is not None and self._request_group == group_name
+
+    def request(self, group_name, version_data):
+        """
+        Start looking up the latest cut for version_data on behalf of
+        group_name, unless that lookup is already running.
+        """
+        if self.is_pending(group_name):
+            return
+
+        self.cancel()
+
+        self._request_group = group_name
+        self._request_uid = self._sg_data_retriever.execute_find(
+            'Cut',
+            filters=latest_cut_filters(version_data),
+            fields=LATEST_CUT_FIELDS,
+            order=LATEST_CUT_ORDER,
+            additional_filter_presets=LATEST_CUT_PRESETS,
+        )
+
+    def prefetch(self, versions):
+        """
+        Start resolving the latest cut of every version data dict in
+        versions, replacing any prefetch still running.
+        """
+        if self._prefetch_uid is not None:
+            self._sg_data_retriever.stop_work(self._prefetch_uid)
+
+        self._prefetch_uid = self._sg_data_retriever.execute_method(find_latest_cuts, versions)
+
+    def cancel(self):
+        if self._request_uid is not None:
+            self._sg_data_retriever.stop_work(self._request_uid)
+
+        self._request_uid = None
+        self._request_group = None
+
+    def _on_work_completed(self, uid, request_type, data):
+        if uid == self._prefetch_uid:
+            self._prefetch_uid = None
+            self.cuts_prefetched.emit(data.get("return_value") or {})
+            return
+
+        if uid != self._request_uid:
+            return
+
+        group_name = self._request_group
+        self._request_uid = None
+        self._request_group = None
+
+        cuts = data.get("sg")
+        self.cut_found.emit(group_name, latest_cut_entity(cuts[0] if cuts else None))
+
+    def _on_work_failure(self, uid, msg):
+        if uid == self._prefetch_uid:
+            self._prefetch_uid = None
+            self._engine.log_error("Latest cut prefetch failed: %s" % msg)
+            return
+
+        if uid != self._request_uid:
+            return
+
+        group_name = self._request_group
+        self._request_uid = None
+        self._request_group = None
+
+        self._engine.log_error("Latest cut lookup for %s failed: %s" % (group_name, msg))
+        self.cut_lookup_failed.emit(group_name)
@@ -0,0 +1,348 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from multiprocessing.pool import ThreadPool
+
+
+# frame number tokens RV understands in sequence paths: "#", "@@@@", "%04d",
+# optionally preceded by a frame range ("1-100#").  Digits before a token
+# without a "-" are part of the name ("v002#").
+_FRAME_TOKEN = re.compile(r"(?:(-?\d+)-(-?\d+))?(#+|@+|%0?\d*d)")
+
+
+def _sequence_pattern(basename):
+    """
+    Regex matching the files of the sequence named by basename, and the
+    frame range it names if any, or (None, None) if basename is a plain file
+    name.  Only the last token counts, as for RV.
+    """
+    matches = list(_FRAME_TOKEN.finditer(basename))
+    if not matches:
+        return (None, None)
+
+    match = matches[-1]
+
+    frame_range = None
+    if match.group(1) is not None:
+        frame_range = (int(match.group(1)), int(match.group(2)))
+
+    pattern = re.compile(
+        re.escape(basename[:match.start()]) + r"(-?\d+)" + re.escape(basename[match.end():]) + "$")
+
+    return (pattern, frame_range)
+
+
+def probe_path(path):
+    """
+    Whether there is media at path, which may be a movie or a frame sequence,
+    using only os calls so it can run in a worker thread.  Paths must already
+    have RV's path swap variables undone.
+
+    A sequence with an explicit frame range ("1-100#") only counts the
+    frames inside it.
+
+    :returns: (exists, first frame, last frame), frames are None for movies.
+    """
+    (dirname, basename) = os.path.split(path)
+
+    (pattern, frame_range) = _sequence_pattern(basename)
+    if not pattern:
+        return (os.path.isfile(path), None, None)
+
+    try:
+        names = os.listdir(dirname or ".")
+    except OSError:
+        return (False, None, None)
+
+    frames = []
+    for name in names:
+        match = pattern.match(name)
+        if match:
+            frame = int(match.group(1))
+            if not frame_range or frame_range[0] <= frame <= frame_range[1]:
+                frames.append(frame)
+
+    if not frames:
+        return (False, None, None)
+
+    return (True, min(frames), max(frames))
+
+
+def choose_media_type(preferred, paths, exists, auto_streaming):
+    """
+    The media type a Version should play, as media_type_fallback of the mode
+    decides it: the preferred type if its media is there, else the other of
+    Movie and Frames, else streaming if allowed.
+
+    :param paths: media type -> local path (or url), or None.
+    :param exists: function telling whether there is media at a local path.
+    :returns: "Movie", "Frames", "Streaming" or None.
+    """
+    if preferred == "Streaming":
+        return preferred
+
+    other = "Movie" if preferred == "Frames" else "Frames"
+
+    for media_type in (preferred, other):
+        path = paths.get(media_type)
+        if path and (path.startswith('http') or exists(path)):
+            return media_type
+
+    return "Streaming" if auto_streaming else None
+
+
+def _quick_probe(path):
+    """
+    A guess at probe_path's answer costing one stat: whether the movie, or
+    the directory of the frames, is there.
+    """
+    (pattern, frame_range) = _sequence_pattern(os.path.basename(path))
+    if not pattern:
+        return os.path.isfile(path)
+
+    return os.path.isdir(os.path.dirname(path) or ".")
+
+
+def _dir_mtime(path):
+    try:
+        return os.stat(os.path.dirname(path) or ".").st_mtime
+    except OSError:
+        return None
+
+
+class MediaStatusStore(object):
+    """
+    Probe results kept on disk between RV sessions, so reopening a playlist
+    doesn't walk every frame directory again.  A result is good for as long
+    as the mtime of the directory holding the media is unchanged, since
+    adding, removing or renaming files there bumps it.
+    """
+
+    def __init__(self, db_path):
+        dirname = os.path.dirname(db_path)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+
+        self._db_path = db_path
+        self._lock = threading.Lock()
+
+        # probes run in pool threads, so all of them share one connection,
+        # opened when first needed (and again after close())
+        self._db = None
+        with self._lock:
+            self._connect()
+
+    def _connect(self):
+        if self._db is not None:
+            return self._db
+
+        self._db = sqlite3.connect(self._db_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS media_status ("
+            "path TEXT PRIMARY KEY, "
+            "present INTEGER, "
+            "first_frame INTEGER, "
+            "last_frame INTEGER, "
+            "dir_mtime REAL, "
+            "checked REAL)")
+        self._db.commit()
+
+        return self._db
+
+    def lookup(self, path, dir_mtime):
+        """
+        The stored (exists, first frame, last frame) for path, or None if we
+        have nothing stored or the directory has changed since.
+        """
+        if dir_mtime is None:
+            return None
+
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT present, first_frame, last_frame, dir_mtime FROM media_status WHERE path = ?",
+                (path,)).fetchone()
+
+        if not row or row[3] != dir_mtime:
+            return None
+
+        return (bool(row[0]), row[1], row[2])
+
+    def save(self, path, dir_mtime, result):
+        if dir_mtime is None:
+            return
+
+        with self._lock:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO media_status VALUES (?, ?, ?, ?, ?, ?)",
+                (path, int(result[0]), result[1], result[2], dir_mtime, time.time()))
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class MediaResolver(object):
+    """
+    Answers "is there media at this path" for local movie and frame paths,
+    and "which media should this Version play", caching each answer for ttl
+    seconds.  prefetch() and prefetch_choice() work them out in a thread
+    pool; exists() and choice() never wait for them.
+
+    With a MediaStatusStore, a probe first checks whether the answer from an
+    earlier session still stands, at the cost of one stat.
+    """
+
+    def __init__(self, ttl=60, threads=8, store=None):
+        self.ttl = ttl
+        self._threads = threads
+        self._pool = None
+        self._store = store
+
+        self._lock = threading.Lock()
+
+        # path -> (time probed, exists)
+        self._results = {}
+
+        # path -> AsyncResult of a probe in flight
+        self._pending = {}
+
+        # (Version id, preferred media type) -> (time chosen, media type), and
+        # the choices being worked out
+        self._choices = {}
+        self._pending_choices = {}
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = ThreadPool(self._threads)
+        return self._pool
+
+    def _cached(self, path):
+        result = self._results.get(path)
+        if result and time.time() - result[0] <= self.ttl:
+            return result[1]
+        return None
+
+    def _probe(self, path):
+        dir_mtime = _dir_mtime(path)
+
+        result = self._store.lookup(path, dir_mtime) if self._store else None
+        if result is None:
+            result = probe_path(path)
+            if self._store:
+                self._store.save(path, dir_mtime, result)
+
+        exists = result[0]
+
+        with self._lock:
+            self._results[path] = (time.time(), exists)
+            self._pending.pop(path, None)
+
+        return exists
+
+    def prefetch(self, paths):
+        """
+        Start probing, in the background, every path we don't have a fresh
+        answer for.
+        """
+        with self._lock:
+            for path in set(paths):
+                if not path or path in self._pending or self._cached(path) is not None:
+                    continue
+                self._pending[path] = self._get_pool().apply_async(self._probe, (path,))
+
+    def exists(self, path):
+        """
+        Whether there is media at path.  Without a fresh answer, this starts
+        a probe and makes do with the store's answer, or a guess from one
+        stat, rather than waiting for it.
+        """
+        with self._lock:
+            exists = self._cached(path)
+
+        if exists is not None:
+            return exists
+
+        self.prefetch([path])
+
+        result = self._store.lookup(path, _dir_mtime(path)) if self._store else None
+        if result is not None:
+            return result[0]
+
+        return _quick_probe(path)
+
+    def _exists_now(self, path):
+        exists = self._cached(path)
+        if exists is None:
+            exists = self._probe(path)
+        return exists
+
+    def _choose(self, key, preferred, paths, auto_streaming):
+        media_type = choose_media_type(preferred, paths, self._exists_now, auto_streaming)
+
+        with self._lock:
+            self._choices[key] = (time.time(), media_type)
+            self._pending_choices.pop(key, None)
+
+        return media_type
+
+    def prefetch_choice(self, version_id, preferred, paths, auto_streaming):
+        """
+        Start working out, in the background, which media the Version should
+        play given the preferred type; see choose_media_type.
+        """
+        key = (version_id, preferred)
+
+        with self._lock:
+            if key in self._pending_choices or self._fresh_choice(key):
+                return
+            self._pending_choices[key] = self._get_pool().apply_async(
+                self._choose, (key, preferred, paths, auto_streaming))
+
+    def _fresh_choice(self, key):
+        choice = self._choices.get(key)
+        return choice is not None and time.time() - choice[0] <= self.ttl
+
+    def choice(self, version_id, preferred):
+        """
+        The media type prefetch_choice settled on, if it has by now.
+
+        :returns: (known, media type)
+        """
+        key = (version_id, preferred)
+
+        with self._lock:
+            if self._fresh_choice(key):
+                return (True, self._choices[key][1])
+
+        return (False, None)
+
+    def clear(self):
+        with self._lock:
+            self._results = {}
+            self._choices = {}
+
+    def shutdown(self):
+        """
+        Forget every answer, stop the probe threads and close the store.
+        Anything asked later starts them again.
+        """
+        with self._lock:
+            pool = self._pool
+            self._pool = None
+            self._results = {}
+            self._pending = {}
+            self._choices = {}
+            self._pending_choices = {}
+
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+        if self._store:
+            self._store.close()
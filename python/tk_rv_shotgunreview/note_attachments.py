@@ -0,0 +1,60 @@
+import os
+import shutil
+
+import tank
+from tank.platform.qt import QtCore
+
+shotgun_data = tank.platform.import_framework("tk-framework-shotgunutils", "shotgun_data")
+
+
+def upload_note_attachments(sg, note_id, paths):
+    """
+    Attach the files at paths to the Note.  Runs in a background thread.
+    """
+    for path in paths:
+        sg.upload("Note", note_id, path)
+
+    return len(paths)
+
+
+class NoteAttachmentUploader(QtCore.QObject):
+    """
+    Uploads files to Notes that already exist, for attachments that were
+    not ready when the note was submitted.  The files are removed, along
+    with the directory holding them, once the upload is over either way.
+    """
+
+    # note id, whatever was passed to upload() as data, error message ("" if
+    # the upload succeeded)
+    finished = QtCore.Signal(int, object, str)
+
+    def __init__(self, bg_task_manager, parent=None):
+        QtCore.QObject.__init__(self, parent)
+
+        self._sg_data_retriever = shotgun_data.ShotgunDataRetriever(self, bg_task_manager=bg_task_manager)
+        self._sg_data_retriever.work_completed.connect(self._on_work_completed)
+        self._sg_data_retriever.work_failure.connect(self._on_work_failure)
+        self._sg_data_retriever.start()
+
+        # uid -> (note id, paths, data)
+        self._uploads = {}
+
+    def upload(self, note_id, paths, data=None):
+        uid = self._sg_data_retriever.execute_method(upload_note_attachments, note_id, paths)
+        self._uploads[uid] = (note_id, paths, data)
+
+    def _on_work_completed(self, uid, request_type, result):
+        self._done(uid, "")
+
+    def _on_work_failure(self, uid, msg):
+        self._done(uid, msg or "upload failed")
+
+    def _done(self, uid, error):
+        if uid not in self._uploads:
+            return
+
+        (note_id, paths, data) = self._uploads.pop(uid)
+        for d in set(os.path.dirname(p) for p in paths):
+            shutil.rmtree(d, ignore_errors=True)
+
+        self.finished.emit(note_id, data, error)
@@ -6,12 +6,16 @@ from tank.platform.qt import QtCore, QtGui
 
 task_manager = tank.platform.import_framework("tk-framework-shotgunutils", "task_manager")
 shotgun_model = tank.platform.import_framework("tk-framework-shotgunutils", "shotgun_model")
+shotgun_data = tank.platform.import_framework("tk-framework-shotgunutils", "shotgun_data")
 
 from .filter_steps_model import FilterStepsModel
 from .rel_cuts_model import RelCutsModel
 from .rel_shots_model import RelShotsModel
 from .filtered_versions_model import FilteredVersionsModel
 from .steps_sort_filter import StepsSortFilter
+from .compare_candidates import (
+    CompareCandidateCache, compare_key, find_compare_candidates, COMPARE_FIELDS, OLD_STC_STATUSES
+)
 
 import rv.extra_commands as rve
 
@@ -104,14 +108,133 @@ class PopupUtils(QtCore.QObject):
 
         self._filtered_versions_model.data_refreshed.connect(self.filter_tray)
 
+        # compare hotkey lookups run in the background; only the newest
+        # request is kept.
+        self._compare_retriever = shotgun_data.ShotgunDataRetriever(self, bg_task_manager=self._rv_mode._app.engine.bg_task_manager)
+        self._compare_retriever.work_completed.connect(self.on_compare_work_completed)
+        self._compare_retriever.work_failure.connect(self.on_compare_work_failure)
+        self._compare_retriever.start()
+        self._compare_uid = None
+        self._compare_version_id = None
+
+        # compare candidates for the clips in the tray, fetched on load
+        self._compare_cache = CompareCandidateCache(self._rv_mode._prefs.compare_cache_ttl)
+        self._compare_prefetch_uid = None
+        self._compare_prefetch_keys = []
+
     # related cuts menu menthods
 
     # def mark_pipeline_selections(self):
     #     self._preset_pipeline = True
     #     self.check_pipeline_menu()
 
+    def request_versions_for_compare(self, version, step, layer=None,
+                                     greatest=None, stc=False,
+                                     fallback_step=None, fallback_layer=None):
+        """Look up a version to compare the given version with in the
+        background, then compare it with the current view.  A newer request
+        replaces any that is still running.
+
+        Arguments are as for retrieve_versions_for_compare; the fallback step
+        and layer are tried if nothing is found for step and layer.
+        """
+        if self._compare_uid is not None:
+            self._compare_retriever.stop_work(self._compare_uid)
+            self._compare_uid = None
+
+        # usually the prefetched candidates already have the answer
+        versions = self._compare_cache.lookup(version, step, layer, greatest, stc)
+        if versions == [] and fallback_step and fallback_layer:
+            self._engine.log_debug('Attempting step fallback.')
+            versions = self._compare_cache.lookup(version, fallback_step, fallback_layer, greatest, stc)
+
+        if versions is not None:
+            if versions:
+                self._rv_mode._compare_with_current(versions)
+            else:
+                rve.displayFeedback2("No versions found to compare.", 2.0)
+            return
+
+        self._compare_version_id = version.get('id')
+        self._compare_uid = self._compare_retriever.execute_method(
+            self._find_versions_for_compare, version, step, layer, greatest,
+            stc, fallback_step, fallback_layer)
+
+        rve.displayFeedback2("Looking for %s to compare ..." % step, 60.0)
+
+    def _find_versions_for_compare(self, sg, version, step, layer, greatest,
+                                   stc, fallback_step, fallback_layer):
+        # runs in a background thread, with that thread's connection
+        versions = self.retrieve_versions_for_compare(version, step,
+                layer=layer, greatest=greatest, stc=stc, sg=sg)
+
+        if versions or not fallback_step or not fallback_layer:
+            return versions
+
+        self._engine.log_debug('Attempting step fallback.')
+        return self.retrieve_versions_for_compare(version, fallback_step,
+                layer=fallback_layer, greatest=greatest, stc=stc, sg=sg)
+
+    def prefetch_compare_candidates(self, versions, steps):
+        """
+        Fetch, in the background, the compare candidates of every given
+        version for each of the given steps.  This replaces whatever was
+        cached or still being fetched for an earlier load.
+        """
+        if self._compare_prefetch_uid is not None:
+            self._compare_retriever.stop_work(self._compare_prefetch_uid)
+            self._compare_prefetch_uid = None
+
+        self._engine.log_debug("compare candidate cache: %r" % self._compare_cache.stats())
+        self._compare_cache.clear()
+
+        keys = set(compare_key(v) for v in versions)
+        keys.discard(None)
+
+        if not keys or not steps:
+            return
+
+        self._compare_prefetch_keys = sorted(keys)
+        self._compare_prefetch_uid = self._compare_retriever.execute_method(
+            find_compare_candidates, self._project_entity, self._compare_prefetch_keys, sorted(steps))
+
+    def on_compare_work_completed(self, uid, request_type, data):
+        if uid == self._compare_prefetch_uid:
+            self._compare_prefetch_uid = None
+            self._compare_cache.store(self._compare_prefetch_keys, data.get("return_value") or {})
+            return
+
+        if uid != self._compare_uid:
+            return
+        self._compare_uid = None
+
+        versions = data.get("return_value")
+        if not versions:
+            rve.displayFeedback2("No versions found to compare.", 2.0)
+            return
+
+        rve.displayFeedback2("", 0.1)
+
+        # skip it if the user has moved on to another version meanwhile
+        current = self._rv_mode.version_data_from_source()
+        if current and current.get('id') == self._compare_version_id:
+            self._rv_mode._compare_with_current(versions)
+
+    def on_compare_work_failure(self, uid, msg):
+        if uid == self._compare_prefetch_uid:
+            self._compare_prefetch_uid = None
+            self._engine.log_error("Compare candidate prefetch failed: %s" % msg)
+            return
+
+        if uid != self._compare_uid:
+            return
+        self._compare_uid = None
+
+        self._engine.log_error("Compare lookup failed: %s" % msg)
+        rve.displayFeedback2("Compare lookup failed.", 2.0)
+
     def retrieve_versions_for_compare(self, version, step, layer=None,
-                                      greatest=None, stc=False):
+                                      greatest=None, stc=False, sg=None):
         """Given a particular input version, find another version to compare
         that version with.
 
@@ -120,6 +243,7 @@ class PopupUtils(QtCore.QObject):
         :param layer str: Layer to use when searching for comparison versions.
         :param greatest bool: Whether comparison versions must be greatest.
         :param stc bool: Whether comparison versions must have been sent to client.
+        :param sg: Shotgun connection to use, defaults to the afpipe one.
 
         :returns [version]: Version entity to compare the input version to.
             (within a list, to pass to rv_activity_mode._compare_with_current)
@@ -139,28 +263,17 @@ class PopupUtils(QtCore.QObject):
             filters.append(['sg_greatest', 'is', True])
 
         if stc:
-            # statuses which are under a version's 'sg_status_list' field
-            # (legacy support for old version statuses); new style version
-            # status stores 'stc' in the sg_delivery_status field on the Version
-            old_stc_statuses = ["stc", "apr", "fin", "fp2k"]
-
+            # see OLD_STC_STATUSES for the legacy status_list statuses
             stc_filter = {'filter_operator': 'any',
                           'filters': [['sg_delivery_status', 'is', 'stc'],
                                       {'filter_operator': 'all',
                                        'filters': [['sg_delivery_status', 'is', None],
-                                                   ['sg_status_list', 'in', old_stc_statuses]]}]
+                                                   ['sg_status_list', 'in', OLD_STC_STATUSES]]}]
                          }
 
             filters.append(stc_filter)
 
-        fields = ['sg_uploaded_movie_frame_rate',
-                  'sg_first_frame',
-                  'sg_movie_has_slate',
-                  'sg_path_to_movie',
-                  'sg_path_to_frames'
-                  'entity']
-
-        compare_version = SG.find_one('Version', filters, fields,
+        compare_version = (sg or SG).find_one('Version', filters, COMPARE_FIELDS,
             order=[{'field_name': 'created_at', 'direction':'desc'}])
 
         # avoid returning [None] when compare_version is None, because
@@ -876,7 +989,7 @@ class PopupUtils(QtCore.QObject):
                 self._tray_frame.tray_model.setData(index, None, self._FILTER_THUMBNAIL)
 
             if orig_tn:
-                thumb = QtGui.QIcon(orig_tn)
+                thumb = self._rv_mode.thumbnail_cache.icon(orig_tn)
                 self._tray_frame.tray_model.setData(index, thumb, self._CUT_THUMB_ROLE)
 
                 item = self._tray_frame.tray_model.itemFromIndex(index)
@@ -1,13 +1,13 @@
+import bisect
 import copy
 import types
 import os
-import shutil
 import math
 import rv
 import pymu
-import subprocess
 import tank
 import tempfile
+import shutil
 import json
 import urllib
 import time
@@ -25,6 +25,14 @@ version_details = tank.platform.import_framework("tk-framework-qtwidgets", "vers
 
 from .tray_delegate import RvTrayDelegate
 from .popup_utils import PopupUtils
+from .latest_cuts import LatestCutFinder
+from .thumbnail_cache import ThumbnailCache
+from .media_resolver import MediaResolver, MediaStatusStore
+from .stream_cache import StreamCache
+from .rvio_export import AnnotationExporter
+from .note_attachments import NoteAttachmentUploader
+from .export_session import minimal_session
+from .edl_builder import build_edl, data_from_version, required_version_fields
 from .ui import resources_rc
 
 import sgtk
@@ -55,6 +63,24 @@ class Preferences:
         self.auto_streaming         = rvc.readSettings(g, "auto_streaming",         True)
         self.mini_left_count        = rvc.readSettings(g, "mini_left_count",        2)
         self.mini_right_count       = rvc.readSettings(g, "mini_right_count",       2)
+        self.thumbnail_cache_mb     = rvc.readSettings(g, "thumbnail_cache_mb",     64)
+        self.compare_cache_ttl      = rvc.readSettings(g, "compare_cache_ttl",      300)
+        self.version_search_delay   = rvc.readSettings(g, "version_search_delay",   500)
+        self.media_check_ttl        = rvc.readSettings(g, "media_check_ttl",        60)
+        self.media_check_threads    = rvc.readSettings(g, "media_check_threads",    8)
+
+        # streamed clips coming up after the playhead are downloaded ahead of
+        # time into a local cache of this many MB
+        self.stream_prefetch_clips  = rvc.readSettings(g, "stream_prefetch_clips",  3)
+        self.stream_cache_mb        = rvc.readSettings(g, "stream_cache_mb",        2048)
+        self.annotation_export_workers = rvc.readSettings(g, "annotation_export_workers", 4)
+
+        # entire-cut only makes sources for the clips near the playhead, the
+        # rest are made while RV is idle
+        self.windowed_entire_cut    = rvc.readSettings(g, "windowed_entire_cut",    False)
+        self.entire_cut_behind      = rvc.readSettings(g, "entire_cut_behind",      2)
+        self.entire_cut_ahead       = rvc.readSettings(g, "entire_cut_ahead",       8)
+        self.entire_cut_idle_msec   = rvc.readSettings(g, "entire_cut_idle_msec",   250)
 
         # pipeline filter is odd because a valid input into the query preset is [] meaning 'latest in pipeline'
         # so it has 3 states. a list with stuff, an empty list (latest in pipe) and None.
@@ -89,6 +115,18 @@ class Preferences:
         rvc.writeSettings(g, "auto_streaming",         self.auto_streaming)
         rvc.writeSettings(g, "mini_left_count",        self.mini_left_count)
         rvc.writeSettings(g, "mini_right_count",       self.mini_right_count)
+        rvc.writeSettings(g, "thumbnail_cache_mb",     self.thumbnail_cache_mb)
+        rvc.writeSettings(g, "compare_cache_ttl",      self.compare_cache_ttl)
+        rvc.writeSettings(g, "version_search_delay",   self.version_search_delay)
+        rvc.writeSettings(g, "media_check_ttl",        self.media_check_ttl)
+        rvc.writeSettings(g, "media_check_threads",    self.media_check_threads)
+        rvc.writeSettings(g, "stream_prefetch_clips",  self.stream_prefetch_clips)
+        rvc.writeSettings(g, "stream_cache_mb",        self.stream_cache_mb)
+        rvc.writeSettings(g, "annotation_export_workers", self.annotation_export_workers)
+        rvc.writeSettings(g, "windowed_entire_cut",    self.windowed_entire_cut)
+        rvc.writeSettings(g, "entire_cut_behind",      self.entire_cut_behind)
+        rvc.writeSettings(g, "entire_cut_ahead",       self.entire_cut_ahead)
+        rvc.writeSettings(g, "entire_cut_idle_msec",   self.entire_cut_idle_msec)
 
         rvc.writeSettings(g, "pipeline_filter",        json.dumps(self.pipeline_filter))
         rvc.writeSettings(g, "status_filter",          json.dumps(self.status_filter))
@@ -140,21 +178,347 @@ class MiniCutData:
 
         return MiniCutData(active, focus_clip, first_clip, last_clip)
 
-required_version_fields = [
-    "code",
-    "id",
-    "entity",
-    "project",
-    "sg_first_frame",
-    "sg_last_frame",
-    "sg_frames_aspect_ratio",
-    "sg_frames_have_slate",
-    "sg_movie_aspect_ratio",
-    "sg_movie_has_slate",
-    "sg_path_to_frames",
-    "sg_path_to_movie",
-    "sg_status_list",
-    "sg_uploaded_movie_frame_rate"
+class SourceGroupRegistry:
+    """
+    Map of Version ID to the RVSourceGroups holding that Version's media, so
+    that finding the source for a Version does not mean walking every source
+    in the session and reading its properties.  Entries are added as we make
+    sources, dropped as nodes are deleted, and the whole map is rebuilt from
+    the graph after a session is read.
+    """
+    def __init__(self):
+        # Version ID -> source groups, oldest first
+        self._groups = {}
+
+    def register(self, version_id, source_group):
+        if version_id is None or not source_group:
+            return
+
+        groups = self._groups.setdefault(version_id, [])
+        if source_group not in groups:
+            groups.append(source_group)
+
+    def remove(self, source_group):
+        for (version_id, groups) in self._groups.items():
+            if source_group in groups:
+                groups.remove(source_group)
+                if not groups:
+                    del self._groups[version_id]
+
+    def lookup(self, version_id):
+        groups = self._groups.get(version_id)
+        if not groups:
+            return None
+
+        # Nodes may have been deleted (or the session cleared) behind our
+        # back, in which case forget about them and try the next group
+        # holding this Version.
+        while groups:
+            source_group = groups[0]
+            if (rvc.nodeExists(source_group) and
+                    getIntProp(source_group + ".sg_review.version_id", -1) == version_id):
+                return source_group
+            groups.pop(0)
+
+        del self._groups[version_id]
+        return None
+
+    def lookup_all(self, version_id):
+        """
+        Every source group holding the Version, forgetting those that have
+        gone from the graph or now hold something else.
+        """
+        groups = [g for g in self._groups.get(version_id, []) if rvc.nodeExists(g) and
+                getIntProp(g + ".sg_review.version_id", -1) == version_id]
+
+        if groups:
+            self._groups[version_id] = groups
+        else:
+            self._groups.pop(version_id, None)
+
+        return list(groups)
+
+    def clear(self):
+        self._groups = {}
+
+    def rebuild(self):
+        self.clear()
+        for s in rvc.nodesOfType("RVSourceGroup"):
+            version_id = getIntProp(s + ".sg_review.version_id", -1)
+            # in graph order, so lookup finds the source the old linear
+            # search did
+            if version_id != -1:
+                self.register(version_id, s)
+
+    def check_consistency(self):
+        """
+        Compare the registry against the sources actually in the graph and
+        return a list of strings describing any disagreement.
+        """
+        problems = []
+        in_graph = {}
+        for s in rvc.nodesOfType("RVSourceGroup"):
+            version_id = getIntProp(s + ".sg_review.version_id", -1)
+            if version_id != -1:
+                in_graph.setdefault(version_id, []).append(s)
+
+        for (version_id, groups) in in_graph.items():
+            registered = self._groups.get(version_id, [])
+            missing = [g for g in groups if g not in registered]
+            if missing:
+                problems.append("Version %d in %r is not registered" % (version_id, missing))
+
+        for (version_id, registered) in self._groups.items():
+            stale = [g for g in registered if g not in in_graph.get(version_id, [])]
+            if stale:
+                problems.append("Version %d registered as %r which is not in graph" % (version_id, stale))
+
+        return problems
+
+class EdlFrameCache:
+    """
+    Copy of the ".edl.frame" table of the sequence nodes we look at, so that
+    finding the clip under the playhead doesn't re-read (and linearly scan)
+    the property on every frame.  Whoever writes edl.* properties must call
+    invalidate(); "version" goes up each time, so callers holding on to
+    something derived from the table can tell when it has gone stale.
+    """
+    def __init__(self):
+        self.version = 0
+        self._frames = {}
+        self._seq_nodes = {}
+
+    def invalidate(self):
+        self.version += 1
+        self._frames = {}
+
+    def clear(self):
+        self.invalidate()
+        self._seq_nodes = {}
+
+    def seq_node(self, seq_group):
+        # group membership never changes, so remember it
+        if seq_group not in self._seq_nodes:
+            self._seq_nodes[seq_group] = groupMemberOfType(seq_group, "RVSequence")
+        return self._seq_nodes[seq_group]
+
+    def frames(self, seq_node):
+        frames = self._frames.get(seq_node)
+        if frames is None:
+            frames = getIntProp(seq_node + ".edl.frame", [])
+            self._frames[seq_node] = frames
+        return frames
+
+    @staticmethod
+    def clip_index_and_offset(frames, frame):
+        """
+        Index of the clip containing the given frame, and the offset of the
+        frame from the start of that clip.  Past the end of the EDL the last
+        entry is returned with offset 0, before the start -1 is returned.
+        """
+        pos = bisect.bisect_right(frames, frame)
+        index = pos - 1
+        offset = 0
+        if pos < len(frames):
+            offset = frame - (frames[index] if index >= 0 else 0)
+        return (index, offset)
+
+class SessionState:
+    """
+    In-memory mirror of the JSON-encoded "sg_review" properties we keep on
+    nodes (version_data, pinned, edit_data, sequence_data,
+    latest_cut_entity, proxy_data).  Each property is decoded the first time it is asked
+    for and kept, keyed by node; set() writes through to the property so
+    saved sessions carry the data.  Callers must not modify the objects get()
+    returns.
+
+    Anyone may change the properties behind our back, so graphStateChange
+    invalidates an entry whenever its property changes, and a deleted node
+    drops all of its entries.  An invalidated entry is only decoded again if
+    the property text really differs, so our own writes coming back as
+    graph-state-change events cost one property read.  The mirror is dropped
+    when a session is read.
+    """
+    # properties holding one JSON string per element, not a single string
+    list_fields = ("edit_data",)
+
+    def __init__(self, engine):
+        self._engine = engine
+
+        # node -> field -> [property text, decoded value, still valid]
+        self._values = {}
+
+    def get(self, node, field, default=None):
+        node_values = self._values.setdefault(node, {})
+        entry = node_values.get(field)
+
+        if entry is None or not entry[2]:
+            raw = self._read_raw(node, field)
+            if entry is None or raw != entry[0]:
+                entry = [raw, self._decode(node, field, raw), True]
+                node_values[field] = entry
+            else:
+                entry[2] = True
+
+        value = entry[1]
+        return default if value is None else value
+
+    def set(self, node, field, value):
+        prop = "%s.sg_review.%s" % (node, field)
+        if field in self.list_fields:
+            raw = [json.dumps(v) for v in value]
+        else:
+            raw = json.dumps(value)
+
+        setProp(prop, raw)
+
+        self._values.setdefault(node, {})[field] = [raw, value, True]
+
+    def invalidate(self, node, field=None):
+        node_values = self._values.get(node)
+        if not node_values:
+            return
+
+        if field is None:
+            del self._values[node]
+        elif field in node_values:
+            node_values[field][2] = False
+
+    def clear(self):
+        self._values = {}
+
+    def _read_raw(self, node, field):
+        prop = "%s.sg_review.%s" % (node, field)
+        if field in self.list_fields:
+            return getStringProp(prop, [])
+        return getStringProp(prop, None)
+
+    def _decode(self, node, field, raw):
+        try:
+            if field in self.list_fields:
+                return [json.loads(x) for x in raw] if raw else None
+
+            return json.loads(raw) if raw else None
+
+        except Exception as e:
+            self._engine.log_error("SessionState reading '%s.sg_review.%s': %r" % (node, field, e))
+
+        return None
+
+class StrokeLedger:
+    """
+    Which stroke commands of each paint node have been submitted, and with
+    which Note.  Kept in one string property per paint node
+    ("sg_review.submitted_strokes", entries "<command> <note id>") so saved
+    sessions remember, and mirrored in memory so checking a stroke is a
+    dict lookup.  Strokes are only marked once their note exists and holds
+    the frames they were rendered to.
+
+    Sessions from before the ledger marked each stroke with its own
+    "<command>.sgtk_stored" property; those are folded into the ledger the
+    first time a paint node is read.
+    """
+    def __init__(self):
+        # paint node -> {command: note id}
+        self._submitted = {}
+
+    def submitted(self, paint_node):
+        if paint_node not in self._submitted:
+            self._submitted[paint_node] = self._read(paint_node)
+        return self._submitted[paint_node]
+
+    def mark(self, paint_node, cmds, note_id):
+        submitted = dict(self.submitted(paint_node))
+        for cmd in cmds:
+            submitted[cmd] = note_id
+
+        self._write(paint_node, submitted)
+
+    def invalidate(self, node):
+        self._submitted.pop(node, None)
+
+    def clear(self):
+        self._submitted = {}
+
+    def _write(self, paint_node, submitted):
+        entries = ["%s %d" % (cmd, note_id) for (cmd, note_id) in sorted(submitted.items())]
+        if entries:
+            setProp(paint_node + ".sg_review.submitted_strokes", entries)
+        self._submitted[paint_node] = submitted
+
+    def _read(self, paint_node):
+        submitted = {}
+
+        entries = getStringProp(paint_node + ".sg_review.submitted_strokes", [])
+        if entries:
+            for entry in entries:
+                (cmd, note_id) = entry.rsplit(" ", 1)
+                submitted[cmd] = int(note_id)
+            return submitted
+
+        # legacy per-stroke markers
+        prefix = paint_node + "."
+        suffix = ".sgtk_stored"
+        for prop in rvc.properties(paint_node):
+            if prop.startswith(prefix) and prop.endswith(suffix):
+                submitted[prop[len(prefix):-len(suffix)]] = getIntProp(prop, 0)
+
+        if submitted:
+            self._write(paint_node, submitted)
+
+        return submitted
+
+class UnstoredStrokes:
+    """
+    The stroke commands on each paint node's frames that have not been
+    submitted with a note yet.  A frame's commands are read from the graph
+    the first time it is asked about, and kept until the paint node is
+    invalidated, which graphStateChange does for any property change on it.
+    """
+    def __init__(self, ledger):
+        self.ledger = ledger
+
+        # paint node -> {source frame: [unstored commands]}
+        self._strokes = {}
+
+        # source group -> its paint node
+        self._paint_nodes = {}
+
+    def paint_node(self, source_group):
+        if source_group not in self._paint_nodes:
+            self._paint_nodes[source_group] = groupMemberOfType(source_group, "RVPaint")
+        return self._paint_nodes[source_group]
+
+    def unstored(self, paint_node, source_frame):
+        frames = self._strokes.setdefault(paint_node, {})
+        if source_frame not in frames:
+            frames[source_frame] = self._read(paint_node, source_frame)
+        return frames[source_frame]
+
+    def invalidate(self, node):
+        self._strokes.pop(node, None)
+        self.ledger.invalidate(node)
+
+    def clear(self):
+        self._strokes = {}
+        self._paint_nodes = {}
+        self.ledger.clear()
+
+    def _read(self, paint_node, source_frame):
+        cmds = getStringProp(paint_node + ".frame:%d.order" % source_frame, [])
+        submitted = self.ledger.submitted(paint_node)
+        return [c for c in cmds if c not in submitted]
+
+# node types that can be viewed, and so may need dropping from an export
+# session
+view_group_types = [
+    "RVSourceGroup",
+    "RVSequenceGroup",
+    "RVStackGroup",
+    "RVLayoutGroup",
+    "RVSwitchGroup",
+    "RVFolderGroup",
+    "RVRetimeGroup",
     ]
 
 def setProp(prop, value):
@@ -196,6 +560,23 @@ def getIntProp(prop, default):
                 val = vals[0]
     return val
 
+def getFloatProp(prop, default):
+    '''
+    Convenience function to get the value of a Float proprty, returning the
+    given default value if the property does not exist or has no contents.  If
+    the given default value is scalar only the first value of the properties
+    content array is returned.
+    '''
+    val = default
+    if rvc.propertyExists(prop):
+        vals = rvc.getFloatProperty(prop)
+        if vals and len(vals):
+            if type(default) == list:
+                val = vals
+            else:
+                val = vals[0]
+    return val
+
 def getStringProp(prop, default):
     '''
     Convenience function to get the value of an String proprty, returning the
@@ -263,12 +644,7 @@ class RvActivityMode(rvt.MinorMode):
                 if (id in self.proxy_sources):
                     return self.proxy_sources[id]
 
-            version_data_str = getStringProp(group_name + ".sg_review.version_data", None)
-            if version_data_str:
-                try:
-                    return json.loads(version_data_str)
-                except Exception as e:
-                    self._app.engine.log_error("version_data_from_source: %r" % e)
+            return self.session_state.get(group_name, "version_data")
 
         return None
 
@@ -327,19 +703,100 @@ class RvActivityMode(rvt.MinorMode):
         event.reject()
         self._readingSession = True
 
+    def beforeSessionWrite (self, event):
+        event.reject()
+
+        # Placeholders only stand in while we are running; give windowed
+        # entire-cuts all their real sources and drop the placeholders, so
+        # they never end up in a saved session.
+        self.drop_placeholders()
+
+        # Proxy names are just Version ids; keep the version_data of those
+        # still in each sequence, so they can be made real after a read.
+        for seq_node in rvc.nodesOfType("RVSequence"):
+            if not rvc.propertyExists(seq_node + ".shadow_edl.inputs"):
+                continue
+
+            proxy_data = {}
+            for name in getStringProp(seq_node + ".shadow_edl.inputs", []):
+                if self.is_proxy_source(name) and int(name) in self.proxy_sources:
+                    proxy_data[name] = self.proxy_sources[int(name)]
+
+            if proxy_data or rvc.propertyExists(seq_node + ".sg_review.proxy_data"):
+                self.session_state.set(seq_node, "proxy_data", proxy_data)
+
     def afterSessionRead (self, event):
         event.reject()
         self._readingSession = False
 
+        self.edl_cache.clear()
+        self.session_state.clear()
+        self.latest_cuts_by_version = {}
+        self.media_resolver.clear()
+        self.unstored_strokes.clear()
+        self.invalidate_pinned_rows()
+
+        # proxies of the session we just read come back with it; saved
+        # sessions have no placeholders
+        self.proxy_sources = {}
+        self._windowed_sequences = set()
+        self._window_clip = None
+        self._placeholders = {}
+        self.restore_proxy_sources()
+
+        self.cancel_media_swap()
+        self._stream_prefetch_clip = None
+        self.pending_stream_rewrites = {}
+
+        # sources in the session we just read may have Shotgun data
+        self.source_registry.rebuild()
+        self.check_source_registry()
+
+        # and may play cached streams that have since been evicted
+        if self.stream_cache:
+            self.revert_cached_streams(lambda media: not os.path.exists(media))
+
+    def sourceGroupComplete(self, event):
+        event.reject()
+
+        # Pick up sources made by someone other than us (session merges, other
+        # modes) that still carry Shotgun data.  Our own sources are
+        # registered when we set their version_id.
+        source_group = event.contents().split(";;")[0]
+
+        # the name may be that of a node deleted earlier
+        self.session_state.invalidate(source_group)
+
+        version_id = getIntProp(source_group + ".sg_review.version_id", -1)
+        if version_id != -1:
+            self.source_registry.register(version_id, source_group)
+
+    def beforeGraphDelete(self, event):
+        event.reject()
+
+        node = event.contents()
+        self.source_registry.remove(node)
+        self.session_state.invalidate(node)
+
     def inputsChanged(self, event):
         event.reject()
         self.set_details_dirty()
 
     def viewChange(self, event):
         event.reject()
+        self._current_clip = None
+        self.invalidate_pinned_rows()
         self.configure_visibility()
         self.set_details_dirty()
 
+        # go on making real sources for an entire-cut we come back to
+        if (rvc.viewNode() in self._windowed_sequences and self.deproxy_timer and
+                self._prefs.entire_cut_idle_msec > 0):
+            self.deproxy_timer.start()
+
+        # and swap the media of a "Swap Media - All Clips" now in view
+        self.apply_deferred_media_swaps()
+
         if not self._prefs.auto_play:
             if self.target_entity and self.target_entity['type'] != "Cut":
                 self.update_cuts_with()
@@ -350,7 +807,28 @@ class RvActivityMode(rvt.MinorMode):
         try:
             self.set_details_dirty()
 
-            if not self.tray_dock.isVisible():
+            tray_visible = self.tray_dock.isVisible()
+
+            # While the playhead stays inside the clip we handled last time
+            # (and the EDL hasn't changed under us, nor the tray been shown)
+            # everything below is already up to date, so there is nothing
+            # more to do.
+            clip = self._current_clip
+            if (event and clip and clip[0] == self.edl_cache.version and
+                    clip[1] <= rvc.frame() < clip[2] and clip[3] == tray_visible):
+                self.frame_change_stats["fast"] += 1
+                return
+
+            self.frame_change_stats["slow"] += 1
+            bounds = self.current_clip_bounds()
+            self._current_clip = bounds + (tray_visible,) if bounds else None
+
+            # make sure the clips around the playhead have real sources
+            self.update_entire_cut_window()
+            self.apply_deferred_media_swaps()
+            self.prefetch_streams()
+
+            if not tray_visible:
                 return
 
             idx = self.clip_index_from_frame()
@@ -376,6 +854,23 @@ class RvActivityMode(rvt.MinorMode):
 
     def graphStateChange(self, event):
         event.reject()
+
+        # someone other than us may have edited a sequence
+        contents = event.contents()
+        if ".edl." in contents:
+            self.edl_cache.invalidate()
+
+        if ".shadow_edl." in contents or ".sg_review.pinned" in contents:
+            self.invalidate_pinned_rows()
+
+        # keep the decoded sg_review data in step with the property
+        if ".sg_review." in contents:
+            (node, field) = contents.split(".sg_review.", 1)
+            self.session_state.invalidate(node, field)
+
+        # new strokes, or strokes marked stored
+        self.unstored_strokes.invalidate(contents.split(".", 1)[0])
+
         self.set_details_dirty()
 
     def on_play_state_change(self, event):
@@ -389,6 +884,15 @@ class RvActivityMode(rvt.MinorMode):
 
         event.reject()
         cont = event.contents()
+
+        # no version search queries while playing
+        if self.tray_vers_search and cont != "buffering" and cont != "turn-around":
+            self.tray_vers_search.set_loading_paused(event.name() == "play-start")
+
+        # streams that were cached while we played
+        if event.name() == "play-stop" and cont != "buffering" and cont != "turn-around":
+            self.apply_pending_stream_rewrites()
+
         if self.details_panel and cont != "buffering" and cont != "turn-around":
             # We only auto-pin the details if they are not already pinned
             if   (  event.name() == "play-start" and
@@ -402,10 +906,16 @@ class RvActivityMode(rvt.MinorMode):
                 # playback.
                 if self.target_entity and self.target_entity.get("type") != "Cut":
                     self.enable_cuts_action(False, 'Stop to enable.')
+                    self.latest_cut_finder.cancel()
 
             # We only auto-unpin the details on stop if we auto-pinned them in
             # the first place.
             elif event.name() == "play-stop":
+                stats = self.frame_change_stats
+                self._app.engine.log_debug("frameChanged during playback: %d fast path, %d slow path" %
+                        (stats["fast"], stats["slow"]))
+                self.frame_change_stats = {"fast": 0, "slow": 0}
+
                 if self.details_pinned_for_playback:
                     self.details_panel.set_pinned(False)
                     self.details_pinned_for_playback = False
@@ -437,39 +947,59 @@ class RvActivityMode(rvt.MinorMode):
                     self.enable_cuts_action(True, 'Review this version in the latest cut')
                 else:
                     self.enable_cuts_action(False, 'No cut for this version')
+            elif version_data['id'] in self.latest_cuts_by_version:
+                # answered by the prefetch for this tray load
+                self.set_cuts_with(self.latest_cuts_by_version[version_data['id']])
+                self.update_cuts_with()
             else:
-                # we need the shot and the project
-                shot_entity = None
-                if version_data.get("entity") and version_data.get("entity").get("type") == "Shot":
-                    shot_entity = version_data.get("entity")
+                # ask shotgun in the background, on_latest_cut_found will
+                # store the answer and update the clapper.
+                self.enable_cuts_action(False, 'Looking for the latest cut...')
+                self.latest_cut_finder.request(self.current_source(), version_data)
 
-                project_entity = version_data.get("project")
+    def on_latest_cut_found(self, group_name, cut_entity):
+        if not rvc.nodeExists(group_name):
+            return
 
-                latest_cut_entity = self.find_latest_cut_for_version(shot_entity, version_data, project_entity)
+        self.set_cuts_with(cut_entity, group_name)
 
-                self.set_cuts_with(latest_cut_entity)
+        # the playhead may have moved on while we were waiting
+        if group_name == self.current_source() and not rvc.isPlaying():
+            self.update_cuts_with()
 
-                if latest_cut_entity:
-                    self.enable_cuts_action(True, 'Review this version in the latest cut')
-                else:
-                    self.enable_cuts_action(False, 'No cut for this version')
+    def on_latest_cuts_prefetched(self, latest_cuts):
+        self.latest_cuts_by_version.update(latest_cuts)
+
+        # sources that already exist get their answer now, proxies pick it up
+        # from latest_cuts_by_version when they are first stopped on.
+        for (version_id, cut_entity) in latest_cuts.items():
+            group_name = self.source_registry.lookup(version_id)
+            if group_name and self.get_cuts_with_group(group_name) is None:
+                self.set_cuts_with(cut_entity, group_name)
+
+        if (self.target_entity and self.target_entity.get("type") != "Cut" and
+                not rvc.isPlaying()):
+            self.update_cuts_with()
+
+    def on_latest_cut_lookup_failed(self, group_name):
+        if group_name == self.current_source() and not rvc.isPlaying():
+            self.enable_cuts_action(False, 'Could not look up the latest cut')
 
     def get_cuts_with(self):
         group_name = self.current_source()
         if group_name:
-            cut_str = getStringProp(group_name + ".sg_review.latest_cut_entity", None)
-            if cut_str:
-                try:
-                    return json.loads(cut_str)
-                except Exception as e:
-                    self._app.engine.log_error("get_cuts_with: %r" % e)
+            return self.get_cuts_with_group(group_name)
         return None
 
-    def set_cuts_with(self, cut_entity):
+    def get_cuts_with_group(self, group_name):
+        return self.session_state.get(group_name, "latest_cut_entity")
+
+    def set_cuts_with(self, cut_entity, group_name=None):
         if not cut_entity:
             cut_entity = {}
-        group_name = self.current_source()
-        setProp(group_name + ".sg_review.latest_cut_entity", json.dumps(cut_entity))
+        if not group_name:
+            group_name = self.current_source()
+        self.session_state.set(group_name, "latest_cut_entity", cut_entity)
 
     def on_view_size_changed(self, event):
         event.reject()
@@ -657,39 +1187,61 @@ class RvActivityMode(rvt.MinorMode):
             }
             """, [])
 
-    def get_unstored_frame_props(self, grpFilter=None):
+    def get_unstored_annotations(self, grpFilter=None):
         '''
-        Collect a dictionary of frame : property list pairs.
-        The properties are for unsaved annotation on the key frame.
+        Walk the annotated frames with unsaved (not yet submitted) strokes,
+        yielding (frame, source group, source frame, paint node, commands).
         An optional filter string can be passed to restrict the search to strokes on one source
         '''
-        # Build up a dictionary of frames : unsaved annotations
-        unstoredFrames = {}
-        frames = rve.findAnnotatedFrames()
-        pnodes = rvc.nodesOfType("RVPaint")
-        for pnode in pnodes:
+        for frame in rve.findAnnotatedFrames():
+
+            # Only the paint nodes of the sources showing at this frame can
+            # hold its annotation, so don't look anywhere else.
+            groups = [rvc.nodeGroup(str(s)) for s in rvc.sourcesAtFrame(frame)]
 
-            # If there is a filter make sure this paint node matches
-            if grpFilter != None and grpFilter not in pnode:
+            # If there is a filter make sure this frame belongs to it
+            if grpFilter != None:
+                groups = [g for g in groups if g == grpFilter]
+            if not groups:
                 continue
 
-            # For each paint node check the list of annotated frames for commands
-            for frame in frames:
-                sframe = rve.sourceFrame(frame)
-                orderProp = pnode + '.frame:%d.order' % sframe
-                if rvc.propertyExists(orderProp):
-                    pcmds = rvc.getStringProperty(orderProp)
-                    for pcmd in pcmds:
-                        savedProp = pnode + '.%s.sgtk_stored' % pcmd
-                        if rvc.propertyExists(savedProp):
-                            continue
-
-                        # If a command is found and it isn't sgtk_stored than add it to our list.
-                        # Creating the properties this way allows us to easily set them later
-                        # effectively marking the command as stored.
-                        unstoredFrames.setdefault(frame, []).append(savedProp)
+            sframe = rve.sourceFrame(frame)
+            for group in groups:
+                pnode = self.unstored_strokes.paint_node(group)
+                if not pnode:
+                    continue
+
+                pcmds = self.unstored_strokes.unstored(pnode, sframe)
+                if pcmds:
+                    yield (frame, group, sframe, pnode, pcmds)
+
+    def get_unstored_frame_props(self, grpFilter=None):
+        '''
+        Collect a dictionary of frame : (paint node, command) list pairs.
+        The commands are for unsaved annotation on the key frame.
+        An optional filter string can be passed to restrict the search to strokes on one source
+        '''
+        unstoredFrames = {}
+        for (frame, group, sframe, pnode, pcmds) in self.get_unstored_annotations(grpFilter):
+            unstoredFrames.setdefault(frame, []).extend((pnode, pcmd) for pcmd in pcmds)
+
         return unstoredFrames
 
+    def get_unstored_source_frames(self, grpFilter=None):
+        '''
+        Collect a dictionary of source group : { source frame : (paint node,
+        command) list } for the unsaved annotation, which is what we export
+        per Version.
+        '''
+        unstored = {}
+        for (frame, group, sframe, pnode, pcmds) in self.get_unstored_annotations(grpFilter):
+            strokes = unstored.setdefault(group, {}).setdefault(sframe, [])
+            for pcmd in pcmds:
+                if (pnode, pcmd) not in strokes:
+                    strokes.append((pnode, pcmd))
+
+        return unstored
+
     def get_unstored_frames(self):
         '''
         Get the frame numbers for the frames with unsaved (not yet submitted) annotation strokes
@@ -697,9 +1249,105 @@ class RvActivityMode(rvt.MinorMode):
         # The keys are the frames with unsaved annotation
         return self.get_unstored_frame_props().keys()
 
+    def get_annotation_exporter(self):
+        if not self._annotation_exporter:
+            rvc.rvioSetup() # NOTE: Pass the license to the env
+            rvio = os.environ.get("RV_APP_RVIO", None)
+            args = [rvio, "-v", "-err-to-out"]
+
+            # If a specific license was set use it instead
+            lic = os.environ.get("RV_APP_USE_LICENSE_FILE", None)
+            if lic != None:
+                args += ["-lic", lic]
+
+            self._annotation_exporter = AnnotationExporter(args, self._prefs.annotation_export_workers)
+            self._annotation_exporter.frame_written.connect(self.on_annotation_frame_written)
+            self._annotation_exporter.version_exported.connect(self.on_annotations_exported)
+
+        return self._annotation_exporter
+
+    def live_session_text(self):
+        '''
+        The current session, as saved for export.
+        '''
+        setDisp = pymu.MuSymbol("export_utils.setExportDisplayConvert")
+        setDisp("default")
+
+        tempdir = tempfile.mkdtemp()
+        session = os.path.join(tempdir, "live.rv")
+        try:
+            rvc.saveSession(session)
+            with open(session) as f:
+                return f.read()
+        finally:
+            if os.path.exists(session):
+                os.remove(session)
+            os.rmdir(tempdir)
+
+    def save_annotation_export_session(self, source_group, session):
+        '''
+        Write the session RVIO renders a Version's annotated frames from: the
+        live session, as RV saves it, less every source, sequence and compare
+        group other than the Version's own, viewing the Version's source so
+        RVIO's frames are source frames.
+        '''
+        drop_nodes = []
+        for node in rvc.nodes():
+            if rvc.nodeGroup(node) or node == source_group:
+                continue
+            if rvc.nodeType(node) in view_group_types:
+                drop_nodes.append(node)
+                drop_nodes.extend(rvc.nodesInGroup(node))
+
+        with open(session, "w") as f:
+            f.write(minimal_session(self.live_session_text(), source_group, drop_nodes))
+
+    def start_annotation_export(self, source_group, version_id, strokes):
+        '''
+        Start rendering the annotated source frames of a Version, strokes
+        being its entry from get_unstored_source_frames.  Returns whether
+        it started.
+        '''
+        rvc.rvioSetup() # NOTE: Pass the license to the env
+
+        tempdir = tempfile.mkdtemp()
+        session = os.path.join(tempdir, "export.rv")
+        self.save_annotation_export_session(source_group, session)
+
+        if self.get_annotation_exporter().export(version_id, session, strokes.keys(), tempdir):
+            self._annotation_export_strokes[version_id] = (strokes, tempdir)
+            return True
+
+        shutil.rmtree(tempdir, ignore_errors=True)
+        return False
+
+    def on_annotation_frame_written(self, version_id, frame):
+        rve.displayFeedback2("Rendered annotated frame %d..." % frame, 2.0)
+
+    def on_annotations_exported(self, version_id, attachments, errors):
+        if errors:
+            self._app.log_error("Unable to export annotation: " + errors)
+
+        (strokes, tempdir) = self._annotation_export_strokes.pop(version_id, ({}, None))
+
+        # a note waiting on these frames takes them
+        for (note_input_widget, submission) in list(self._note_submissions.items()):
+            if submission["version_id"] == version_id and submission["attachments"] is None:
+                submission["attachments"] = attachments
+                if not attachments and tempdir:
+                    shutil.rmtree(tempdir, ignore_errors=True)
+                self.deliver_note_attachments(note_input_widget)
+                return
+
+        if tempdir:
+            shutil.rmtree(tempdir, ignore_errors=True)
+
     def make_note_attachments(self, note_input_widget):
         '''
-        Find the annotated frames for the given version, export them through RVIO, then submit them
+        Called as a note is submitted: find the Version's annotated frames and
+        start rendering them through RVIO, without holding up the note.  The
+        frames are uploaded to the note once both it and they exist, see
+        deliver_note_attachments.
         '''
         # Look for unsaved annotation
         version_entity = self.details_panel.current_entity
@@ -707,94 +1355,123 @@ class RvActivityMode(rvt.MinorMode):
         if not version_entity:
             return
 
-        props = {}
+        # a note this widget submitted earlier that never got created
+        self.drop_note_submission(note_input_widget)
+
+        version_id = version_entity["id"]
+        strokes = {}
 
         try:
-            group = self.find_group_from_version_id(version_entity["id"])
-            props = self.get_unstored_frame_props(group)
+            group = self.find_group_from_version_id(version_id)
+            strokes = self.get_unstored_source_frames(group).get(group, {})
         except Exception as exc:
             self._app.log_error("Unable to locate annotation strokes: " + str(exc))
 
-        if len(props) <= 0:
+        if len(strokes) <= 0:
             self._app.log_debug("Found no new annotations to attach")
             return
 
-        # Start RVIO command construction
-        tempdir = tempfile.mkdtemp()
-        rvc.rvioSetup() # NOTE: Pass the license to the env
-        rvio = os.environ.get("RV_APP_RVIO", None)
-        args = [rvio, "-v", "-err-to-out"]
-
-        # Make the temp session
-        setDisp = pymu.MuSymbol("export_utils.setExportDisplayConvert")
-        setDisp("default")
-        session = os.path.join(tempdir, "export.rv")
-        rvc.saveSession(session)
-        args += [session]
+        exporter = self.get_annotation_exporter()
+        if exporter.is_exporting(version_id):
+            self._app.log_warning("Still rendering annotations for an earlier note of this Version")
+            return
 
-        # Start with a generic output file sequence string
-        tempfiles = os.path.join(tempdir,"sequence.@.jpg")
-        args += ["-o", tempfiles]
+        submission = {
+            "version_id": version_id,
+            "strokes": strokes,
+            # attachment paths, None while they are rendering
+            "attachments": None,
+            # the note, once it has been created
+            "note_id": None,
+        }
 
-        # Use the keys from the unsaved annotation search for frames
-        frames = [ str(f) for f in props.keys() ]
-        framesStr = ','.join(frames)
-        args += ["-t", framesStr]
+        if not self.start_annotation_export(group, version_id, strokes):
+            return
 
-        # If a specific license was set use it instead
-        lic = os.environ.get("RV_APP_USE_LICENSE_FILE", None)
-        if lic != None:
-            args += ["-lic", lic]
+        self._note_submissions[note_input_widget] = submission
+        self.connect_note_created(note_input_widget)
 
         # Tell the user what is going on
-        displayString = "Rendering " + str(len(frames))
-        if len(frames) > 1:
-            displayString += " annotated frames..."
+        displayString = "Rendering " + str(len(strokes))
+        if len(strokes) > 1:
+            displayString += " annotated frames, they will be attached to the note when done"
         else:
-            displayString += " annotated frame..."
-        rve.displayFeedback2(displayString, 3600.0)
+            displayString += " annotated frame, it will be attached to the note when done"
+        rve.displayFeedback2(displayString, 5.0)
 
-        # Run the RVIO conversion
-        try:
-            out = subprocess.check_output(args)
-        except subprocess.CalledProcessError as exc:
-            self._app.log_error("Unable to export annotation: " + str(exc))
+    def deliver_note_attachments(self, note_input_widget):
+        '''
+        Once the widget's note has been created and its frames rendered,
+        upload them to the note.
+        '''
+        submission = self._note_submissions.get(note_input_widget)
+        if not submission or submission["attachments"] is None or submission["note_id"] is None:
+            return
 
-        # Close out the banner
-        rve.displayFeedback2(displayString, 2.0)
+        del self._note_submissions[note_input_widget]
 
-        # Rename the annotation frame before submitting
-        attachments = []
-        saved = []
-        for frame in props.keys():
-            src = "%s/sequence.%d.jpg" % (tempdir,frame)
+        version_id = submission["version_id"]
+        attachments = submission["attachments"]
 
-            if not (os.path.isfile(src)):
-                self._app.log_error("Can't find annotation for frame: %d at '%s'" % (frame, src))
+        # the strokes of the frames we have
+        attached = set(os.path.basename(p) for p in attachments)
+        submitted = {}
+        for (sframe, frame_strokes) in submission["strokes"].items():
+            if os.path.basename(AnnotationExporter.attachment_path("", version_id, sframe)) not in attached:
+                self._app.log_error("Can't find annotation for frame: %d" % sframe)
                 continue
 
-            sframe = rve.sourceFrame(frame)
-            tgt = "%s/annot_version_%d_v2.%d.jpg" % (tempdir, version_entity['id'], sframe)
+            for (pnode, pcmd) in frame_strokes:
+                submitted.setdefault(pnode, []).append(pcmd)
 
-            shutil.move(src, tgt)
-            attachments.append(tgt)
-            saved.append(frame)
+        if attachments:
+            self.get_note_uploader().upload(submission["note_id"], attachments, submitted)
 
-        # Delete the session file
-        os.remove(session)
+    def drop_note_submission(self, note_input_widget):
+        submission = self._note_submissions.pop(note_input_widget, None)
+        if submission and submission["attachments"]:
+            shutil.rmtree(os.path.dirname(submission["attachments"][0]), ignore_errors=True)
 
-        # Submit the frames
-        note_input_widget.add_files_to_attachments(
-            attachments,
-            cleanup_after_upload=True,
-            apply_attachments=True,
-        )
+    def get_note_uploader(self):
+        if not self._note_uploader:
+            self._note_uploader = NoteAttachmentUploader(self._app.engine.bg_task_manager)
+            self._note_uploader.finished.connect(self.on_note_attachments_uploaded)
+
+        return self._note_uploader
+
+    def on_note_attachments_uploaded(self, note_id, submitted, error):
+        """
+        Record the strokes of the frames now attached to the note as
+        submitted with it.
+        """
+        if error:
+            self._app.log_error("Unable to attach annotation to note %d: %s" % (note_id, error))
+            return
+
+        for (pnode, pcmds) in submitted.items():
+            if rvc.nodeExists(pnode):
+                self.unstored_strokes.ledger.mark(pnode, pcmds, note_id)
+
+    def connect_note_created(self, note_input_widget):
+        if note_input_widget in self._note_widgets_connected:
+            return
+
+        entity_created = getattr(note_input_widget, "entity_created", None)
+        if entity_created is None:
+            return
+
+        entity_created.connect(lambda entity, w=note_input_widget: self.on_note_created(w, entity))
+        self._note_widgets_connected.append(note_input_widget)
+
+    def on_note_created(self, note_input_widget, entity):
+        """
+        The note the widget submitted has been created.
+        """
+        if note_input_widget not in self._note_submissions or not entity or entity.get("type") != "Note":
+            return
 
-        # Update the graph to reflect which strokes have been submitted
-        for frame in saved:
-            for prop in props[frame]:
-                rvc.newProperty(prop, rvc.IntType, 1)
-                setProp(prop, 1234) # XXX should be note id
+        self._note_submissions[note_input_widget]["note_id"] = entity["id"]
+        self.deliver_note_attachments(note_input_widget)
 
     def set_media_type_property(self, source_group, media_type):
         setProp(source_group + ".sg_review.media_type", media_type)
@@ -853,62 +1530,362 @@ class RvActivityMode(rvt.MinorMode):
         self._app.engine.log_debug("set_media_of_source '%s' to '%s'" %
             (source_group, media_type_name))
 
+        change = self.media_change_of_source(source_group, media_type_name, report)
+        if change:
+            self.apply_media_change(*change)
+
+        self.deferred_media_swaps.pop(source_group, None)
+
+    def media_change_of_source(self, source_group, media_type_name, report=False):
+        """
+        What set_media_of_source would do to the source, without touching
+        the graph: (source group, version_data, media type), or None if it
+        would leave the source alone.
+        """
         current_media_type = self.get_media_type_of_source(source_group)
         version_data = self.version_data_from_source(source_group)
-        m_type = self.media_type_fallback(version_data, media_type_name, report)
+        m_type = self.resolved_media_type(version_data, media_type_name, report)
 
         if media_type_name != m_type:
             self._app.engine.log_warning("Unable to locate desired media type " +
                 "'%s'. Falling back to '%s'" % (media_type_name,m_type))
 
         if m_type and m_type != current_media_type:
-            path = version_data[standard_media_types[m_type].path_field]
-            path = self.swap_in_home_dir(path)
+            return (source_group, version_data, m_type)
 
-            if m_type == "Streaming":
-                path = self.get_url_from_version(version_data['id'])
+        return None
+
+    def apply_media_change(self, source_group, version_data, m_type):
+        path = version_data[standard_media_types[m_type].path_field]
+        path = self.swap_in_home_dir(path)
+
+        if m_type == "Streaming":
+            path = self.streaming_path(version_data['id'])
+
+        file_source = groupMemberOfType(source_group, "RVFileSource")
+        rvc.setSourceMedia(file_source, [path], "shotgun")
+        self.set_media_type_property(source_group, m_type)
+        self.configure_source_media(source_group, version_data)
+
+        # erase overlay when swapping in?  Only sources made without
+        # media have one.
+        overlay_node = groupMemberOfType(source_group, "RVOverlay")
+        if rvc.propertyExists(overlay_node + '.text:sg_review_error.text'):
+            setProp(overlay_node + '.text:sg_review_error.text', [' '])
+
+    def set_media_of_sources(self, sources, media_type_name):
+        """
+        set_media_of_source for many sources: work out every change first,
+        then make them all as one graph update.
+        """
+        changes = []
+        for source_group in sources:
+            change = self.media_change_of_source(source_group, media_type_name)
+            if change:
+                changes.append(change)
+            self.deferred_media_swaps.pop(source_group, None)
+
+        if not changes:
+            return
+
+        rvc.beginCompoundStateChange()
+        try:
+            for change in changes:
+                self.apply_media_change(*change)
+        finally:
+            rvc.endCompoundStateChange()
+
+    def get_url_from_version(self, v_id):
+        return "%s/file_serve/version/%r/mp4" % (self._app.engine.sgtk.shotgun_url, v_id)
+
+    def streaming_path(self, v_id):
+        """
+        Where to stream the Version's movie from: our local copy if the
+        stream cache has one, else the server.
+        """
+        path = self.stream_cache.local_path(v_id) if self.stream_cache else None
+        return path or self.get_url_from_version(v_id)
+
+    def prefetch_streams(self):
+        """
+        Called as the playhead moves; start downloading the streams of the
+        next few clips, if they are streaming from the server.
+        """
+        if not self.stream_cache or self._prefs.stream_prefetch_clips <= 0:
+            return
+
+        view_node = rvc.viewNode()
+        clip_index = self.clip_index_from_frame()
+        if clip_index < 0 or self._stream_prefetch_clip == (view_node, clip_index):
+            return
+        self._stream_prefetch_clip = (view_node, clip_index)
+
+        seq_node = self.edl_cache.seq_node(view_node)
+        source = getIntProp(seq_node + ".edl.source", [])
+        inputs = rvc.nodeConnections(view_node, False)[0]
+
+        streams = []
+        last = min(len(source) - 2, clip_index + self._prefs.stream_prefetch_clips)
+        for i in range(clip_index + 1, last + 1):
+            if source[i] >= len(inputs):
+                continue
+
+            src_group = inputs[source[i]]
+            if self.get_media_type_of_source(src_group) != "Streaming":
+                continue
+
+            file_source = groupMemberOfType(src_group, "RVFileSource")
+            media = getStringProp(file_source + ".media.movie", [])
+            version_id = self.version_id_from_source(src_group)
+            if version_id and media and media[0].startswith('http'):
+                streams.append((version_id, media[0]))
+
+        # the clip we just reached may still be downloading, let it finish
+        keep = []
+        if source[clip_index] < len(inputs):
+            version_id = self.version_id_from_source(inputs[source[clip_index]])
+            if version_id:
+                keep.append(version_id)
+
+        self.stream_cache.prefetch(streams, keep)
+
+    def on_stream_cached(self, version_id, path):
+        """
+        A prefetched stream has been downloaded; point the Version's sources
+        at the local copy.  Swapping the media of a source we're playing would
+        stall playback, so that waits until it stops.
+        """
+        if rvc.isPlaying() and set(self.source_registry.lookup_all(version_id)) & set(self.visible_source_groups()):
+            self.pending_stream_rewrites[version_id] = path
+            return
+
+        self.pending_stream_rewrites.pop(version_id, None)
+        self.use_cached_stream(version_id, path)
+
+    def use_cached_stream(self, version_id, path):
+        for source_group in self.source_registry.lookup_all(version_id):
+            if self.get_media_type_of_source(source_group) != "Streaming":
+                continue
+
+            file_source = groupMemberOfType(source_group, "RVFileSource")
+            media = getStringProp(file_source + ".media.movie", [])
+            if media and media[0].startswith('http'):
+                rvc.setSourceMedia(file_source, [path], "shotgun")
+                self.configure_source_media(source_group)
+
+    def apply_pending_stream_rewrites(self):
+        """
+        Called when playback stops; use the streams cached while it played.
+        """
+        pending = self.pending_stream_rewrites
+        self.pending_stream_rewrites = {}
+
+        for (version_id, path) in pending.items():
+            if os.path.exists(path):
+                self.use_cached_stream(version_id, path)
+
+    def on_stream_evicted(self, version_id, path):
+        """
+        A cached stream is about to be deleted; stream any source still
+        playing it from the server again.
+        """
+        self.pending_stream_rewrites.pop(version_id, None)
+        self.revert_cached_streams(lambda media: media == path)
+
+    def revert_cached_streams(self, stale):
+        """
+        Point every source whose media is a stream cache file for which
+        stale(path) is true back at the server.
+        """
+        for file_source in rvc.nodesOfType("RVFileSource"):
+            media = getStringProp(file_source + ".media.movie", [])
+            if not media or not self.stream_cache.owns(media[0]) or not stale(media[0]):
+                continue
+
+            source_group = rvc.nodeGroup(file_source)
+            version_id = self.version_id_from_source(source_group)
+            if not version_id:
+                continue
+
+            rvc.setSourceMedia(file_source, [self.get_url_from_version(version_id)], "shotgun")
+            self.configure_source_media(source_group)
+
+
+    def swap_media_of_source(self, source_node, media_type_name, report=False):
+        """
+        Given the name of an RVSourceGroup node, swap the media held by that node to
+        be of the given "media type".  Silently ignore sources with no Shotgun
+        data and nodes that already hold the right type of media.
+        """
+        if not source_node:
+            return
+
+        self._app.engine.log_debug("swap_media_of_source '%s' to '%s'" %
+            (source_node, media_type_name))
+
+        old_media_type = self.get_media_type_of_source(source_node)
+
+        if old_media_type and (old_media_type != media_type_name):
+            self.set_media_of_source(source_node, media_type_name, report)
+
+
+
+    def visible_source_groups(self):
+        """
+        The source groups showing at the current frame, plus, when viewing a
+        sequence, those of the clips around the playhead.
+        """
+        groups = set(rvc.nodeGroup(str(s)) for s in rvc.sourcesAtFrame(rvc.frame()))
+
+        view_node = rvc.viewNode()
+        clip_index = self.clip_index_from_frame()
+
+        if clip_index >= 0:
+            seq_node = self.edl_cache.seq_node(view_node)
+            source = getIntProp(seq_node + ".edl.source", [])
+            inputs = rvc.nodeConnections(view_node, False)[0]
+
+            first = max(0, clip_index - self._prefs.entire_cut_behind)
+            last  = min(len(source) - 2, clip_index + self._prefs.entire_cut_ahead)
+
+            for i in range(first, last + 1):
+                if source[i] < len(inputs):
+                    groups.add(inputs[source[i]])
+
+        return groups
+
+    def swap_media_of_all_sources(self, media_type_name):
+        """
+        Swap every source to media_type_name.  Sources we can see are swapped
+        now (see swap_media_of_sources); the others are only noted, and
+        swapped by apply_deferred_media_swaps when they come into view.
+        Everyone's media is looked for in the background meanwhile.
+        """
+        to_swap = []
+        for source_group in rvc.nodesOfType("RVSourceGroup"):
+            media_type = self.get_media_type_of_source(source_group)
+            if media_type and media_type != media_type_name:
+                to_swap.append(source_group)
+
+        visible = self.visible_source_groups()
+
+        self.cancel_media_swap()
+        for source_group in to_swap:
+            if source_group not in visible:
+                self.deferred_media_swaps[source_group] = media_type_name
+                self.prefetch_media(self.version_data_from_source(source_group), force=True, media_type=media_type_name)
+
+        self.swap_media_of_sources([g for g in to_swap if g in visible], media_type_name)
+
+        self._app.engine.log_debug("Swapping %d sources to '%s', deferred %d." %
+            (len(to_swap) - len(self.deferred_media_swaps), media_type_name, len(self.deferred_media_swaps)))
+
+    def swap_media_of_sources(self, sources, media_type_name):
+        """
+        Swap the given sources to media_type_name: wait, behind a progress
+        dialog, for the media resolver to find everyone's media, then make
+        all the changes in one graph update.  Cancelling drops this swap and
+        everything deferred by the same "Swap Media - All Clips".
+        """
+        self.end_media_swap()
+
+        if not sources:
+            return
+
+        # look for everyone's media at once, rather than one source at a time
+        # as we go
+        for source_group in sources:
+            self.prefetch_media(self.version_data_from_source(source_group), force=True, media_type=media_type_name)
+
+        progress = QtGui.QProgressDialog("Swapping media to %s ..." % media_type_name,
+                "Cancel", 0, len(sources), rvqt.sessionWindow())
+        progress.setWindowModality(QtCore.Qt.WindowModal)
+        progress.setMinimumDuration(500)
+        progress.canceled.connect(self.cancel_media_swap)
+
+        self._media_swap = (sources, media_type_name, progress, time.time())
+        self.media_swap_step()
+
+    def media_choice_known(self, source_group, media_type_name):
+        if self.no_media_check:
+            return True
+
+        version_data = self.version_data_from_source(source_group)
+        return not version_data or self.media_resolver.choice(version_data["id"], media_type_name)[0]
+
+    def media_swap_step(self):
+        """
+        Check on the swap swap_media_of_sources started, and make it once the
+        media of all its sources is known (or we've waited long enough).
+        """
+        if not self._media_swap:
+            return
 
-            file_source = groupMemberOfType(source_group, "RVFileSource")
-            rvc.setSourceMedia(file_source, [path], "shotgun")
-            self.set_media_type_property(source_group, m_type)
-            self.configure_source_media(source_group, version_data)
+        (sources, media_type_name, progress, started) = self._media_swap
 
-            # erase overlay when swapping in?
-            overlay_node = groupMemberOfType(source_group, "RVOverlay")
-            self.createText(overlay_node + '.text:sg_review_error', ' ', -0.5, 0.0)
+        pending = len([g for g in sources if not self.media_choice_known(g, media_type_name)])
+        if pending and time.time() - started < self.media_swap_wait:
+            progress.setValue(len(sources) - pending)
+            self.media_swap_timer.start()
+            return
 
-    def get_url_from_version(self, v_id):
-        return "%s/file_serve/version/%r/mp4" % (self._app.engine.sgtk.shotgun_url, v_id)
+        # anything still unknown is looked for as we swap it
+        self.end_media_swap()
 
+        self.set_media_of_sources([g for g in sources if rvc.nodeExists(g)], media_type_name)
 
-    def swap_media_of_source(self, source_node, media_type_name, report=False):
+    def end_media_swap(self):
         """
-        Given the name of an RVSourceGroup node, swap the media held by that node to
-        be of the given "media type".  Silently ignore sources with no Shotgun
-        data and nodes that already hold the right type of media.
+        Drop any swap swap_media_of_sources is waiting to make.
         """
-        if not source_node:
+        if not self._media_swap:
             return
 
-        self._app.engine.log_debug("swap_media_of_source '%s' to '%s'" %
-            (source_node, media_type_name))
+        # clear it first: closing the dialog emits canceled
+        progress = self._media_swap[2]
+        self._media_swap = None
+        self.media_swap_timer.stop()
+        progress.close()
 
-        old_media_type = self.get_media_type_of_source(source_node)
+    def cancel_media_swap(self):
+        """
+        Drop the swap we're waiting on, and whatever was deferred with it.
+        """
+        self.end_media_swap()
 
-        if old_media_type and (old_media_type != media_type_name):
-            self.set_media_of_source(source_node, media_type_name, report)
+        self.deferred_media_swaps = {}
+        self._deferred_swap_clip = None
+
+    def apply_deferred_media_swaps(self):
+        """
+        Called as the playhead moves or the view changes; carry out the swaps
+        of a "Swap Media - All Clips" for any deferred sources that are now in
+        view, all in one graph update.
+        """
+        if not self.deferred_media_swaps:
+            return
+
+        view_clip = (rvc.viewNode(), self.clip_index_from_frame())
+        if view_clip == self._deferred_swap_clip:
+            return
+        self._deferred_swap_clip = view_clip
 
+        by_media_type = {}
+        for source_group in self.visible_source_groups():
+            media_type_name = self.deferred_media_swaps.get(source_group)
+            if media_type_name:
+                by_media_type.setdefault(media_type_name, []).append(source_group)
 
+        for (media_type_name, sources) in by_media_type.items():
+            self.set_media_of_sources(sources, media_type_name)
 
     def swap_media_factory(self, media_type_name, one_or_all):
 
         def swap_media(event):
             if one_or_all == "one":
-                sources = [ self.current_source() ]
+                self.swap_media_of_source(self.current_source(), media_type_name, True)
             else:
-                sources = rvc.nodesOfType("RVSourceGroup")
-            for source in sources:
-                self.swap_media_of_source(source, media_type_name, (one_or_all == "one"))
+                self.swap_media_of_all_sources(media_type_name)
 
         return swap_media
 
@@ -947,8 +1924,13 @@ class RvActivityMode(rvt.MinorMode):
 
         self.no_media_check = (os.getenv("RV_TK_NO_MEDIA_CHECK",None) is not None)
 
+        # When set, compare the source registry against the graph after every
+        # load and complain about any differences.
+        self.debug_source_registry = (os.getenv("RV_TK_DEBUG_SOURCE_REGISTRY",None) is not None)
+
         self.details_panel = None
         self.details_pinned_for_playback = False
+        self.tray_vers_search = None
         self.details_dirty = False
 
         # RV specific
@@ -977,6 +1959,21 @@ class RvActivityMode(rvt.MinorMode):
         self._queued_frame_change = -1
 
         self._prefs = Preferences(self._app.engine)
+
+        # decoded, tray-sized thumbnails shared by the delegate and the model
+        self.thumbnail_cache = ThumbnailCache(self._prefs.thumbnail_cache_mb * 1024 * 1024)
+
+        # answers "is the media there" for local paths, probing a whole tray
+        # load's worth of paths at once in worker threads, and remembering
+        # the answers across sessions in the app's cache dir
+        media_store = None
+        try:
+            media_store = MediaStatusStore(os.path.join(self._app.cache_location, "media_status.db"))
+        except Exception as e:
+            self._app.engine.log_warning("Media status cache unavailable: %r" % (e))
+
+        self.media_resolver = MediaResolver(
+            self._prefs.media_check_ttl, self._prefs.media_check_threads, media_store)
         self.incoming_pinned = {}
         self.incoming_mini_cut_focus = None
 
@@ -985,11 +1982,84 @@ class RvActivityMode(rvt.MinorMode):
         # indexed by version ID.
         self.proxy_sources = {}
 
+        # decoded copies of the JSON we keep in sg_review properties
+        self.session_state = SessionState(self._app.engine)
+
+        # strokes not yet submitted with a note, by paint node and frame
+        self.unstored_strokes = UnstoredStrokes(StrokeLedger())
+
+        # note widget -> the annotation of the note it submitted, waiting on
+        # the note being created or the frames being rendered (see
+        # make_note_attachments), the note widgets that tell us when their
+        # note is created, and what uploads the frames
+        self._note_submissions = {}
+        self._note_widgets_connected = []
+        self._note_uploader = None
+
+        # per-clip pinned flags for the tray delegate, see pinned_rows()
+        self._pinned_rows = None
+
+        # Entire-cut sequences still showing placeholders for some clips, the
+        # (sequence, clip) we last made real sources around, and the shared
+        # placeholder (group, first frame, last frame) of each frame rate.
+        self._windowed_sequences = set()
+        self._window_clip = None
+        self._placeholders = {}
+        self.deproxy_timer = None
+
+        # source group -> media type, for sources a "Swap Media - All Clips"
+        # left until they are in view, and the (view node, clip) we last
+        # checked them at
+        self.deferred_media_swaps = {}
+        self._deferred_swap_clip = None
+
+        # a swap of visible sources waiting on the media resolver: (sources,
+        # media type, progress dialog, start time), and how many seconds it
+        # waits before looking for the remaining media itself
+        self._media_swap = None
+        self.media_swap_wait = 10.0
+
+        # local copies of streamed movies, the (view node, clip) we last
+        # prefetched after, and Version id -> cached stream of Versions that
+        # were playing when it landed
+        self.stream_cache = None
+        self._stream_prefetch_clip = None
+        self.pending_stream_rewrites = {}
+
+        # RVIO pool rendering annotated frames, and the strokes and output
+        # dir of each Version's export in flight
+        self._annotation_exporter = None
+        self._annotation_export_strokes = {}
+
+        # Version id -> latest cut entity (or None), prefetched for each
+        # Playlist or Version load, and dropped with the next load
+        self.latest_cuts_by_version = {}
+
+        # steps the compare hotkeys look for, collected as they are bound, so
+        # we know what to prefetch
+        self.compare_steps = set()
+
+        # Version ID -> RVSourceGroup, so we don't have to search the graph
+        # every time we need the source for a Version.
+        self.source_registry = SourceGroupRegistry()
+        self.source_registry.rebuild()
+
+        # cached .edl.frame tables, used to map frames to clips
+        self.edl_cache = EdlFrameCache()
+
+        # (edl_cache version, first frame, end frame, tray visible) of the
+        # clip under the playhead last time frameChanged did the full update,
+        # and how often it could skip that.
+        self._current_clip = None
+        self.frame_change_stats = {"fast": 0, "slow": 0}
 
         self.init("RvActivityMode", None,
                 [
                 ("after-session-read", self.afterSessionRead, ""),
                 ("before-session-read", self.beforeSessionRead, ""),
+                ("before-session-write", self.beforeSessionWrite, ""),
+                ("source-group-complete", self.sourceGroupComplete, ""),
+                ("before-graph-delete", self.beforeGraphDelete, ""),
                 ("after-graph-view-change", self.viewChange, ""),
                 ("frame-changed", self.frameChanged, ""),
                 ("graph-node-inputs-changed", self.inputsChanged, ""),
@@ -1136,6 +2206,7 @@ class RvActivityMode(rvt.MinorMode):
 
     def deactivate(self):
         self.details_panel.save_preferences()
+        self.media_resolver.shutdown()
         rvt.MinorMode.deactivate(self)
 
 
@@ -1321,12 +2392,29 @@ class RvActivityMode(rvt.MinorMode):
         # popup utils will try to handle all popup menu related things...
         self._popup_utils = PopupUtils(self)
 
+        # latest cut for the clapper button, looked up off the UI thread
+        self.latest_cut_finder = LatestCutFinder(self._app.engine, self._app.engine.bg_task_manager)
+        self.latest_cut_finder.cut_found.connect(self.on_latest_cut_found)
+        self.latest_cut_finder.cut_lookup_failed.connect(self.on_latest_cut_lookup_failed)
+        self.latest_cut_finder.cuts_prefetched.connect(self.on_latest_cuts_prefetched)
+
+        try:
+            self.stream_cache = StreamCache(self._app.engine, self._app.engine.bg_task_manager,
+                    os.path.join(self._app.cache_location, "streams"),
+                    self._prefs.stream_cache_mb * 1024 * 1024)
+            self.stream_cache.stream_cached.connect(self.on_stream_cached)
+            self.stream_cache.stream_evicted.connect(self.on_stream_evicted)
+        except Exception as e:
+            self._app.engine.log_warning("Stream cache unavailable: %r" % (e))
+            self.stream_cache = None
+
         # just map these back for the moment...
         self.tray_model = self.tray_main_frame.tray_model
         self.tray_proxyModel = self.tray_main_frame.tray_proxyModel
         self.tray_delegate = self.tray_main_frame.tray_delegate
         self.tray_list = self.tray_main_frame.tray_list
         self.tray_vers_search = self.tray_main_frame.version_search_menu
+        self.tray_vers_search.set_load_delay(self._prefs.version_search_delay)
         self.tray_button_entire_cut = self.tray_main_frame.tray_button_entire_cut
         self.tray_button_mini_cut = self.tray_main_frame.tray_button_mini_cut
         self.tray_button_browse_cut = self.tray_main_frame.tray_button_browse_cut
@@ -1371,6 +2459,18 @@ class RvActivityMode(rvt.MinorMode):
         self.details_timer.setSingleShot(True)
         self.details_timer.setInterval(100)
 
+        # makes the rest of a windowed entire-cut's sources in idle time
+        self.deproxy_timer = QtCore.QTimer(rvqt.sessionWindow())
+        self.deproxy_timer.setSingleShot(True)
+        self.deproxy_timer.setInterval(max(1, self._prefs.entire_cut_idle_msec))
+        self.deproxy_timer.timeout.connect(self.deproxy_idle_step)
+
+        # polls the media resolver for a swap_media_of_sources
+        self.media_swap_timer = QtCore.QTimer(rvqt.sessionWindow())
+        self.media_swap_timer.setSingleShot(True)
+        self.media_swap_timer.setInterval(50)
+        self.media_swap_timer.timeout.connect(self.media_swap_step)
+
         self.last_rel_cut_entity = None
         self.last_rel_shot_entity = None
         self.last_related_cuts = None
@@ -1463,16 +2563,12 @@ class RvActivityMode(rvt.MinorMode):
             pinned = item.data(self._PINNED_THUMBNAIL)
             filtered = item.data(self._FILTER_THUMBNAIL)
 
-            thumb = None
-            if pinned:
-                thumb = QtGui.QIcon(pinned)
-            if not pinned and filtered:
-                thumb = QtGui.QIcon(filtered)
-            if not pinned and not filtered:
-                thumb = QtGui.QIcon(orig)
+            thumb = self.thumbnail_cache.icon(pinned or filtered or orig)
             if thumb:
                 self.tray_proxyModel.setData(item, thumb, QtCore.Qt.DecorationRole)
 
+        self._app.engine.log_debug("thumbnail cache: %r" % self.thumbnail_cache.stats())
+
         self.tray_list.repaint()
 
     def update_pinned_thumbnail(self, v_data):
@@ -1483,16 +2579,18 @@ class RvActivityMode(rvt.MinorMode):
             self._app.engine.log_info('no image path passed into update_pinned_thumbnail.')
             return
 
+        entity = v_data.get('entity')
+        if not entity or entity.get('type') != "Shot":
+            return
+
         path = v_data['__image_path']
-        rows = self.tray_proxyModel.rowCount()
-        for index in range(0, rows):
-            item = self.tray_proxyModel.index(index, 0)
+        for row in self.tray_model.rows_for_shot(entity['id']):
+            item = self.tray_model.index(row, 0)
             sg = shotgun_model.get_sg_data(item)
 
-            # sometimes the shot comes back as None XXX - sb
+            # only CutItems carry a shot (sometimes None XXX - sb)
             if 'shot' in sg and sg['shot']:
-                if sg['shot']['id'] == v_data['entity']['id']:
-                    self.tray_proxyModel.setData(item, path, self._PINNED_THUMBNAIL)
+                self.tray_model.setData(item, path, self._PINNED_THUMBNAIL)
 
         self.refresh_tray_thumbnails()
 
@@ -1542,7 +2640,7 @@ class RvActivityMode(rvt.MinorMode):
         shadow_source = getIntProp(seq_node + ".shadow_edl.source", [])
         shadow_inputs = getStringProp(seq_node + ".shadow_edl.inputs", [])
         shadow_inputs[shadow_source[clip_index]] = src_group
-        setProp(seq_node + ".shadow_edl.inputs", shadow_inputs)
+        self.set_shadow_inputs(seq_node, shadow_inputs)
 
         # reset inputs
         rvc.setNodeInputs(seq_group, inputs)
@@ -1792,25 +2890,9 @@ class RvActivityMode(rvt.MinorMode):
         # compensate for current mini-cut state
         clip_index = clip_index + mini_data.first_clip
 
-        # get "entire cut" edl data and node inputs
-        shadow_source = getIntProp   (seq_node + ".shadow_edl.source", [])
-        shadow_frame  = getIntProp   (seq_node + ".shadow_edl.frame",  [])
-        shadow_in     = getIntProp   (seq_node + ".shadow_edl.in",     [])
-        shadow_out    = getIntProp   (seq_node + ".shadow_edl.out",    [])
-        shadow_inputs = getStringProp(seq_node + ".shadow_edl.inputs", [])
-
-        # all shadow_inputs will be used, so de-proxify any proxy sources
-        shadow_inputs = map(self.unproxied_source_group, shadow_inputs)
-
-        setProp(seq_node + ".shadow_edl.inputs", shadow_inputs)
-
-        # configure sequence node
-        setProp(seq_node + ".edl.source", shadow_source)
-        setProp(seq_node + ".edl.frame",  shadow_frame)
-        setProp(seq_node + ".edl.in",     shadow_in)
-        setProp(seq_node + ".edl.out",    shadow_out)
-
-        rvc.setNodeInputs(seq_group, shadow_inputs)
+        # configure sequence node with the "entire cut" edl
+        self.apply_entire_cut_edl(seq_group, seq_node, clip_index)
+        shadow_frame = getIntProp(seq_node + ".shadow_edl.frame", [])
 
         # new mini_data to reflect new state, store in sequence node
         self.save_mini_cut_data(MiniCutData(False), seq_node)
@@ -1840,7 +2922,6 @@ class RvActivityMode(rvt.MinorMode):
             (left_num, right_num) = self.get_mini_values()
 
             seq_node = groupMemberOfType(rvc.viewNode(), "RVSequence")
-            mini_frame = rvc.getIntProperty(seq_node + ".edl.frame")
 
             # mini_data stores indexes in entire timeline space
             # get relative position of focus clip
@@ -1857,7 +2938,7 @@ class RvActivityMode(rvt.MinorMode):
 
             self.load_mini_cut( focus_index, offset=offset, playhead_index=ph_index, from_spinner=True )
 
-            mini_frame = rvc.getIntProperty(seq_node + ".edl.frame")
+            mini_frame = self.edl_cache.frames(seq_node)
 
             if from_spinner:
                 self._queued_frame_change = mini_frame[ph_index] + offset
@@ -1896,71 +2977,6 @@ class RvActivityMode(rvt.MinorMode):
         setProp("%s.text" % node, [text])
         setProp('%s.debug' % node, [ 0 ])
 
-    def find_latest_cut_for_version(self, shot_entity, version_data, project_entity):
-
-        """
-        original JS query here:
-        https://github.com/shotgunsoftware/shotgun/blob/develop/cut_support_2016/public/javascripts/util/cuts_helper.js#L167
-
-        returns the latest cut entity for this version or None.
-
-        """
-
-        version_entity = {}
-        version_entity['id'] = version_data['id']
-        version_entity['type'] = "Version"
-        version_entity['name'] = version_data['code']
-
-        cut_fields = ['id', 'created_at', 'cached_display_name']
-
-        # for reference, what it looks like if you have shot and project...
-        # cut_filters = [
-        #     ['project', 'is', project_entity],
-        #     {
-        #         "filter_operator": "any",
-        #         "filters": [
-        #             ['cut_items.CutItem.version', 'is', version_entity],
-        #             ['version', 'is', version_entity],
-        #             ['cut_items.CutItem.shot', 'is', shot_entity]
-        #         ]
-        #     },
-        # ]
-
-        cut_filters = [
-            {
-                "filter_operator": "any",
-                "filters": [
-                    ['cut_items.CutItem.version', 'is', version_entity],
-                    ['version', 'is', version_entity]
-                ]
-            }
-        ]
-
-        if shot_entity:
-            cut_filters[0]['filters'].append(['cut_items.CutItem.shot', 'is', shot_entity])
-
-        if project_entity:
-            cut_filters.insert(0, ['project', 'is', project_entity] )
-
-        cut_order = [ {'field_name':'created_at','direction':'desc'} ]
-
-        cut_presets = [
-                { "preset_name": "LATEST", "latest_by": "REVISION_NUMBER" }
-        ]
-
-        cuts = self._bundle.shotgun.find(
-            'Cut',
-            fields=cut_fields,
-            filters=cut_filters,
-            additional_filter_presets=cut_presets,
-            order=cut_order
-        )
-
-        if cuts:
-            return { "id" : cuts[0]['id'], "cached_display_name" : cuts[0]['cached_display_name'], "type" : "Cut" }
-
-        return None
-
     def sequence_group_from_target(self, target_entity):
         """
         We keep a RVSequenceGroup around to represent each Playlist, and two
@@ -2000,7 +3016,52 @@ class RvActivityMode(rvt.MinorMode):
             # XXX do we have a way to test this URL?
             return True
 
-        return (True if self.no_media_check else bool(rvc.existingFilesInSequence(rvc.undoPathSwapVars(path))))
+        return (True if self.no_media_check else self.media_exists(path))
+
+    def media_exists(self, path):
+        """
+        Whether there is media at path.  Local movies and frames are answered
+        by the media resolver without waiting on the file system; anything
+        else (urls, movieprocs) is left to RV.
+        """
+        if path.startswith('http') or path.endswith('.movieproc'):
+            return bool(rvc.existingFilesInSequence(rvc.undoPathSwapVars(path)))
+
+        return self.media_resolver.exists(rvc.undoPathSwapVars(path))
+
+    def prefetch_media(self, version_data, force=False, media_type=None):
+        """
+        Start working out, in the background, which media a version we don't
+        have a source for yet (or any version, if force is set) should play
+        as the given (by default the preferred) media type, so
+        resolved_media_type doesn't wait on the file system once per source.
+        """
+        if self.no_media_check or not version_data:
+            return
+
+        if not force and self.find_group_from_version_id(version_data["id"]):
+            return
+
+        paths = {}
+        for m_type in ("Movie", "Frames"):
+            path = self.swap_in_home_dir(version_data.get(standard_media_types[m_type].path_field))
+            if path:
+                paths[m_type] = path if path.startswith('http') else rvc.undoPathSwapVars(path)
+
+        self.media_resolver.prefetch_choice(version_data["id"], media_type or self._prefs.preferred_media_type,
+                paths, self._prefs.auto_streaming)
+
+    def resolved_media_type(self, version_data, media_type, report=False):
+        """
+        media_type_fallback, taken from the media resolver's answer when
+        prefetch_media has already worked it out.
+        """
+        if not report and not self.no_media_check:
+            (known, m_type) = self.media_resolver.choice(version_data["id"], media_type)
+            if known:
+                return m_type
+
+        return self.media_type_fallback(version_data, media_type, report)
 
     def swap_in_home_dir(self, path):
 
@@ -2063,14 +3124,17 @@ class RvActivityMode(rvt.MinorMode):
 
     def find_group_from_version_id(self, version_id):
 
-        for s in rvc.nodesOfType("RVSourceGroup"):
-            if getIntProp(s + ".sg_review.version_id", -1) == version_id:
-                # XXX we should be storing/checking url too
-                # XXX possibly this version data is stale, think about when we
-                # might refresh ?
-                return s
+        # XXX we should be storing/checking url too
+        # XXX possibly this version data is stale, think about when we
+        # might refresh ?
+        return self.source_registry.lookup(version_id)
 
-        return None
+    def check_source_registry(self):
+        if not self.debug_source_registry:
+            return
+
+        for problem in self.source_registry.check_consistency():
+            self._app.engine.log_error("Source registry: %s" % problem)
 
     def unproxied_source_group(self, source_name):
 
@@ -2105,10 +3169,10 @@ class RvActivityMode(rvt.MinorMode):
         path = None
         no_media = False
 
-        m_type = self.media_type_fallback(version_data, media_type)
+        m_type = self.resolved_media_type(version_data, media_type)
         if m_type:
             if m_type == "Streaming":
-                path = self.get_url_from_version(version_data['id'])
+                path = self.streaming_path(version_data['id'])
             else:
                 path = version_data[standard_media_types[m_type].path_field]
                 path = self.swap_in_home_dir(path)
@@ -2128,7 +3192,7 @@ class RvActivityMode(rvt.MinorMode):
             m_type = "Movie"
             no_media = True
 
-        if not bool(rvc.existingFilesInSequence(rvc.undoPathSwapVars(path))):
+        if not self.media_exists(path):
             if self._prefs.auto_streaming:
                 if not path.startswith('http'):
                     print "%r does not exist. Trying %r" % ( path, self.get_url_from_version(version_data['id']) )
@@ -2151,7 +3215,8 @@ class RvActivityMode(rvt.MinorMode):
                     version_data["code"] + '\nhas no playable local media.', -0.5, 0.0)
 
         setProp(source_group + ".sg_review.version_id",   version_data["id"])
-        setProp(source_group + ".sg_review.version_data", json.dumps(version_data))
+        self.source_registry.register(version_data["id"], source_group)
+        self.session_state.set(source_group, "version_data", version_data)
         setProp(source_group + ".sg_review.timestamp", int(time.time()) )
 
         self.set_media_type_property(source_group, m_type)
@@ -2196,95 +3261,317 @@ class RvActivityMode(rvt.MinorMode):
 
         index = -1
         offset = 0
-        if rvc.nodeType(rvc.viewNode()) == "RVSequenceGroup":
-            current_frame = rvc.frame()
-            seq_node = groupMemberOfType(rvc.viewNode(), "RVSequence")
-            frames = rvc.getIntProperty(seq_node + ".edl.frame")
-            last_frame = 0
-            for f in frames:
-                if current_frame < f:
-                    offset = current_frame - last_frame
-                    break
-                index += 1
-                last_frame = f
+        view_node = rvc.viewNode()
+        if rvc.nodeType(view_node) == "RVSequenceGroup":
+            seq_node = self.edl_cache.seq_node(view_node)
+            frames = self.edl_cache.frames(seq_node)
+            (index, offset) = EdlFrameCache.clip_index_and_offset(frames, rvc.frame())
 
         return (index, offset)
 
-    def clip_index_from_frame(self):
-        (index, offset) = self.clip_index_and_offset_from_frame()
-        return index
+    def update_shadow_edl_in_place(self, seq_group, seq_node, new_inputs,
+                                   new_source, new_ins, new_outs, edit_data_list):
+        """
+        Bring the sequence's shadow EDL (and the live EDL, or mini-cut) up to
+        date with a rebuilt one by swapping the inputs of only those clips
+        whose Version changed.  Returns False, having changed nothing, if the
+        clips themselves differ (count, in or out), in which case the caller
+        must rebuild everything.
+        """
+        old_source = getIntProp   (seq_node + ".shadow_edl.source", [])
+        old_ins    = getIntProp   (seq_node + ".shadow_edl.in",     [])
+        old_outs   = getIntProp   (seq_node + ".shadow_edl.out",    [])
+        old_inputs = getStringProp(seq_node + ".shadow_edl.inputs", [])
 
-    def sequence_data_from_session(self):
-        json_str = getStringProp(rvc.viewNode() + ".sg_review.sequence_data", None)
-        if json_str:
-            return json.loads(json_str)
+        if old_ins != new_ins or old_outs != new_outs or len(old_source) != len(new_source):
+            return False
 
-        return None
+        if any(n >= len(old_inputs) for n in old_source):
+            return False
+
+        def version_id(group_name):
+            # proxy sources are named by version id
+            return int(group_name) if group_name.isdigit() else self.version_id_from_source(group_name)
+
+        mini_data = MiniCutData.load_from_session(seq_node)
+
+        source = list(old_source)
+        inputs = list(old_inputs)
+        input_map = dict((g, n) for (n, g) in enumerate(inputs))
+        changed = 0
+
+        # last entry is the terminator
+        for i in range(len(source) - 1):
+            src_group = new_inputs[new_source[i]]
+            if version_id(src_group) == version_id(inputs[source[i]]):
+                continue
+
+            if src_group not in input_map:
+                input_map[src_group] = len(inputs)
+                inputs.append(src_group)
+
+            source[i] = input_map[src_group]
+            changed += 1
+
+        self._app.engine.log_debug("Filter refresh changed %d of %d clips." % (changed, len(source) - 1))
+
+        if edit_data_list != self.session_state.get(seq_group, "edit_data"):
+            self.session_state.set(seq_group, "edit_data", edit_data_list)
+
+        if not changed:
+            return True
+
+        # drop inputs no clip uses any more, so they aren't kept around (and
+        # made real by the next entire-cut)
+        used = sorted(set(source[:-1]))
+        if len(used) < len(inputs):
+            renumber = dict((n, i) for (i, n) in enumerate(used))
+            inputs = [inputs[n] for n in used]
+            source = [renumber[n] for n in source[:-1]] + [0]
+
+        setProp(seq_node + ".shadow_edl.source", source)
+        self.set_shadow_inputs(seq_node, inputs)
+
+        if mini_data.active:
+            self.load_mini_cut(mini_data.focus_clip - mini_data.first_clip, seq_group=seq_group)
+        else:
+            self.apply_entire_cut_edl(seq_group, seq_node)
+
+        return True
+
+    def is_proxy_source(self, source_name):
+        # SourceGroup names that are all digits are proxies.  Name is version ID.
+        return source_name.isdigit()
+
+    def placeholder_source(self, first_frame, last_frame, fps):
+        """
+        A black source covering the given frames, that entire-cut uses for
+        clips whose real source hasn't been made yet.  One is shared by all
+        such clips of the same frame rate, and grown in place when a
+        sequence needs more frames than it has.
+        """
+        group = None
+        placeholder = self._placeholders.get(fps)
+
+        if placeholder and rvc.nodeExists(placeholder[0]):
+            (group, first, last) = placeholder
+            if first <= first_frame and last_frame <= last:
+                return group
+
+            first_frame = min(first, first_frame)
+            last_frame  = max(last,  last_frame)
+
+        path = "black,start=%d,end=%d,fps=%f.movieproc" % (first_frame, last_frame, fps)
+
+        if group:
+            rvc.setSourceMedia(groupMemberOfType(group, "RVFileSource"), [path], "shotgun")
+        else:
+            group = rvc.nodeGroup(rvc.addSourceVerbose([path]))
+            rve.setUIName(group, "Loading ...")
+            setProp(group + ".sg_review.placeholder", 1)
+
+        self._placeholders[fps] = (group, first_frame, last_frame)
+
+        return group
 
-    def data_from_cut_item(self, sg, rv):
-        version_data = {}
-        edit_data = {}
+    def drop_placeholders(self):
+        """
+        Make every clip of the windowed entire-cuts real, then delete the
+        placeholders.
+        """
+        for seq_group in list(self._windowed_sequences):
+            if not rvc.nodeExists(seq_group):
+                continue
 
-        # We prefer the Version that resulted from filtering, fall back to the
-        # one attached to the CutItem, then fallback to the one attached to the
-        # Cut.
+            seq_node = groupMemberOfType(seq_group, "RVSequence")
+            if not MiniCutData.load_from_session(seq_node).active:
+                self.apply_entire_cut_edl(seq_group, seq_node, whole=True)
 
-        if   rv and rv.get("id"):
+        self._windowed_sequences = set()
+        self._window_clip = None
 
-            for f in required_version_fields:
-                version_data[f] = rv.get(f)
+        for (group, first, last) in self._placeholders.values():
+            if rvc.nodeExists(group):
+                rvc.deleteNode(group)
 
-            edit_data["in"]    = sg.get("cut_item_in")
-            edit_data["out"]   = sg.get("cut_item_out")
+        self._placeholders = {}
 
-        elif sg and sg.get("version.Version.id"):
+    def restore_proxy_sources(self):
+        """
+        Pick up the version_data of the proxies the sequences of a session we
+        just read still have (saved by beforeSessionWrite), so they can be
+        made real when needed.
+        """
+        for seq_node in rvc.nodesOfType("RVSequence"):
+            for (version_id, version_data) in self.session_state.get(seq_node, "proxy_data", {}).items():
+                self.proxy_sources[int(version_id)] = version_data
 
-            for f in required_version_fields:
-                version_data[f] = sg.get("version.Version." + f)
+    def apply_entire_cut_edl(self, seq_group, seq_node, clip_index=None, whole=False):
+        """
+        Show the shadow (entire-cut) EDL in the sequence.  If windowing is
+        turned on (and whole isn't given), only clips around clip_index (the
+        clip at the playhead by default) get real sources; the others play a
+        placeholder until the idle timer makes theirs.
+        """
+        shadow_source = getIntProp   (seq_node + ".shadow_edl.source", [])
+        shadow_frame  = getIntProp   (seq_node + ".shadow_edl.frame",  [])
+        shadow_in     = getIntProp   (seq_node + ".shadow_edl.in",     [])
+        shadow_out    = getIntProp   (seq_node + ".shadow_edl.out",    [])
+        shadow_inputs = getStringProp(seq_node + ".shadow_edl.inputs", [])
 
-            edit_data["in"]    = sg.get("cut_item_in")
-            edit_data["out"]   = sg.get("cut_item_out")
+        clip_count = len(shadow_source) - 1
 
+        if whole or not self._prefs.windowed_entire_cut:
+            window = range(clip_count)
         else:
-            for f in required_version_fields:
-                version_data[f] = sg.get("cut.Cut.version.Version." + f)
+            if clip_index is None:
+                (clip_index, offset) = EdlFrameCache.clip_index_and_offset(shadow_frame, rvc.frame())
+            first = max(0, clip_index - self._prefs.entire_cut_behind)
+            last  = min(clip_count - 1, clip_index + self._prefs.entire_cut_ahead)
+            window = range(first, last + 1)
+
+        for i in window:
+            n = shadow_source[i]
+            shadow_inputs[n] = self.unproxied_source_group(shadow_inputs[n])
 
-            edit_data["in"]    = sg.get("edit_in")
-            edit_data["out"]   = sg.get("edit_out")
+        self.set_shadow_inputs(seq_node, shadow_inputs)
 
-        edit_data["shot"] = sg.get("shot")
+        # live edl: same clips, but proxies swapped for the placeholder
+        live_inputs = []
+        live_source = []
+        input_map = {}
+        placeholder = None
 
-        if version_data["id"] is None:
-            self._app.engine.log_error("No Version data for CutItem id=%d." % sg.get("id"))
-            version_data["id"]   = 100000 + sg.get("cut.Cut.id", 0)
-            version_data["code"] = "Missing Version"
+        for i in range(clip_count):
+            src_group = shadow_inputs[shadow_source[i]]
 
-        return (version_data, edit_data)
+            if self.is_proxy_source(src_group):
+                if not placeholder:
+                    placeholder = self.placeholder_source(min(shadow_in[:-1]), max(shadow_out[:-1]),
+                            getFloatProp(seq_node + ".output.fps", 24.0))
+                src_group = placeholder
 
-    def data_from_version(self, sg):
-        version_data = sg
-        edit_data = {}
-        edit_data["in"]  = sg.get("sg_first_frame", None)
-        edit_data["out"] = sg.get("sg_last_frame",  None)
-        edit_data["shot"] = None
+            if src_group not in input_map:
+                input_map[src_group] = len(live_inputs)
+                live_inputs.append(src_group)
 
-        # Note, we used to fallback to assuming range = 1-100 for sources
-        # that do not have first/last frame fields set, now we allow those
-        # "None"s to flow through here and we'll adjust later.
+            live_source.append(input_map[src_group])
 
-        if sg.get("entity"):
-            if sg.get("entity").get("type") == "Shot":
-                edit_data["shot"] = sg.get("entity")
+        live_source.append(0)
 
-        return (version_data, edit_data)
+        self.set_edl(seq_node, live_source, shadow_frame, shadow_in, shadow_out)
+        rvc.setNodeInputs(seq_group, live_inputs)
 
-    def data_from_query_item(self, sg_item, rv_item, target_entity):
-        if target_entity["type"] == "Cut":
-            (version_data, edit_data) = self.data_from_cut_item(sg_item, rv_item)
+        if placeholder:
+            self._windowed_sequences.add(seq_group)
+            if self.deproxy_timer and self._prefs.entire_cut_idle_msec > 0:
+                self.deproxy_timer.start()
         else:
-            (version_data, edit_data) = self.data_from_version(sg_item)
+            self._windowed_sequences.discard(seq_group)
+
+        self._window_clip = (seq_group, clip_index)
+
+    def update_entire_cut_window(self):
+        """
+        Called as the playhead moves; make real sources for the clips around
+        it if we are in a windowed entire-cut.
+        """
+        seq_group = rvc.viewNode()
+        if seq_group not in self._windowed_sequences:
+            return
+
+        clip_index = self.clip_index_from_frame()
+        if self._window_clip == (seq_group, clip_index):
+            return
+
+        self._window_clip = (seq_group, clip_index)
+
+        seq_node = groupMemberOfType(seq_group, "RVSequence")
+        if MiniCutData.load_from_session(seq_node).active:
+            return
+
+        shadow_source = getIntProp   (seq_node + ".shadow_edl.source", [])
+        shadow_inputs = getStringProp(seq_node + ".shadow_edl.inputs", [])
+
+        first = max(0, clip_index - self._prefs.entire_cut_behind)
+        last  = min(len(shadow_source) - 2, clip_index + self._prefs.entire_cut_ahead)
+
+        if any(self.is_proxy_source(shadow_inputs[shadow_source[i]]) for i in range(first, last + 1)):
+            self.apply_entire_cut_edl(seq_group, seq_node, clip_index)
+
+    def deproxy_idle_step(self):
+        """
+        Make a few more real sources for the windowed entire-cut we're looking
+        at, nearest the playhead first.
+        """
+        seq_group = rvc.viewNode()
+        if seq_group not in self._windowed_sequences:
+            return
+
+        # don't compete with playback, try again later
+        if rvc.isPlaying():
+            self.deproxy_timer.start()
+            return
+
+        seq_node = groupMemberOfType(seq_group, "RVSequence")
+        if MiniCutData.load_from_session(seq_node).active:
+            return
+
+        shadow_source = getIntProp   (seq_node + ".shadow_edl.source", [])
+        shadow_inputs = getStringProp(seq_node + ".shadow_edl.inputs", [])
+
+        clip_index = self.clip_index_from_frame()
+        proxy_clips = [i for i in range(len(shadow_source) - 1)
+                if self.is_proxy_source(shadow_inputs[shadow_source[i]])]
+        proxy_clips.sort(key=lambda i: abs(i - clip_index))
+
+        for i in proxy_clips[:4]:
+            n = shadow_source[i]
+            shadow_inputs[n] = self.unproxied_source_group(shadow_inputs[n])
+
+        # stores the shadow inputs, and restarts us if there's more to do
+        self.set_shadow_inputs(seq_node, shadow_inputs)
+        self.apply_entire_cut_edl(seq_group, seq_node, clip_index)
+
+    def set_shadow_inputs(self, seq_node, inputs):
+        setProp(seq_node + ".shadow_edl.inputs", inputs)
+        self.invalidate_pinned_rows()
+
+    def set_edl(self, seq_node, source, frame, ins, outs):
+        """
+        Write the EDL of the given RVSequence node, keeping our cached copy of
+        the frame table in sync.
+        """
+        setProp(seq_node + ".edl.source", source)
+        setProp(seq_node + ".edl.frame",  frame)
+        setProp(seq_node + ".edl.in",     ins)
+        setProp(seq_node + ".edl.out",    outs)
+
+        self.edl_cache.invalidate()
+
+    def current_clip_bounds(self):
+        """
+        Return (edl_cache version, first frame, end frame) of the clip under
+        the playhead in the current sequence, or None if we are not looking
+        at a sequence or are off the end of it.
+        """
+        view_node = rvc.viewNode()
+        if rvc.nodeType(view_node) != "RVSequenceGroup":
+            return None
+
+        frames = self.edl_cache.frames(self.edl_cache.seq_node(view_node))
+        (index, offset) = EdlFrameCache.clip_index_and_offset(frames, rvc.frame())
+        if index < 0 or index >= len(frames) - 1:
+            return None
 
-        return (version_data, edit_data)
+        return (self.edl_cache.version, frames[index], frames[index + 1])
+
+    def clip_index_from_frame(self):
+        (index, offset) = self.clip_index_and_offset_from_frame()
+        return index
+
+    def sequence_data_from_session(self):
+        return self.session_state.get(rvc.viewNode(), "sequence_data")
 
     def pinned_from_sequence(self, seq_group=None):
         """
@@ -2295,11 +3582,7 @@ class RvActivityMode(rvt.MinorMode):
             if rvc.nodeType(seq_group) != "RVSequenceGroup":
                 return {}
 
-        pinned_str = getStringProp(seq_group + ".sg_review.pinned", "")
-        if pinned_str:
-            return json.loads(pinned_str)
-
-        return {}
+        return self.session_state.get(seq_group, "pinned", {})
 
     def shot_id_str_from_version_data(self, version_data):
 
@@ -2321,54 +3604,78 @@ class RvActivityMode(rvt.MinorMode):
         if not shot:
             return
 
-        pinned = self.pinned_from_sequence(seq_group)
+        # copy, since the session state owns the dict it hands back
+        pinned = dict(self.pinned_from_sequence(seq_group))
 
         # note that if there was previously another Versioned pinned for clips
         # referencing this shot, this Version will replace it.
         pinned[shot] = version_data
 
-        setProp(seq_group + ".sg_review.pinned", json.dumps(pinned))
+        self.session_state.set(seq_group, "pinned", pinned)
+        self.invalidate_pinned_rows()
 
     def index_is_pinned(self, index):
+        # called by the tray delegate for every cell it paints, so just look
+        # up the precomputed answer.
+
+        pinned_rows = self.pinned_rows()
 
+        return 0 <= index < len(pinned_rows) and pinned_rows[index]
+
+    def invalidate_pinned_rows(self):
+        self._pinned_rows = None
+
+    def pinned_rows(self):
+        """
+        Per-clip list of booleans, True where the clip's shot has a pinned
+        Version in the current sequence.  Rebuilt only after the pinned map
+        or the shadow EDL changes.
+        """
         seq_group = rvc.viewNode()
-        if rvc.nodeType(seq_group) != "RVSequenceGroup":
-            return False
 
-        pinned = self.pinned_from_sequence(seq_group)
+        if self._pinned_rows is not None and self._pinned_rows[0] == seq_group:
+            return self._pinned_rows[1]
 
-        # get source of this index
+        rows = []
 
-        seq_node      = groupMemberOfType(seq_group, "RVSequence")
-        shadow_source = getIntProp(seq_node + ".shadow_edl.source", [])
-        shadow_inputs = getStringProp(seq_node + ".shadow_edl.inputs", [])
+        if seq_group and rvc.nodeType(seq_group) == "RVSequenceGroup":
 
-        # allow for half-build data structures:
+            pinned = self.pinned_from_sequence(seq_group)
 
-        if index not in range(len(shadow_source)):
-            return False
+            seq_node      = groupMemberOfType(seq_group, "RVSequence")
+            shadow_source = getIntProp(seq_node + ".shadow_edl.source", [])
+            shadow_inputs = getStringProp(seq_node + ".shadow_edl.inputs", [])
 
-        if shadow_source[index] not in range(len(shadow_inputs)):
-            return False
+            # last entry of the shadow edl is the terminator
+            for source_num in shadow_source[:-1]:
 
-        source_group = shadow_inputs[shadow_source[index]]
+                # allow for half-build data structures:
+                if not pinned or not (0 <= source_num < len(shadow_inputs)):
+                    rows.append(False)
+                    continue
 
-        # get shot from version_data of this source and look up in pinned
-        # Note: "source_group" at this point may be a proxy source (IE a
-        # Version ID), version_data_from_source() will handle this case
+                # get shot from version_data of this source and look up in
+                # pinned.  Note: the source group at this point may be a proxy
+                # source (IE a Version ID), version_data_from_source() will
+                # handle this case
 
-        version_data = self.version_data_from_source(source_group)
+                version_data = self.version_data_from_source(shadow_inputs[source_num])
 
-        shot = self.shot_id_str_from_version_data(version_data)
+                shot = self.shot_id_str_from_version_data(version_data)
+
+                rows.append(True if shot and shot in pinned else False)
+
+        self._pinned_rows = (seq_group, rows)
 
-        return True if shot and shot in pinned else False
+        return rows
 
     def reset_pinned(self, seq_group, incoming_pinned):
         # Initialize pinned state (eg when we go from version to cut, in which
         # case the version should be pinned, or from one cut to another, in
         # which case we should "rememeber" the pinned state).
 
-        setProp(seq_group + ".sg_review.pinned", json.dumps(incoming_pinned))
+        self.session_state.set(seq_group, "pinned", incoming_pinned)
+        self.invalidate_pinned_rows()
 
     # signal from model so incremental_update is False (we need to run follow-on
     # query, if any)
@@ -2382,7 +3689,7 @@ class RvActivityMode(rvt.MinorMode):
             for index in range(0, rows):
                 item = self.tray_proxyModel.index(index, 0)
                 sg_item = shotgun_model.get_sg_data(item)
-                (version_data, edit_data) = self.data_from_version(sg_item)
+                (version_data, edit_data) = data_from_version(sg_item)
                 if version_data:
                     # making source here without reference to edit_data since we are in compare mode.
                     sources.append(self.source_group_from_version_data(version_data))
@@ -2433,23 +3740,11 @@ class RvActivityMode(rvt.MinorMode):
         # mode.
         #
         look_for_mini_focus_clip = False
-        mini_focus_clip_from_item = -1
-        mini_focus_clip_from_version = -1
-        mini_focus_clip_from_shot = -1
         if not incremental_update:
             self.reset_pinned(seq_group_node, self.incoming_pinned)
             self.incoming_pinned = {}
             if self.incoming_mini_cut_focus:
                 look_for_mini_focus_clip = True
-                mini_focus_clip_version_target = -1
-                mini_focus_clip_shot_target = -1
-                mini_focus_clip_item_target = -1
-                if self.incoming_mini_cut_focus.get("type") == "CutItem":
-                    mini_focus_clip_item_target = self.incoming_mini_cut_focus["id"]
-                else:
-                    mini_focus_clip_version_target = self.incoming_mini_cut_focus["id"]
-                    if self.incoming_mini_cut_focus.get("shot"):
-                        mini_focus_clip_shot_target = self.incoming_mini_cut_focus["shot"]["id"]
                 # XXX handle case when focus target is from cut-item (playing a cut-item)
             else:
                 # Note also if we come back to this with new query, we need
@@ -2463,115 +3758,51 @@ class RvActivityMode(rvt.MinorMode):
         self.tray_proxyModel.sort(0, QtCore.Qt.AscendingOrder)
 
         sequence_data = self.sequence_data_from_query_item(None, self.target_entity)
-        input_map = {}
-        seq_inputs = []
-        edit_data_list = []
-        accumulated_frames = 0
 
-        edl_source_nums = []
-        edl_frames = []
-        edl_ins = []
-        edl_outs = []
+        rows = []
+        for index in range(0, self.tray_proxyModel.rowCount()):
+            item = self.tray_proxyModel.index(index, 0)
+            rows.append((shotgun_model.get_sg_data(item), item.data(self._RV_DATA_ROLE)))
 
-        rows = self.tray_proxyModel.rowCount()
         # XXX handle sequence_data for queries that return no rows? - sb
         # I think just Error and return
 
-        for index in range(0, rows):
-            item = self.tray_proxyModel.index(index, 0)
-            sg_item = shotgun_model.get_sg_data(item)
-            rv_item = item.data(self._RV_DATA_ROLE)
-
-            # Collect some data to attach to the sequence level
-            if index == 0:
-                sequence_data = self.sequence_data_from_query_item(
-                        sg_item, self.target_entity)
-
-            # Build unique version_data and edit_data dictionaries for
-            # this row.  This contains all the logic for using different
-            # Versions etc.
-            (version_data, edit_data) = self.data_from_query_item(
-                    sg_item, rv_item, self.target_entity)
-
-            # If displaying a Cut and the shot of this CutItem corresponds to a
-            # pinned version, use that instead.
-            if self.target_entity.get("type") == "Cut":
-                shot_id = edit_data["shot"].get("id") if edit_data["shot"] else None;
-                pinned_version_data = pinned.get(str(shot_id))
-                if pinned_version_data:
-                    version_data = pinned_version_data
-                    # XXX ok, we just swapped version_data out, but the old
-                    # version might have been the "base layer" in which case
-                    # the edit_data is wrong for this version ...
-
-            # Now we have version data, find or create the corresponding
-            # RVSourceGroup
-            src_group_or_proxy = self.find_source_group_or_proxy_from_version_data(version_data)
-
-            # We now have edit_data and version_data and corresponding
-            # (possibly proxy) source group.  If we are showing Versions (not
-            # Cut) and DB did not contain proper first/last frame data for this
-            # Version, we'll have "None" in place if "in" and "out" in
-            # edit_data.  In that case, de-proxy source if necessary, then use
-            # actual range of source node as in/out in EDL.
-
-            if edit_data["in"] == None or edit_data["out"] == None:
-                # de-proxy source group if necessary
-                src_group_or_proxy = self.unproxied_source_group(src_group_or_proxy)
-                # get range_info from media
-                ri = rv.commands.nodeRangeInfo(src_group_or_proxy)
-                # use range_info in EDL
-                if edit_data["in"] == None:
-                    edit_data["in"] = ri["start"]
-                if edit_data["out"] == None:
-                    edit_data["out"] = ri["end"]
-
-            # store edit_data
-            edit_data_list.append(json.dumps(edit_data))
-
-            # If looking for mini-cut focus, check all possible methods of
-            # matching the clip.
-            if look_for_mini_focus_clip:
-                if (    mini_focus_clip_version_target != -1 and
-                        mini_focus_clip_version_target == version_data["id"] and
-                        mini_focus_clip_from_version == -1):
-                    mini_focus_clip_from_version = len(edl_frames)
-                    # XXX this is not going to work for cases where the "right"
-                    # version will not appear until after secondary query is
-                    # finished ...
-
-                if (    mini_focus_clip_shot_target != -1 and
-                        edit_data["shot"] and edit_data["shot"]["id"]== mini_focus_clip_shot_target and
-                        mini_focus_clip_from_shot == -1):
-                    mini_focus_clip_from_shot = len(edl_frames)
-
-                if (    mini_focus_clip_item_target != -1 and
-                        mini_focus_clip_item_target == sg_item["id"] and
-                        mini_focus_clip_from_item == -1):
-                    mini_focus_clip_from_item = len(edl_frames)
-
-            # input_num for this clip is just the nth input, unless we already have it.
-            if src_group_or_proxy in input_map:
-                input_num = input_map[src_group_or_proxy]
-            else:
-                input_num = len(seq_inputs)
-                input_map[src_group_or_proxy] = input_num
-                seq_inputs.append(src_group_or_proxy)
+        # Collect some data to attach to the sequence level
+        if rows:
+            sequence_data = self.sequence_data_from_query_item(rows[0][0], self.target_entity)
 
-            edl_source_nums.append(input_num)
-            edl_ins.        append(edit_data["in"])
-            edl_outs.       append(edit_data["out"])
-            edl_frames.     append(accumulated_frames + 1)
+        # Work out the whole EDL first, without touching the graph ...
+        edl = build_edl(rows, self.target_entity, pinned,
+                self.incoming_mini_cut_focus if look_for_mini_focus_clip else None,
+                self._app.engine.log_error)
 
-            # keep track of total frames
-            accumulated_frames += edit_data["out"] - edit_data["in"] + 1
+        # ... then find or create the RVSourceGroup of each Version.  Start
+        # looking for everyone's media before we make any of them.
+        for version_data in edl.inputs:
+            self.prefetch_media(version_data)
+
+        seq_inputs = [self.find_source_group_or_proxy_from_version_data(v) for v in edl.inputs]
+
+        # If we are showing Versions (not Cut) and DB did not contain proper
+        # first/last frame data for this Version, we'll have "None" in place
+        # if "in" and "out" in edit_data.  In that case, de-proxy source if
+        # necessary, then use actual range of source node as in/out in EDL.
+        for clip in edl.unresolved:
+            input_num = edl.source[clip]
+            seq_inputs[input_num] = self.unproxied_source_group(seq_inputs[input_num])
+            ri = rv.commands.nodeRangeInfo(seq_inputs[input_num])
+            edl.resolve(clip, ri["start"], ri["end"])
+
+        if edl.unresolved:
+            edl.compute_frames()
 
-            # XXX - re-implement
-            ## if we had a version selected before the query we try to select it again when this cut is loaded
-            #if 'version.Version.id' in sg_item:
-            #    if sg_item['version.Version.id'] == v_id:
-            #        final_selection = item
+        edit_data_list = edl.edit_data
 
+        # Versions to look up the latest cut of.  A new load starts afresh, as
+        # cuts may have come and gone since we last asked.
+        if not incremental_update:
+            self.latest_cuts_by_version = {}
+        prefetch_versions = [v for v in edl.inputs if v["id"] not in self.latest_cuts_by_version]
 
         # XXX error if sequence_data is None
 
@@ -2594,39 +3825,37 @@ class RvActivityMode(rvt.MinorMode):
         setProp(seq_node + ".mode.autoEDL",    0)
         setProp(seq_node + ".mode.useCutInfo", 0)
 
-        edl_source_nums.append(0)
-        edl_ins.append(0)
-        edl_outs.append(0)
-        edl_frames.append(accumulated_frames + 1)
-
-        # We set the "shadow" edl props no matter what, since they apply to
-        # both "mini-cut" and "entire-cut" modes.
+        edl_source_nums = edl.source
+        edl_frames      = edl.frame
+        edl_ins         = edl.ins
+        edl_outs        = edl.outs
 
-        setProp(seq_node + ".shadow_edl.source", edl_source_nums)
-        setProp(seq_node + ".shadow_edl.frame",  edl_frames)
-        setProp(seq_node + ".shadow_edl.in",     edl_ins)
-        setProp(seq_node + ".shadow_edl.out",    edl_outs)
+        # When the filter query comes back usually only some clips got a
+        # different Version; if so just swap those.
+        edl_updated = incremental_update and self.update_shadow_edl_in_place(
+                seq_group_node, seq_node, seq_inputs, edl_source_nums,
+                edl_ins, edl_outs, edit_data_list)
 
-        setProp(seq_node + ".output.fps", float(sequence_data["fps"]))
+        if not edl_updated:
+            # We set the "shadow" edl props no matter what, since they apply to
+            # both "mini-cut" and "entire-cut" modes.
 
-        setProp(seq_group_node + ".sg_review.sequence_data", json.dumps(sequence_data))
-        setProp(seq_group_node + ".sg_review.edit_data", edit_data_list)
+            setProp(seq_node + ".shadow_edl.source", edl_source_nums)
+            setProp(seq_node + ".shadow_edl.frame",  edl_frames)
+            setProp(seq_node + ".shadow_edl.in",     edl_ins)
+            setProp(seq_node + ".shadow_edl.out",    edl_outs)
+            self.invalidate_pinned_rows()
 
-        if look_for_mini_focus_clip and (
-                mini_focus_clip_from_version != -1 or
-                mini_focus_clip_from_shot    != -1 or
-                mini_focus_clip_from_item    != -1):
+            self.session_state.set(seq_group_node, "edit_data", edit_data_list)
 
-            # use "best" mini-cut focus clip detected above
+        setProp(seq_node + ".output.fps", float(sequence_data["fps"]))
 
-            if   mini_focus_clip_from_item != -1:
-                focus_index = mini_focus_clip_from_item
+        self.session_state.set(seq_group_node, "sequence_data", sequence_data)
 
-            elif mini_focus_clip_from_version != -1:
-                focus_index = mini_focus_clip_from_version
+        if look_for_mini_focus_clip and edl.mini_focus_clip != -1:
 
-            else:
-                focus_index = mini_focus_clip_from_shot
+            # use "best" mini-cut focus clip build_edl detected
+            focus_index = edl.mini_focus_clip
 
             # get spinner values from GUI
             (left_num, right_num) = self.get_mini_values()
@@ -2643,32 +3872,40 @@ class RvActivityMode(rvt.MinorMode):
             mini_data = MiniCutData.load_from_session(seq_node)
 
 
-        if mini_data.active:
-            # Store shadow inputs.  If some of these are proxies, load_mini_cut
-            # will make them "real".
-            setProp(seq_node + ".shadow_edl.inputs", seq_inputs)
+        if not edl_updated:
+            if mini_data.active:
+                # Store shadow inputs.  If some of these are proxies, load_mini_cut
+                # will make them "real".
+                self.set_shadow_inputs(seq_node, seq_inputs)
 
-            # XXX f = rvc.frame()
-            self.load_mini_cut(mini_data.focus_clip - mini_data.first_clip, seq_group=seq_group_node)
-            # XXX rvc.setFrame(f)
+                # XXX f = rvc.frame()
+                self.load_mini_cut(mini_data.focus_clip - mini_data.first_clip, seq_group=seq_group_node)
+                # XXX rvc.setFrame(f)
 
-            # XXX might not be needed
-            # self.configure_visibility()
-        else:
-            # XXX
-            setProp(seq_node + ".edl.source", edl_source_nums)
-            setProp(seq_node + ".edl.frame",  edl_frames)
-            setProp(seq_node + ".edl.in",     edl_ins)
-            setProp(seq_node + ".edl.out",    edl_outs)
+                # XXX might not be needed
+                # self.configure_visibility()
+            else:
+                # Store shadow inputs.  apply_entire_cut_edl makes the ones
+                # near the playhead "real", and the rest in idle time.  The
+                # playhead is the sequence's, so view it first.
+                self.set_shadow_inputs(seq_node, seq_inputs)
+
+                rvc.setViewNode(seq_group_node)
+                self.apply_entire_cut_edl(seq_group_node, seq_node)
 
-            # we are using all shadow inputs, so de-proxify any proxy sources
-            seq_inputs = map(self.unproxied_source_group, seq_inputs)
+        rvc.setViewNode(seq_group_node)
 
-            setProp(seq_node + ".shadow_edl.inputs", seq_inputs)
+        self.check_source_registry()
 
-            rvc.setNodeInputs(seq_group_node, seq_inputs)
+        # Resolve the clapper state of every clip in one go, rather than on
+        # each stop.  Cuts don't use the clapper.
+        if (not incremental_update and prefetch_versions and
+                self.target_entity.get("type") != "Cut"):
+            self.latest_cut_finder.prefetch(prefetch_versions)
 
-        rvc.setViewNode(seq_group_node)
+        # likewise the compare hotkeys' versions for every clip
+        if not incremental_update:
+            self._popup_utils.prefetch_compare_candidates(edl.inputs, self.compare_steps)
 
         # filter query logic
         #
@@ -2799,12 +4036,10 @@ class RvActivityMode(rvt.MinorMode):
         seq_group = rvc.viewNode()
 
         if rvc.nodeType(seq_group) == "RVSequenceGroup":
-            edit_prop = seq_group + ".sg_review.edit_data"
-            if rvc.propertyExists(edit_prop):
-                edit_data_list = getStringProperty(edit_prop)
-                clip_index = self.clip_index_from_frame()
-                if clip_index < len(edit_data_list):
-                    data = json.loads(edit_data_list[clip_index])
+            edit_data_list = self.session_state.get(seq_group, "edit_data", [])
+            clip_index = self.clip_index_from_frame()
+            if clip_index < len(edit_data_list):
+                data = edit_data_list[clip_index]
 
         return data
 
@@ -2930,13 +4165,10 @@ class RvActivityMode(rvt.MinorMode):
 
         # In case we adjusted (de-proxied) source groups above, be sure we
         # store the correct shadow inputs  in graph.
-        setProp(seq_node + ".shadow_edl.inputs", shadow_inputs)
+        self.set_shadow_inputs(seq_node, shadow_inputs)
 
         # configure sequence node
-        setProp(seq_node + ".edl.source", mini_source)
-        setProp(seq_node + ".edl.frame",  mini_frame)
-        setProp(seq_node + ".edl.in",     mini_in)
-        setProp(seq_node + ".edl.out",    mini_out)
+        self.set_edl(seq_node, mini_source, mini_frame, mini_in, mini_out)
 
         rvc.setNodeInputs(seq_group, mini_inputs)
 
@@ -2968,7 +4200,7 @@ class RvActivityMode(rvt.MinorMode):
                         frame_index = min(max(mini_data.first_clip,frame_index), mini_data.last_clip)
                         index = self.tray_model.index(frame_index, 0)
                     frame_index = frame_index - mini_data.first_clip
-                frame = rvc.getIntProperty(seq_node + ".edl.frame")
+                frame = self.edl_cache.frames(seq_node)
                 rvc.setFrame(frame[frame_index])
                 sm = self.tray_list.selectionModel()
                 sm.select(index, sm.ClearAndSelect)
@@ -2984,45 +4216,29 @@ class RvActivityMode(rvt.MinorMode):
 
         # TODO: Add overlay msg if fallback step is used?
 
+        self.compare_steps.add(step)
+        if fallback_step:
+            self.compare_steps.add(fallback_step)
+
         def function(event):
 
             source_version = self.version_data_from_source()
-            versions = self._popup_utils.retrieve_versions_for_compare(source_version,
-                                                                       step,
-                                                                       layer=layer,
-                                                                       greatest=greatest,
-                                                                       stc=stc)
-
-            if not versions and not fallback_step and not fallback_layer:
-                print 'No versions found to compare.'
-                return
-
-            # we got something to compare with, so go ahead and do that
-            if versions:
-                self._compare_with_current(versions)
-                return
-
-            # not enough info to attempt fallback
-            if not fallback_step or not fallback_layer:
-                msg = ('Can only attempt fallback with both fallback '
-                       'step and layer provided.')
-                print msg
-                return
-
-            print 'Attempting step fallback.'
-            # otherwise, no version was found, but a fallback step was provided,
-            # so check for a version from the fallback step
-            versions = self._popup_utils.retrieve_versions_for_compare(source_version,
-                                                                       fallback_step,
-                                                                       layer=fallback_layer,
-                                                                       greatest=greatest,
-                                                                       stc=stc)
-
-            if not versions:
-                print 'No appropriate fallback version found.'
+            if not source_version:
                 return
 
-            self._compare_with_current(versions)
+            if (fallback_step or fallback_layer) and not (fallback_step and fallback_layer):
+                self._app.engine.log_warning('Can only attempt fallback with both '
+                                             'fallback step and layer provided.')
+
+            # the lookup happens in the background, and the comparison is
+            # built when it comes back.
+            self._popup_utils.request_versions_for_compare(source_version,
+                                                           step,
+                                                           layer=layer,
+                                                           greatest=greatest,
+                                                           stc=stc,
+                                                           fallback_step=fallback_step,
+                                                           fallback_layer=fallback_layer)
 
         return function
 
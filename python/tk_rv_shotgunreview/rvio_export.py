@@ -0,0 +1,196 @@
+import math
+import os
+import re
+
+from tank.platform.qt import QtCore
+
+
+class RvioExport(QtCore.QObject):
+    """
+    Runs one RVIO command line without blocking RV.  The "-v" output is
+    read as it comes, and frame_written is emitted for each output frame
+    RVIO reports, matched by frame_pattern (a regex whose first group is the
+    frame number).  finished is emitted once RVIO is done.
+    """
+
+    # frame number
+    frame_written = QtCore.Signal(int)
+
+    # succeeded, everything RVIO printed
+    finished = QtCore.Signal(bool, str)
+
+    def __init__(self, args, frame_pattern, parent=None):
+        QtCore.QObject.__init__(self, parent)
+
+        self._args = args
+        self._frame_re = re.compile(frame_pattern)
+
+        self.output = ""
+        self.frames = []
+        self.succeeded = None
+
+        self._partial_line = ""
+
+        self._process = QtCore.QProcess(self)
+        self._process.setProcessChannelMode(QtCore.QProcess.MergedChannels)
+        self._process.readyReadStandardOutput.connect(self._on_output)
+        self._process.finished.connect(self._on_finished)
+        self._process.error.connect(self._on_error)
+
+    def start(self):
+        self._process.start(self._args[0], self._args[1:])
+
+    def is_running(self):
+        return self.succeeded is None
+
+    def cancel(self):
+        if self.is_running():
+            self._process.kill()
+
+    def _on_output(self):
+        text = self._partial_line + self._process.readAllStandardOutput().data()
+        lines = text.split("\n")
+
+        # keep any unfinished line for next time
+        self._partial_line = lines.pop()
+
+        for line in lines:
+            self.output += line + "\n"
+            match = self._frame_re.search(line)
+            if match:
+                frame = int(match.group(1))
+                if frame not in self.frames:
+                    self.frames.append(frame)
+                    self.frame_written.emit(frame)
+
+    def _on_finished(self, exit_code, exit_status=None):
+        self._done(exit_code == 0 and self._process.exitStatus() == QtCore.QProcess.NormalExit)
+
+    def _on_error(self, error):
+        # finished follows crashes, but not a failure to start
+        if error == QtCore.QProcess.FailedToStart:
+            self.output += "Failed to start %r\n" % self._args[0]
+            self._done(False)
+
+    def _done(self, succeeded):
+        if not self.is_running():
+            return
+
+        self._on_output()
+        self.output += self._partial_line
+        self._partial_line = ""
+
+        self.succeeded = succeeded
+        self.finished.emit(succeeded, self.output)
+
+
+class AnnotationExporter(QtCore.QObject):
+    """
+    Renders annotated frames of Versions through a pool of RVIO processes,
+    each Version's frames split between up to max_workers of them.  Frames
+    are written straight to their attachment names,
+    annot_version_<id>_v2.<source frame>.jpg, so the export session must
+    view the Version's source.
+
+    version_exported is emitted as soon as all of a Version's frames are
+    done, whatever state the other Versions are in.
+    """
+
+    # don't start an RVIO for fewer frames than this, it is mostly start-up
+    MIN_FRAMES_PER_WORKER = 4
+
+    # Version id, source frame
+    frame_written = QtCore.Signal(int, int)
+
+    # Version id, list of attachment paths, output of any failed RVIO runs
+    version_exported = QtCore.Signal(int, object, str)
+
+    def __init__(self, rvio_args, max_workers, parent=None):
+        QtCore.QObject.__init__(self, parent)
+
+        # RVIO and any options every run gets
+        self._rvio_args = rvio_args
+        self.max_workers = max(1, max_workers)
+
+        # (Version id, args) of runs waiting for a worker
+        self._queue = []
+
+        # runs in flight
+        self._running = []
+
+        # Version id -> progress of its export
+        self._versions = {}
+
+    @staticmethod
+    def attachment_path(out_dir, version_id, source_frame):
+        return os.path.join(out_dir, "annot_version_%d_v2.%d.jpg" % (version_id, source_frame))
+
+    def is_exporting(self, version_id):
+        return version_id in self._versions
+
+    def export(self, version_id, session, source_frames, out_dir):
+        """
+        Queue the rendering of source_frames of the Version from session into
+        out_dir.  The session file is removed once we're done with it.
+
+        :returns: False if there was nothing to do, or the Version is already
+            being exported (in which case session is left to the caller).
+        """
+        if self.is_exporting(version_id) or not source_frames:
+            return False
+
+        frames = sorted(source_frames)
+        out = os.path.join(out_dir, "annot_version_%d_v2.@.jpg" % version_id)
+
+        workers = min(self.max_workers, int(math.ceil(len(frames) / float(self.MIN_FRAMES_PER_WORKER))))
+        chunk = int(math.ceil(len(frames) / float(workers)))
+
+        runs = 0
+        for i in range(0, len(frames), chunk):
+            frames_str = ",".join(str(f) for f in frames[i:i + chunk])
+            self._queue.append((version_id, self._rvio_args + [session, "-o", out, "-t", frames_str]))
+            runs += 1
+
+        self._versions[version_id] = {
+            "runs": runs,
+            "finished": 0,
+            "errors": "",
+            "session": session,
+            "out_dir": out_dir,
+            "frames": frames,
+        }
+
+        self._start_next()
+
+        return True
+
+    def _start_next(self):
+        while self._queue and len(self._running) < self.max_workers:
+            (version_id, args) = self._queue.pop(0)
+
+            run = RvioExport(args, r"annot_version_%d_v2\.(\d+)\.jpg" % version_id, self)
+            run.frame_written.connect(lambda frame, v=version_id: self.frame_written.emit(v, frame))
+            run.finished.connect(lambda succeeded, output, v=version_id, r=run: self._on_run_finished(v, r, succeeded, output))
+
+            self._running.append(run)
+            run.start()
+
+    def _on_run_finished(self, version_id, run, succeeded, output):
+        self._running.remove(run)
+        run.deleteLater()
+
+        progress = self._versions[version_id]
+        progress["finished"] += 1
+        if not succeeded:
+            progress["errors"] += output
+
+        if progress["finished"] == progress["runs"]:
+            del self._versions[version_id]
+
+            if os.path.exists(progress["session"]):
+                os.remove(progress["session"])
+
+            paths = [self.attachment_path(progress["out_dir"], version_id, f) for f in progress["frames"]]
+            self.version_exported.emit(version_id, [p for p in paths if os.path.isfile(p)], progress["errors"])
+
+        self._start_next()
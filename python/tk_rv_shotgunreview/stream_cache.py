@@ -0,0 +1,80 @@
+import os
+
+import tank
+from tank.platform.qt import QtCore
+
+from .stream_cache_index import StreamCacheIndex
+from .stream_download import download_stream
+
+shotgun_data = tank.platform.import_framework("tk-framework-shotgunutils", "shotgun_data")
+
+
+class StreamCache(QtCore.QObject):
+    """
+    Local copies of streamed Version movies, so a clip that will play soon
+    doesn't have to wait on the web server when it does.  prefetch() starts
+    downloading the streams of the given Versions; stream_cached is emitted
+    as each one lands.  Files are evicted least recently used first once the
+    cache holds more than max_bytes, and stream_evicted emitted just before
+    each is removed, so sources can stop using it.  The bookkeeping is done
+    by a StreamCacheIndex; this runs its downloads.
+    """
+
+    # Version id, local path
+    stream_cached = QtCore.Signal(int, str)
+    stream_evicted = QtCore.Signal(int, str)
+
+    def __init__(self, engine, bg_task_manager, cache_dir, max_bytes, parent=None):
+        QtCore.QObject.__init__(self, parent)
+        self._engine = engine
+
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+        self._sg_data_retriever = shotgun_data.ShotgunDataRetriever(self, bg_task_manager=bg_task_manager)
+        self._sg_data_retriever.work_completed.connect(self._on_work_completed)
+        self._sg_data_retriever.work_failure.connect(self._on_work_failure)
+        self._sg_data_retriever.start()
+
+        self._index = StreamCacheIndex(cache_dir, max_bytes,
+            start=lambda url, path: self._sg_data_retriever.execute_method(download_stream, url, path),
+            stop=self._sg_data_retriever.stop_work,
+            cached=self.stream_cached.emit,
+            evicted=self.stream_evicted.emit,
+            log=self._engine.log_debug)
+
+        self._index.load()
+
+    def owns(self, path):
+        """
+        Whether path is (or was) a file of this cache.
+        """
+        return self._index.owns(path)
+
+    def local_path(self, version_id):
+        """
+        The cached copy of the Version's stream, or None if we don't have one.
+        """
+        return self._index.local_path(version_id)
+
+    def is_pending(self, version_id):
+        return self._index.is_pending(version_id)
+
+    def prefetch(self, streams, keep=()):
+        """
+        Start downloading the streams we don't have yet, given a list of
+        (Version id, url), stopping those queued for any other Version (nor
+        one of those in keep).
+        """
+        self._index.prefetch(streams, keep)
+
+    def clear(self):
+        self._index.clear()
+
+    def _on_work_completed(self, uid, request_type, data):
+        self._index.completed(uid, data.get("return_value") or 0)
+
+    def _on_work_failure(self, uid, msg):
+        version_id = self._index.failed(uid)
+        if version_id is not None:
+            self._engine.log_warning("Prefetch of stream for Version %d failed: %s" % (version_id, msg))
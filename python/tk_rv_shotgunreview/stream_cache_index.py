@@ -0,0 +1,188 @@
+import collections
+import os
+
+
+class StreamCacheIndex(object):
+    """
+    The bookkeeping of the stream cache, kept free of Qt and Toolkit: which
+    Versions have a cached file and how big it is, least recently used
+    first, and which downloads are in flight or cancelled.  The owner does
+    the downloading, through the callbacks given:
+
+        start(url, path) -> uid   start downloading url to path
+        stop(uid)                 stop a download
+        cached(version_id, path)  a file has been added to the cache
+        evicted(version_id, path) a file is about to be removed
+        log(msg)                  a file could not be removed
+    """
+
+    def __init__(self, cache_dir, max_bytes, start, stop, cached, evicted, log=None):
+        self._cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+        self._start = start
+        self._stop = stop
+        self._cached = cached
+        self._evicted = evicted
+        self._log = log
+
+        # Version id -> size of its cached file, least recently used first
+        self._sizes = collections.OrderedDict()
+        self._bytes = 0
+
+        # uid of a download in flight -> Version id, and those we no longer
+        # wait on but which may still finish and leave a file behind
+        self._downloads = {}
+        self._cancelled = {}
+
+    @property
+    def total_bytes(self):
+        return self._bytes
+
+    def cached_ids(self):
+        """
+        The Versions we have a file for, least recently used first.
+        """
+        return list(self._sizes)
+
+    def path(self, version_id):
+        return os.path.join(self._cache_dir, "%d.mp4" % version_id)
+
+    def load(self):
+        """
+        Pick up the files left by earlier sessions, oldest first.
+        """
+        found = []
+        for name in os.listdir(self._cache_dir):
+            (base, ext) = os.path.splitext(name)
+            if ext != ".mp4" or not base.isdigit():
+                continue
+
+            st = os.stat(os.path.join(self._cache_dir, name))
+            found.append((st.st_mtime, int(base), st.st_size))
+
+        for (mtime, version_id, size) in sorted(found):
+            self._sizes[version_id] = size
+            self._bytes += size
+
+        self._evict()
+
+    def owns(self, path):
+        """
+        Whether path is (or was) a file of this cache.
+        """
+        return os.path.dirname(os.path.abspath(path)) == os.path.abspath(self._cache_dir)
+
+    def local_path(self, version_id):
+        """
+        The cached copy of the Version's stream, or None if we don't have one.
+        """
+        size = self._sizes.pop(version_id, None)
+        if size is None:
+            return None
+
+        self._sizes[version_id] = size
+        return self.path(version_id)
+
+    def is_pending(self, version_id):
+        return version_id in self._downloads.values()
+
+    def prefetch(self, streams, keep=()):
+        """
+        Start downloading the streams we don't have yet, given a list of
+        (Version id, url).  Downloads still queued for any other Version
+        (nor one of those in keep) are stopped, since the playhead has moved
+        on from them.
+        """
+        wanted = set(version_id for (version_id, url) in streams)
+        wanted.update(keep)
+
+        for (uid, version_id) in list(self._downloads.items()):
+            if version_id not in wanted:
+                self._stop(uid)
+                self._cancelled[uid] = self._downloads.pop(uid)
+
+        self._collect_cancelled()
+        stopped = set(self._cancelled.values())
+
+        for (version_id, url) in streams:
+            if version_id in self._sizes or version_id in stopped or self.is_pending(version_id):
+                continue
+
+            uid = self._start(url, self.path(version_id))
+            self._downloads[uid] = version_id
+
+    def clear(self):
+        for uid in self._downloads:
+            self._stop(uid)
+            self._cancelled[uid] = self._downloads[uid]
+        self._downloads = {}
+
+        for version_id in list(self._sizes):
+            self._remove(version_id)
+
+    def _collect_cancelled(self):
+        """
+        Stopping a download that is already running doesn't stop it writing
+        its file, and we may never hear that it finished, so look on disk:
+        one that left its file is cached like any other, one with no ".part"
+        file either never started or failed.
+        """
+        for (uid, version_id) in list(self._cancelled.items()):
+            path = self.path(version_id)
+            if os.path.exists(path + ".part"):
+                continue
+
+            del self._cancelled[uid]
+            if os.path.exists(path) and version_id not in self._sizes:
+                self._add(version_id, os.path.getsize(path))
+
+    def _add(self, version_id, size):
+        self._bytes += size - self._sizes.pop(version_id, 0)
+        self._sizes[version_id] = size
+        self._evict(keep=version_id)
+
+        self._cached(version_id, self.path(version_id))
+
+    def completed(self, uid, size):
+        """
+        A download has finished, leaving a file of size bytes.
+        """
+        version_id = self._downloads.pop(uid, None)
+        if version_id is None:
+            version_id = self._cancelled.pop(uid, None)
+        if version_id is None:
+            return
+
+        self._add(version_id, size)
+
+    def failed(self, uid):
+        """
+        A download has failed; returns its Version id, or None if we had
+        already given up on it.
+        """
+        version_id = self._downloads.pop(uid, None)
+        if version_id is None:
+            self._cancelled.pop(uid, None)
+
+        return version_id
+
+    def _remove(self, version_id):
+        size = self._sizes.pop(version_id, 0)
+        self._bytes -= size
+
+        self._evicted(version_id, self.path(version_id))
+
+        try:
+            os.remove(self.path(version_id))
+        except OSError as e:
+            # probably still open in a source, we'll find it again next session
+            if self._log:
+                self._log("Could not remove cached stream: %r" % (e))
+
+    def _evict(self, keep=None):
+        for version_id in list(self._sizes):
+            if self._bytes <= self.max_bytes:
+                break
+            if version_id != keep:
+                self._remove(version_id)
@@ -0,0 +1,23 @@
+import os
+
+
+def download_stream(sg, url, path):
+    """
+    Download the stream at url to path, through a ".part" file so a
+    half-finished download is never mistaken for a cached one.  Runs in a
+    background thread.
+
+    :returns: size in bytes of the downloaded file.
+    """
+    part_path = path + ".part"
+
+    try:
+        sg.download_attachment(url, file_path=part_path)
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(part_path, path)
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+    return os.path.getsize(path)
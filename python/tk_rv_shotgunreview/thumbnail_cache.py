@@ -0,0 +1,113 @@
+import collections
+import os
+
+from tank.platform.qt import QtCore, QtGui
+
+
+class ThumbnailCache(object):
+    """
+    LRU cache of tray thumbnails, keyed by (path, mtime, size), so a
+    thumbnail rewritten in place is decoded again.  Pixmaps are scaled to the
+    tray cell size when they are loaded so painting never has to decode or
+    rescale a JPEG.  Entries are evicted oldest first once the total pixmap
+    memory passes max_bytes.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+
+        # size used for callers that don't know the cell size (model
+        # DecorationRole icons); updated by the delegate as it paints.
+        self.cell_size = QtCore.QSize(114, 64)
+
+        self._pixmaps = collections.OrderedDict()
+        self._bytes = 0
+
+        # path -> mtime of the file when we last decoded it
+        self._mtimes = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def pixmap(self, path, size=None):
+        """
+        Return the thumbnail at path scaled to fit size, decoding it only if
+        it is not already cached.
+        """
+        if not path:
+            return None
+
+        if size is None:
+            size = self.cell_size
+        else:
+            self.cell_size = size
+
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+
+        # drop every size of a thumbnail that has changed on disk
+        if self._mtimes.get(path, mtime) != mtime:
+            for stale in [k for k in self._pixmaps if k[0] == path]:
+                self._bytes -= self._cost(self._pixmaps.pop(stale))
+        self._mtimes[path] = mtime
+
+        key = (path, mtime, size.width(), size.height())
+
+        pixmap = self._pixmaps.pop(key, None)
+        if pixmap is not None:
+            self.hits += 1
+            self._pixmaps[key] = pixmap
+            return pixmap
+
+        self.misses += 1
+
+        pixmap = QtGui.QPixmap(path)
+        if pixmap.isNull():
+            return None
+
+        # like QIcon.pixmap(), shrink to fit but never enlarge
+        if pixmap.width() > size.width() or pixmap.height() > size.height():
+            pixmap = pixmap.scaled(
+                size,
+                QtCore.Qt.KeepAspectRatio,
+                QtCore.Qt.SmoothTransformation)
+
+        self._pixmaps[key] = pixmap
+        self._bytes += self._cost(pixmap)
+        self._evict()
+
+        return pixmap
+
+    def icon(self, path, size=None):
+        pixmap = self.pixmap(path, size)
+        if pixmap is None:
+            return None
+
+        return QtGui.QIcon(pixmap)
+
+    def clear(self):
+        self._pixmaps.clear()
+        self._mtimes = {}
+        self._bytes = 0
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._pixmaps),
+            "bytes": self._bytes,
+        }
+
+    def _cost(self, pixmap):
+        return pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) / 8
+
+    def _evict(self):
+        # always keep the entry we just added, even if it alone is over budget
+        while self._bytes > self.max_bytes and len(self._pixmaps) > 1:
+            (_, pixmap) = self._pixmaps.popitem(last=False)
+            self._bytes -= self._cost(pixmap)
+            self.evictions += 1
@@ -108,17 +108,14 @@ class RvTrayDelegate(shotgun_view.WidgetDelegate):
 
         return w
 
-    def choose_thumbnail(self, model_index):
+    def choose_thumbnail(self, model_index, size):
         original_tn = model_index.data(self._ORIGINAL_THUMBNAIL)
         pinned_tn = model_index.data(self._PINNED_THUMBNAIL)
         filter_tn = model_index.data(self._FILTER_THUMBNAIL)
 
-        if pinned_tn:
-            return QtGui.QIcon(pinned_tn)
-        if filter_tn:
-            return QtGui.QIcon(filter_tn)
-        if original_tn:
-            return QtGui.QIcon(original_tn)
+        path = pinned_tn or filter_tn or original_tn
+        if path:
+            return self.tray_view.rv_mode.thumbnail_cache.pixmap(path, size)
 
         return None
 
@@ -135,11 +132,12 @@ class RvTrayDelegate(shotgun_view.WidgetDelegate):
         else:
             shot = shot_name = ''
 
-        icon = self.choose_thumbnail(model_index)
-        if not icon:
+        thumb = self.choose_thumbnail(model_index, widget.sizeHint())
+        if not thumb:
             icon = model_index.data(QtCore.Qt.DecorationRole)
-        if icon:
-            thumb = icon.pixmap(widget.sizeHint())
+            if icon:
+                thumb = icon.pixmap(widget.sizeHint())
+        if thumb:
             widget.set_thumbnail(thumb, shot_name)
             widget.ui.thumbnail.setScaledContents(False)
         else:
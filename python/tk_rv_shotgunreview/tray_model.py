@@ -54,6 +54,15 @@ class TrayModel(ShotgunModel):
         self._pinned_items = {}
         self._version_order = []
 
+        # shot id -> rows, built on demand and dropped whenever rows come or
+        # go or the model is refreshed.
+        self._shot_rows = None
+
+        self.modelReset.connect(self._invalidate_row_index)
+        self.rowsInserted.connect(self._invalidate_row_index)
+        self.rowsRemoved.connect(self._invalidate_row_index)
+        self.data_refreshed.connect(self._invalidate_row_index)
+
     @property
     def version_order(self):
         """
@@ -72,6 +81,40 @@ class TrayModel(ShotgunModel):
     def version_order(self, version_ids):
         self._version_order = version_ids
 
+    def _invalidate_row_index(self, *args):
+        self._shot_rows = None
+
+    def _build_row_index(self):
+        self._shot_rows = {}
+
+        for x in range(0, self.rowCount()):
+            sg = self.index(x, 0).data(self.SG_DATA_ROLE)
+            if not sg:
+                continue
+
+            if sg.get('type') == "CutItem":
+                shot = sg.get('shot')
+            else:
+                shot = sg.get('entity')
+
+            # Versions may be linked to Assets etc, whose ids say nothing
+            # about Shots
+            if shot and shot.get('type') == "Shot":
+                self._shot_rows.setdefault((shot['type'], shot['id']), []).append(x)
+
+    def rows_for_shot(self, shot_id):
+        """
+        Rows whose CutItem shot, or Version entity, is the Shot with the
+        given id.
+
+        :param shot_id: Shotgun id, int or string.
+        :returns: A list of row numbers, possibly empty.
+        """
+        if self._shot_rows is None:
+            self._build_row_index()
+
+        return self._shot_rows.get(("Shot", int(shot_id)), [])
+
     def clear_pinned_items(self):
         self._pinned_items = {}        
 
@@ -87,18 +130,11 @@ class TrayModel(ShotgunModel):
             else:
                 path = self._pinned_items[shot_key]
                 if path:
-                    rows = self.rowCount()
-                    for x in range(0, rows):
+                    for x in self.rows_for_shot(shot_key):
                         index = self.index(x, 0)
                         sg = shotgun_model.get_sg_data(index)
-                        if sg['type'] == "CutItem":
-                            if 'shot' in sg and sg['shot']:
-                                if sg['shot']['id'] == int(shot_key):
-                                    self.setData(index, path, self._PINNED_THUMBNAIL)
-                        elif sg['type'] == "Version":
-                            if 'entity' in sg and sg['entity']:
-                                if sg['entity']['id'] == int(shot_key):
-                                    self.setData(index, path, self._PINNED_THUMBNAIL)
+                        if sg['type'] in ("CutItem", "Version"):
+                            self.setData(index, path, self._PINNED_THUMBNAIL)
                         else:
                             self._engine.log_warning( "type %r not currently handled in update_pinned_items." % sg['type'] )
 
@@ -113,33 +149,27 @@ class TrayModel(ShotgunModel):
             loop_dict = self._pinned_items
  
         for shot_key in loop_dict.keys():
-            rows = self.rowCount()
-            for x in range(0, rows):
+            for x in self.rows_for_shot(shot_key):
                 index = self.index(x, 0)
                 sg = shotgun_model.get_sg_data(index)
                 try:
                     if sg['type'] == "CutItem":
-                        if 'shot' in sg and sg['shot']:
-                            if sg['shot']['id'] == int(shot_key):
-                                if shot_key in self._pinned_items and self._pinned_items[shot_key]:
-                                    self.setData(index, self._pinned_items[shot_key], self._PINNED_THUMBNAIL)
+                        if shot_key in self._pinned_items and self._pinned_items[shot_key]:
+                            self.setData(index, self._pinned_items[shot_key], self._PINNED_THUMBNAIL)
 
+                        path = index.data(self._PINNED_THUMBNAIL)
+                        if not path:
+                            path = index.data(self._ORIGINAL_THUMBNAIL)
+                        self._pinned_items[shot_key] = path
+                    elif sg['type'] == "Version":
+                        if sg['entity']['type'] == "Shot":
+                            if shot_key in self._pinned_items and self._pinned_items[shot_key]:
+                                self.setData(index, self._pinned_items[shot_key], self._PINNED_THUMBNAIL)
+                            else:
                                 path = index.data(self._PINNED_THUMBNAIL)
                                 if not path:
                                     path = index.data(self._ORIGINAL_THUMBNAIL)
                                 self._pinned_items[shot_key] = path
-                        else:
-                            self._engine.log_warning('CutItem %d has no shot. Ignoring.' % sg['id'])
-                    elif sg['type'] == "Version":
-                        if 'entity' in sg and sg['entity']:
-                            if sg['entity']['id'] == int(shot_key) and sg['entity']['type'] == "Shot":
-                                if shot_key in self._pinned_items and self._pinned_items[shot_key]:
-                                    self.setData(index, self._pinned_items[shot_key], self._PINNED_THUMBNAIL)
-                                else:
-                                    path = index.data(self._PINNED_THUMBNAIL)
-                                    if not path:
-                                        path = index.data(self._ORIGINAL_THUMBNAIL)
-                                    self._pinned_items[shot_key] = path
 
                     else:
                         self._engine.log_warning( "type %r not currently handled in add_pinned_item." % sg['type'] )
@@ -161,8 +191,7 @@ class TrayModel(ShotgunModel):
 
         shot_id = int(version_data.keys()[0])
  
-        rows = self.rowCount()
-        for x in range(0, rows):
+        for x in self.rows_for_shot(shot_id):
             index = self.index(x, 0)
             sg = shotgun_model.get_sg_data(index)
  
@@ -182,13 +211,8 @@ class TrayModel(ShotgunModel):
                     self._pinned_items[str(shot_id)] = path
  
             if sg['type'] == "CutItem":
-                if 'shot' in sg and sg['shot']:
-                    if shot_id == sg['shot']['id']:
-                        self._pinned_items[str(shot_id)] = path
-                else:
-                    if 'version.Version.entity' in sg and sg['version.Version.entity']:
-                        if shot_id == sg['version.Version.entity']['id']:
-                            print "WARNING: shot is None, version has matching entity but not using it."
+                if shot_id == sg['shot']['id']:
+                    self._pinned_items[str(shot_id)] = path
 
     def notify_filter_data_refreshed(self, modified=True):
         self.filter_data_refreshed.emit(modified)
@@ -216,23 +240,24 @@ class TrayModel(ShotgunModel):
         sgv = item.data(self.SG_DATA_ROLE)
         shot = sgv['entity']
 
-        rows = self.rowCount()
-        for x in range(0, rows):
+        for x in self.rows_for_shot(shot['id']):
             m_idx = self.index(x, 0)
             sg = m_idx.data(self.SG_DATA_ROLE)
-            if 'shot' in sg:
-                if sg['shot'] and sg['shot']['id'] == shot['id']:
-                    t_item = self.itemFromIndex(m_idx)
-                    if not image:
-                        # we have no image, then revert to the one we stored on load 
-                        thumb = m_idx.data(self._CUT_THUMB_ROLE)
-                        t_item.setIcon(thumb)
-                    else:
-                        thumb = QtGui.QPixmap.fromImage(image)
-                        t_item.setIcon(thumb)
+            # only CutItems carry a shot; Version rows aren't filtered
+            if 'shot' not in sg:
+                continue
+
+            t_item = self.itemFromIndex(m_idx)
+            if not image:
+                # we have no image, then revert to the one we stored on load 
+                thumb = m_idx.data(self._CUT_THUMB_ROLE)
+                t_item.setIcon(thumb)
+            else:
+                thumb = QtGui.QPixmap.fromImage(image)
+                t_item.setIcon(thumb)
 
-                    # None here means dont use it. empty string better?
-                    t_item.setData(path, self._FILTER_THUMBNAIL)
+            # None here means dont use it. empty string better?
+            t_item.setData(path, self._FILTER_THUMBNAIL)
 
     def _set_tooltip(self, item, sg_item):
         """
@@ -11,38 +11,96 @@
 import tank
 from tank.platform.qt import QtCore, QtGui
 
+from .tray_sort_keys import SortKey, key_less_than, version_positions
+
 shotgun_model = tank.platform.import_framework("tk-framework-shotgunutils", "shotgun_model")
 
+
 class TraySortFilter(QtGui.QSortFilterProxyModel):
-    def lessThan(self, left, right):
-        sg_left = shotgun_model.get_sg_data(left)
-        sg_right = shotgun_model.get_sg_data(right)
-
-        if 'cut_order' in sg_left and 'cut_order' in sg_right:
-            return sg_left['cut_order'] < sg_right['cut_order']
-        elif 'playlists.PlaylistVersionConnection.sg_sort_order' in sg_left and 'playlists.PlaylistVersionConnection.sg_sort_order' in sg_right:
-                if sg_left['playlists.PlaylistVersionConnection.sg_sort_order'] == sg_right['playlists.PlaylistVersionConnection.sg_sort_order']:
-                        return sg_left['playlists.PlaylistVersionConnection.id'] < sg_right['playlists.PlaylistVersionConnection.id']
-                        
-                return sg_left['playlists.PlaylistVersionConnection.sg_sort_order'] < sg_right['playlists.PlaylistVersionConnection.sg_sort_order']
-        elif sg_left.get("type") == "Version" and sg_right.get("type") == "Version":
-            # If we're dealing with Version entities, then we will make use
-            # of the version_order property of our sourceModel. That gets
-            # set by the rv_activity_mode when Version entities are being
-            # loaded into the tray, and represents the order of the Versions
-            # exactly as they were given to RV on launch.
+    """
+    Orders the tray by cut order, playlist order, or the order Versions were
+    handed to RV.  The sort fields of each source row are pulled out of the sg
+    data once and kept until the source model's rows change, so lessThan only
+    compares precomputed keys.
+    """
+
+    def __init__(self, parent=None):
+        QtGui.QSortFilterProxyModel.__init__(self, parent)
+
+        self._keys = None
+
+        # version_order list the positions were built from, its length at
+        # the time, and the positions
+        self._order_source = None
+        self._order_length = 0
+        self._order_positions = {}
+
+    def setSourceModel(self, model):
+        old_model = self.sourceModel()
+        if old_model is not None:
+            old_model.modelReset.disconnect(self._invalidate_keys)
+            old_model.layoutChanged.disconnect(self._invalidate_keys)
+            old_model.rowsInserted.disconnect(self._invalidate_keys)
+            old_model.rowsRemoved.disconnect(self._invalidate_keys)
+            old_model.dataChanged.disconnect(self._update_keys)
+
+        # connect before the base class does, so our keys are current by the
+        # time it re-sorts in response to the same signals
+        model.modelReset.connect(self._invalidate_keys)
+        model.layoutChanged.connect(self._invalidate_keys)
+        model.rowsInserted.connect(self._invalidate_keys)
+        model.rowsRemoved.connect(self._invalidate_keys)
+        model.dataChanged.connect(self._update_keys)
+
+        self._invalidate_keys()
+
+        QtGui.QSortFilterProxyModel.setSourceModel(self, model)
+
+    def _invalidate_keys(self, *args):
+        self._keys = None
+
+    def _update_keys(self, top_left, bottom_right):
+        if self._keys is None:
+            return
+
+        model = self.sourceModel()
+        for row in range(top_left.row(), bottom_right.row() + 1):
+            if row < len(self._keys):
+                self._keys[row] = SortKey(shotgun_model.get_sg_data(model.index(row, 0)))
+
+    def _key(self, source_index):
+        if self._keys is None:
             model = self.sourceModel()
-            order = model.version_order
-            left_id = sg_left.get("id")
-            right_id = sg_right.get("id")
-
-            if left_id in order and right_id in order:
-                return order.index(left_id) < order.index(right_id)
-            else:
-                # Maintain order if we don't know enough to change it.
-                return True
-        else:
-            return True
+            self._keys = [
+                SortKey(shotgun_model.get_sg_data(model.index(row, 0)))
+                for row in range(model.rowCount())
+            ]
+
+        row = source_index.row()
+        if row >= len(self._keys):
+            return SortKey(shotgun_model.get_sg_data(source_index))
+
+        return self._keys[row]
+
+    def _version_positions(self):
+        # If we're dealing with Version entities, then we will make use
+        # of the version_order property of our sourceModel. That gets
+        # set by the rv_activity_mode when Version entities are being
+        # loaded into the tray, and represents the order of the Versions
+        # exactly as they were given to RV on launch.
+        order = self.sourceModel().version_order
+
+        # the list may be replaced or added to; repeated ids mean the
+        # positions can't be compared against it by size
+        if order is not self._order_source or len(order) != self._order_length:
+            self._order_positions = version_positions(order)
+            self._order_source = order
+            self._order_length = len(order)
+
+        return self._order_positions
+
+    def lessThan(self, left, right):
+        return key_less_than(self._key(left), self._key(right), self._version_positions())
 
 
     # JS for playlist sorting 
@@ -0,0 +1,60 @@
+_PLAYLIST_ORDER = 'playlists.PlaylistVersionConnection.sg_sort_order'
+_PLAYLIST_CONNECTION = 'playlists.PlaylistVersionConnection.id'
+
+# marks a sort field the sg data doesn't have at all
+_MISSING = object()
+
+
+class SortKey(object):
+    """
+    The fields of a tray row's sg data that decide its place in the tray,
+    pulled out once so comparing two rows doesn't read their sg data.
+    """
+    __slots__ = ("cut_order", "playlist_order", "version_id")
+
+    def __init__(self, sg):
+        sg = sg or {}
+
+        self.cut_order = sg.get('cut_order', _MISSING)
+
+        if _PLAYLIST_ORDER in sg:
+            self.playlist_order = (sg[_PLAYLIST_ORDER], sg.get(_PLAYLIST_CONNECTION))
+        else:
+            self.playlist_order = _MISSING
+
+        self.version_id = sg.get("id", _MISSING) if sg.get("type") == "Version" else _MISSING
+
+
+def version_positions(version_order):
+    """
+    Version id -> position in version_order, keeping the first position of
+    any repeated id, as list.index() did.
+    """
+    positions = {}
+    for (pos, version_id) in enumerate(version_order):
+        positions.setdefault(version_id, pos)
+    return positions
+
+
+def key_less_than(key_left, key_right, positions):
+    """
+    Whether the row of key_left goes before that of key_right: by cut order,
+    playlist order, or position in the Versions handed to RV, whichever
+    both rows have.
+    """
+    if key_left.cut_order is not _MISSING and key_right.cut_order is not _MISSING:
+        return key_left.cut_order < key_right.cut_order
+    elif key_left.playlist_order is not _MISSING and key_right.playlist_order is not _MISSING:
+        # sort order, then connection id to break ties
+        return key_left.playlist_order < key_right.playlist_order
+    elif key_left.version_id is not _MISSING and key_right.version_id is not _MISSING:
+        left_pos = positions.get(key_left.version_id)
+        right_pos = positions.get(key_right.version_id)
+
+        if left_pos is not None and right_pos is not None:
+            return left_pos < right_pos
+        else:
+            # Maintain order if we don't know enough to change it.
+            return True
+    else:
+        return True
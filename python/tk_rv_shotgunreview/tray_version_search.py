@@ -1,4 +1,7 @@
 
+import collections
+import time
+
 import sgtk
 
 from sgtk.platform.qt import QtCore, QtGui
@@ -58,9 +61,25 @@ class VersionSearchMenu(QtGui.QMenu):
                ['sg_last_frame', 'is_not', None],
                ['sg_step', 'is_not', None]]
 
+    # how many (entity, frame range) results we remember having refreshed,
+    # and for how many seconds we trust the model's cached copy of them
+    RECENT_LOADS = 50
+    RECENT_LOAD_TTL = 300
+
     def __init__(self, parent=None, engine=None):
         QtGui.QMenu.__init__(self, parent)
 
+        # load() only records what to show; the query runs once the clip has
+        # been stable for a moment, or when the menu is about to show.
+        self._pending_load = None
+        self._loaded_key = None
+        self._loading_paused = False
+        self._recent_loads = collections.OrderedDict()
+
+        self._load_timer = QtCore.QTimer(self)
+        self._load_timer.setSingleShot(True)
+        self._load_timer.setInterval(500)
+
         self._init_ui()
         self._connect_signals()
 
@@ -107,6 +126,25 @@ class VersionSearchMenu(QtGui.QMenu):
 
         self._version_view.doubleClicked.connect(self._version_selected)
 
+        self._load_timer.timeout.connect(self._on_load_timer)
+        self.aboutToShow.connect(self._load_pending)
+
+    def set_load_delay(self, msec):
+        """
+        How long the viewed Version must stay the same before we query for
+        its associated Versions.
+        """
+        self._load_timer.setInterval(msec)
+
+    def set_loading_paused(self, paused):
+        """
+        While paused (eg during playback) only opening the menu loads it.
+        """
+        self._loading_paused = paused
+
+        if not paused and self._pending_load:
+            self._load_timer.start()
+
     def _set_proxy_regex(self, search_args):
         self._version_proxy.invalidateFilter()
         regex = '*{args}*'.format(args=search_args)
@@ -131,21 +169,61 @@ class VersionSearchMenu(QtGui.QMenu):
     def load(self, version, filters):
         """
         Given a version, load associated versions into the VersionSearchMenu.
+        The query is deferred until the menu is about to show, or the same
+        version has been asked for the whole load delay.
 
         :param version dict: Version entity to find associated Versions for.
         :param filters list: List of Shotgun query filters. Typically this
             should contain the version's project and entity, so that the
             model only loads versions from the correct show/entity.
         """
+        entity = version.get('entity') or {}
+        key = (entity.get('type'), entity.get('id'),
+               version.get('sg_first_frame'), version.get('sg_last_frame'))
+
+        if key == self._loaded_key:
+            self._pending_load = None
+            self._load_timer.stop()
+            return
+
+        self._pending_load = (key, filters + self.FILTERS)
+
+        if not self._loading_paused:
+            self._load_timer.start()
+
+    def _on_load_timer(self):
+        if not self._loading_paused:
+            self._load_pending()
+
+    def _load_pending(self):
+        self._load_timer.stop()
+
+        if not self._pending_load:
+            return
 
-        filters.extend(self.FILTERS)
+        (key, filters) = self._pending_load
+        self._pending_load = None
+        self._loaded_key = key
 
-        self.version_model._load_data('Version',
+        loaded_from_cache = self.version_model._load_data('Version',
                                       filters,
                                       ['sg_step', 'code'],
                                       self.FIELDS)
 
-        self.version_model._refresh_data()
+        # Returning to an entity and range we refreshed recently: the model's
+        # cached data is good enough, don't go back to Shotgun.  Otherwise
+        # show what's cached while the model refreshes in the background, so
+        # newly published Versions turn up.
+        refreshed = self._recent_loads.pop(key, None)
+        now = time.time()
+
+        if loaded_from_cache and refreshed is not None and now - refreshed <= self.RECENT_LOAD_TTL:
+            self._recent_loads[key] = refreshed
+        else:
+            self.version_model._refresh_data()
+            self._recent_loads[key] = now
+        while len(self._recent_loads) > self.RECENT_LOADS:
+            self._recent_loads.popitem(last=False)
 
         self._version_proxy.invalidateFilter()
         self._version_proxy.setFilterWildcard('*')
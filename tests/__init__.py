@@ -0,0 +1,7 @@
+# The modules under test are the pure ones of the app, which don't need RV
+# or Toolkit; import them straight from the package directory, since
+# importing the package itself pulls in the RV mode.
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "python", "tk_rv_shotgunreview"))
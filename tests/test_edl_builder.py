@@ -0,0 +1,117 @@
+import time
+import unittest
+
+from edl_builder import build_edl, required_version_fields
+
+CUT = {"type": "Cut", "id": 7}
+PLAYLIST = {"type": "Playlist", "id": 8}
+
+
+def version(version_id, shot_id=None, first=1001, last=1010):
+    data = dict((f, None) for f in required_version_fields)
+    data.update({
+        "id": version_id,
+        "code": "v%d" % version_id,
+        "entity": {"type": "Shot", "id": shot_id} if shot_id else None,
+        "sg_first_frame": first,
+        "sg_last_frame": last,
+    })
+    return data
+
+
+def cut_item(item_id, version_id, shot_id, cut_in, cut_out):
+    sg = {
+        "type": "CutItem",
+        "id": item_id,
+        "shot": {"type": "Shot", "id": shot_id},
+        "cut_item_in": cut_in,
+        "cut_item_out": cut_out,
+        "cut.Cut.id": CUT["id"],
+    }
+    for f in required_version_fields:
+        sg["version.Version." + f] = version(version_id, shot_id).get(f)
+    return sg
+
+
+class TestBuildEdl(unittest.TestCase):
+
+    def test_cut_with_pinned(self):
+        rows = [
+            (cut_item(1, 101, 11, 1001, 1010), None),
+            (cut_item(2, 102, 12, 1001, 1005), None),
+            (cut_item(3, 101, 11, 1011, 1020), None),
+        ]
+        pinned = {"12": version(202, 12)}
+
+        edl = build_edl(rows, CUT, pinned, mini_focus={"type": "CutItem", "id": 2})
+
+        self.assertEqual([v["id"] for v in edl.inputs], [101, 202])
+        self.assertEqual(edl.source, [0, 1, 0, 0])
+        self.assertEqual(edl.frame,  [1, 11, 16, 26])
+        self.assertEqual(edl.ins,    [1001, 1001, 1011, 0])
+        self.assertEqual(edl.outs,   [1010, 1005, 1020, 0])
+        self.assertEqual(edl.unresolved, [])
+        self.assertEqual(edl.mini_focus_clip, 1)
+
+    def test_versions(self):
+        rows = [(version(101, 11), None), (version(102, 12, 1, 48), None), (version(101, 11), None)]
+
+        edl = build_edl(rows, PLAYLIST, {}, mini_focus={"type": "Version", "id": 102})
+
+        self.assertEqual([v["id"] for v in edl.inputs], [101, 102])
+        self.assertEqual(edl.source, [0, 1, 0, 0])
+        self.assertEqual(edl.frame,  [1, 11, 59, 69])
+        self.assertEqual(edl.mini_focus_clip, 1)
+
+    def test_mini_focus_by_shot(self):
+        rows = [(version(101, 11), None), (version(102, 12), None)]
+
+        edl = build_edl(rows, PLAYLIST, {},
+                mini_focus={"type": "Version", "id": 999, "shot": {"type": "Shot", "id": 12}})
+
+        self.assertEqual(edl.mini_focus_clip, 1)
+
+    def test_unresolved(self):
+        rows = [(version(101, 11), None), (version(102, 12, None, None), None)]
+
+        edl = build_edl(rows, PLAYLIST, {})
+
+        self.assertEqual(edl.unresolved, [1])
+        self.assertEqual(edl.frame, [0, 0, 0])
+
+        edl.resolve(1, 1, 24)
+        edl.compute_frames()
+
+        self.assertEqual(edl.edit_data[1]["in"], 1)
+        self.assertEqual(edl.frame, [1, 11, 35])
+
+    def test_missing_version(self):
+        sg = {"type": "CutItem", "id": 5, "cut.Cut.id": 3, "edit_in": 1, "edit_out": 10}
+        errors = []
+
+        edl = build_edl([(sg, None)], CUT, {}, log_error=errors.append)
+
+        self.assertEqual(edl.inputs[0]["id"], 100003)
+        self.assertEqual(edl.inputs[0]["code"], "Missing Version")
+        self.assertEqual(len(errors), 1)
+
+    def test_benchmark(self):
+        clips = 10000
+        rows = [(cut_item(n, 100 + n % 2500, n % 2500, 1001, 1000 + 8 + n % 40), None) for n in range(clips)]
+        pinned = dict((str(shot_id), version(50000 + shot_id, shot_id)) for shot_id in range(0, 2500, 10))
+
+        start = time.time()
+        edl = build_edl(rows, CUT, pinned, mini_focus={"type": "CutItem", "id": clips // 2})
+        elapsed = time.time() - start
+
+        self.assertEqual(edl.clip_count(), clips)
+        self.assertEqual(len(edl.inputs), 2500)
+        self.assertEqual(edl.mini_focus_clip, clips // 2)
+        self.assertEqual(edl.frame[-1] - 1, sum(o - i + 1 for (i, o) in zip(edl.ins[:-1], edl.outs[:-1])))
+
+        # a single pass over the cut, well under a second here
+        self.assertLess(elapsed, 5.0, "build_edl took %.3fs for %d clips" % (elapsed, clips))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,431 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from export_session import minimal_session, split_objects
+
+
+# a session as RV saves it: two sources in the default sequence and stack,
+# one of them annotated, and the display and output setup
+SAVED = r'''GTOa (4)
+
+rv : RVSession (4)
+{
+    session
+    {
+        string viewNode = "defaultSequence"
+        int[2] range = [ [ 1 21 ] ]
+        int[2] region = [ [ 1 21 ] ]
+        float fps = 24
+        int realtime = 0
+        int inc = 1
+        int currentFrame = 5
+        int marks = [ ]
+        int version = 1
+    }
+
+    writer
+    {
+        string name = "rv"
+        string version = "7.2.0"
+    }
+}
+
+connections : connection (1)
+{
+    evaluation
+    {
+        string lhs = [ "sourceGroup000000" "sourceGroup000001" "sourceGroup000000" "sourceGroup000001" ]
+        string rhs = [ "defaultSequence" "defaultSequence" "defaultStack" "defaultStack" ]
+    }
+
+    top
+    {
+        string nodes = [ "sourceGroup000000" "sourceGroup000001" "defaultSequence" "defaultStack" ]
+    }
+}
+
+defaultSequence : RVSequenceGroup (1)
+{
+    ui
+    {
+        string name = "Default Sequence"
+    }
+}
+
+defaultSequence_sequence : RVSequence (1)
+{
+    edl
+    {
+        int frame = [ 1 11 21 ]
+        int source = [ 0 1 0 ]
+        int in = [ 1 1 0 ]
+        int out = [ 10 10 0 ]
+    }
+
+    mode
+    {
+        int autoEDL = 1
+    }
+}
+
+defaultStack : RVStackGroup (1)
+{
+    ui
+    {
+        string name = "Default Stack"
+    }
+}
+
+defaultStack_stack : RVStack (1)
+{
+    composite
+    {
+        string type = "over"
+    }
+}
+
+sourceGroup000000 : RVSourceGroup (1)
+{
+    ui
+    {
+        string name = "shot_010 v001"
+    }
+
+    sg_review
+    {
+        int version_id = 1001
+        string edit_data = "{\"in\": 1, \"out\": 10}"
+    }
+}
+
+sourceGroup000000_source : RVFileSource (1)
+{
+    media
+    {
+        string movie = "smptebars,start=1,end=10,fps=24.movieproc"
+    }
+
+    group
+    {
+        float fps = 24
+        float volume = 1
+    }
+}
+
+sourceGroup000001 : RVSourceGroup (1)
+{
+    ui
+    {
+        string name = "shot_020 \"v002\""
+    }
+
+    sg_review
+    {
+        int version_id = 1002
+        string edit_data = "{\"in\": 1, \"out\": 10}"
+        string submitted_strokes = [ "pen:1:3:user 5001" ]
+    }
+}
+
+sourceGroup000001_source : RVFileSource (1)
+{
+    media
+    {
+        string movie = "solid,red=0.2,green=0.3,blue=0.4,start=1,end=10,fps=24.movieproc"
+    }
+
+    group
+    {
+        float fps = 24
+        float volume = 1
+    }
+}
+
+sourceGroup000001_paint : RVPaint (3)
+{
+    paint
+    {
+        int nextId = 3
+        int show = 1
+        string exclude = [ ]
+        string include = [ ]
+    }
+
+    "pen:1:3:user"
+    {
+        float[4] color = [ [ 0 1 0 1 ] ]
+        float width = [ 0.01 0.01 ]
+        string brush = "circle"
+        float[2] points = [ [ -0.5 0.1 ] [ 0.5 -0.1 ] ]
+        int debug = 0
+        int join = 3
+        int cap = 1
+        int splat = 0
+    }
+
+    "pen:2:5:user"
+    {
+        float[4] color = [ [ 1 0.5 0 1 ] ]
+        float width = [ 0.01 0.02 0.01 ]
+        string brush = "circle"
+        float[2] points = [ [ -0.25 0.1 ] [ 0 0 ] [ 0.25 -0.1 ] ]
+        int debug = 0
+        int join = 3
+        int cap = 1
+        int splat = 0
+    }
+
+    "frame:3"
+    {
+        string order = "pen:1:3:user"
+    }
+
+    "frame:5"
+    {
+        string order = "pen:2:5:user"
+    }
+}
+
+defaultOutputGroup : RVOutputGroup (1)
+{
+    output
+    {
+        int active = 0
+        string dataType = "uint8"
+        float fps = 24
+        int[2] size = [ [ 0 0 ] ]
+    }
+}
+
+displayGroup0 : RVDisplayGroup (1)
+{
+    device
+    {
+        string name = "default"
+        string moduleName = "Desktop"
+    }
+}
+
+displayGroup0_colorPipeline : RVDisplayPipelineGroup (1)
+{
+    pipeline
+    {
+        string nodes = "RVDisplayColor"
+    }
+}
+'''
+
+# SAVED cut down to render sourceGroup000001
+EXPECTED = r'''GTOa (4)
+
+rv : RVSession (4)
+{
+    session
+    {
+        string viewNode = "sourceGroup000001"
+        int[2] range = [ [ 1 21 ] ]
+        int[2] region = [ [ 1 21 ] ]
+        float fps = 24
+        int realtime = 0
+        int inc = 1
+        int currentFrame = 5
+        int marks = [ ]
+        int version = 1
+    }
+
+    writer
+    {
+        string name = "rv"
+        string version = "7.2.0"
+    }
+}
+
+connections : connection (1)
+{
+    evaluation
+    {
+        string lhs = [ ]
+        string rhs = [ ]
+    }
+
+    top
+    {
+        string nodes = [ "sourceGroup000001" ]
+    }
+}
+
+sourceGroup000001 : RVSourceGroup (1)
+{
+    ui
+    {
+        string name = "shot_020 \"v002\""
+    }
+
+    sg_review
+    {
+        int version_id = 1002
+        string edit_data = "{\"in\": 1, \"out\": 10}"
+        string submitted_strokes = [ "pen:1:3:user 5001" ]
+    }
+}
+
+sourceGroup000001_source : RVFileSource (1)
+{
+    media
+    {
+        string movie = "solid,red=0.2,green=0.3,blue=0.4,start=1,end=10,fps=24.movieproc"
+    }
+
+    group
+    {
+        float fps = 24
+        float volume = 1
+    }
+}
+
+sourceGroup000001_paint : RVPaint (3)
+{
+    paint
+    {
+        int nextId = 3
+        int show = 1
+        string exclude = [ ]
+        string include = [ ]
+    }
+
+    "pen:1:3:user"
+    {
+        float[4] color = [ [ 0 1 0 1 ] ]
+        float width = [ 0.01 0.01 ]
+        string brush = "circle"
+        float[2] points = [ [ -0.5 0.1 ] [ 0.5 -0.1 ] ]
+        int debug = 0
+        int join = 3
+        int cap = 1
+        int splat = 0
+    }
+
+    "pen:2:5:user"
+    {
+        float[4] color = [ [ 1 0.5 0 1 ] ]
+        float width = [ 0.01 0.02 0.01 ]
+        string brush = "circle"
+        float[2] points = [ [ -0.25 0.1 ] [ 0 0 ] [ 0.25 -0.1 ] ]
+        int debug = 0
+        int join = 3
+        int cap = 1
+        int splat = 0
+    }
+
+    "frame:3"
+    {
+        string order = "pen:1:3:user"
+    }
+
+    "frame:5"
+    {
+        string order = "pen:2:5:user"
+    }
+}
+
+defaultOutputGroup : RVOutputGroup (1)
+{
+    output
+    {
+        int active = 0
+        string dataType = "uint8"
+        float fps = 24
+        int[2] size = [ [ 0 0 ] ]
+    }
+}
+
+displayGroup0 : RVDisplayGroup (1)
+{
+    device
+    {
+        string name = "default"
+        string moduleName = "Desktop"
+    }
+}
+
+displayGroup0_colorPipeline : RVDisplayPipelineGroup (1)
+{
+    pipeline
+    {
+        string nodes = "RVDisplayColor"
+    }
+}
+'''
+
+DROP_NODES = [
+    "sourceGroup000000", "sourceGroup000000_source",
+    "defaultSequence", "defaultSequence_sequence",
+    "defaultStack", "defaultStack_stack",
+]
+
+
+def find_rvio():
+    rvio = os.environ.get("RV_APP_RVIO")
+    if rvio and os.path.isfile(rvio):
+        return rvio
+
+    for d in os.environ.get("PATH", "").split(os.pathsep):
+        path = os.path.join(d, "rvio")
+        if os.path.isfile(path) and os.access(path, os.X_OK):
+            return path
+
+    return None
+
+
+class TestMinimalSession(unittest.TestCase):
+
+    def test_split_objects(self):
+        (preamble, objects) = split_objects(SAVED)
+
+        self.assertEqual(preamble, "GTOa (4)\n\n")
+        self.assertEqual([name for (name, protocol, text) in objects][:4],
+            ["rv", "connections", "defaultSequence", "defaultSequence_sequence"])
+        self.assertEqual("".join(text for (name, protocol, text) in objects), SAVED[len(preamble):])
+
+    def test_minimal_session(self):
+        self.maxDiff = None
+        self.assertMultiLineEqual(minimal_session(SAVED, "sourceGroup000001", DROP_NODES), EXPECTED)
+
+    def test_nothing_to_drop(self):
+        text = minimal_session(SAVED, "defaultSequence", [])
+        self.assertEqual(text, SAVED)
+
+
+@unittest.skipUnless(find_rvio(), "no rvio (set RV_APP_RVIO or put rvio on PATH)")
+class TestRvioReadsMinimalSession(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_render(self):
+        session = os.path.join(self.dir, "export.rv")
+        with open(session, "w") as f:
+            f.write(minimal_session(SAVED, "sourceGroup000001", DROP_NODES))
+
+        out = os.path.join(self.dir, "out.@.jpg")
+        args = [find_rvio(), session, "-o", out, "-t", "3,5"]
+        lic = os.environ.get("RV_APP_USE_LICENSE_FILE")
+        if lic:
+            args += ["-lic", lic]
+
+        process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output = process.communicate()[0]
+
+        self.assertEqual(process.returncode, 0, output)
+        for frame in (3, 5):
+            self.assertTrue(os.path.isfile(os.path.join(self.dir, "out.%d.jpg" % frame)), output)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from media_resolver import MediaResolver, MediaStatusStore, choose_media_type, probe_path
+
+
+class TestProbePath(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def touch(self, *names):
+        for name in names:
+            open(os.path.join(self.dir, name), "w").close()
+
+    def probe(self, name):
+        return probe_path(os.path.join(self.dir, name))
+
+    def test_movie(self):
+        self.touch("shot.mov")
+        self.assertEqual(self.probe("shot.mov"), (True, None, None))
+        self.assertEqual(self.probe("other.mov"), (False, None, None))
+
+    def test_tokens(self):
+        self.touch("shot.1001.exr", "shot.1002.exr", "shot.1010.exr")
+        for name in ("shot.#.exr", "shot.@@@@.exr", "shot.%04d.exr"):
+            self.assertEqual(self.probe(name), (True, 1001, 1010))
+
+    def test_explicit_range(self):
+        self.touch("shot.1001.exr", "shot.1002.exr", "shot.1010.exr")
+        self.assertEqual(self.probe("shot.1002-1005#.exr"), (True, 1002, 1002))
+        self.assertEqual(self.probe("shot.1001-1010#.exr"), (True, 1001, 1010))
+        self.assertEqual(self.probe("shot.1003-1005#.exr"), (False, None, None))
+
+    def test_digits_before_token(self):
+        # "v002" is part of the name, not a frame range
+        self.touch("shot_v0021001.exr", "shot_v0021002.exr", "shot_v0031001.exr")
+        self.assertEqual(self.probe("shot_v002#.exr"), (True, 1001, 1002))
+
+    def test_missing_dir(self):
+        self.assertEqual(self.probe("nowhere/shot.#.exr"), (False, None, None))
+
+
+class TestChooseMediaType(unittest.TestCase):
+
+    def choose(self, preferred, present, auto_streaming=True):
+        paths = {"Movie": "/m/shot.mov", "Frames": "/f/shot.#.exr"}
+        return choose_media_type(preferred, paths, lambda p: p in present, auto_streaming)
+
+    def test_preferred(self):
+        self.assertEqual(self.choose("Frames", ["/m/shot.mov", "/f/shot.#.exr"]), "Frames")
+        self.assertEqual(self.choose("Streaming", []), "Streaming")
+
+    def test_fallback(self):
+        self.assertEqual(self.choose("Frames", ["/m/shot.mov"]), "Movie")
+        self.assertEqual(self.choose("Movie", []), "Streaming")
+        self.assertEqual(self.choose("Movie", [], auto_streaming=False), None)
+
+    def test_urls_count_as_present(self):
+        paths = {"Movie": "http://server/shot.mov", "Frames": None}
+        self.assertEqual(choose_media_type("Frames", paths, lambda p: False, False), "Movie")
+
+
+class TestMediaResolver(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_shutdown_and_reuse(self):
+        path = os.path.join(self.dir, "shot.mov")
+        open(path, "w").close()
+
+        store = MediaStatusStore(os.path.join(self.dir, "cache", "media_status.db"))
+        resolver = MediaResolver(ttl=60, threads=2, store=store)
+
+        resolver.prefetch([path])
+        self.assertTrue(resolver.exists(path))
+
+        # everything comes back on demand after a shutdown
+        resolver.shutdown()
+        self.assertTrue(resolver.exists(path))
+
+        resolver.prefetch([path + ".missing"])
+        self.assertFalse(resolver.exists(path + ".missing"))
+
+        resolver.shutdown()
+
+    def test_choice(self):
+        movie = os.path.join(self.dir, "shot.mov")
+        open(movie, "w").close()
+        paths = {"Movie": movie, "Frames": os.path.join(self.dir, "shot.#.exr")}
+
+        resolver = MediaResolver(ttl=60, threads=2)
+        self.assertEqual(resolver.choice(1, "Frames"), (False, None))
+
+        resolver.prefetch_choice(1, "Frames", paths, False)
+
+        deadline = time.time() + 10
+        while not resolver.choice(1, "Frames")[0] and time.time() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(resolver.choice(1, "Frames"), (True, "Movie"))
+
+        resolver.clear()
+        self.assertEqual(resolver.choice(1, "Frames"), (False, None))
+        resolver.shutdown()
+
+    def test_exists_does_not_wait(self):
+        # with no answer yet, frames are guessed at from their directory
+        resolver = MediaResolver(ttl=60, threads=2)
+        self.assertTrue(resolver.exists(os.path.join(self.dir, "shot.#.exr")))
+        self.assertFalse(resolver.exists(os.path.join(self.dir, "nowhere", "shot.#.exr")))
+        resolver.shutdown()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,192 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from stream_cache_index import StreamCacheIndex
+
+
+class TestStreamCacheIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+        self.started = []
+        self.stopped = []
+        self.cached = []
+        self.evicted = []
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def index(self, max_bytes=100):
+        return StreamCacheIndex(self.dir, max_bytes,
+            start=self.start,
+            stop=self.stopped.append,
+            cached=lambda version_id, path: self.cached.append(version_id),
+            evicted=lambda version_id, path: self.evicted.append(version_id))
+
+    def start(self, url, path):
+        self.started.append((url, path))
+        return len(self.started)
+
+    def write(self, version_id, size, mtime=None, part=False):
+        path = os.path.join(self.dir, "%d.mp4" % version_id) + (".part" if part else "")
+        with open(path, "wb") as f:
+            f.write(b"\0" * size)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+    def download(self, index, version_id, size):
+        """
+        Prefetch the Version's stream and have the download finish.
+        """
+        index.prefetch([(version_id, "url%d" % version_id)])
+        uid = len(self.started)
+        self.write(version_id, size)
+        index.completed(uid, size)
+
+    def test_load_oldest_first(self):
+        self.write(1, 30, mtime=3000)
+        self.write(2, 30, mtime=1000)
+        self.write(3, 30, mtime=2000)
+        open(os.path.join(self.dir, "notes.txt"), "w").close()
+
+        index = self.index()
+        index.load()
+
+        self.assertEqual(index.cached_ids(), [2, 3, 1])
+        self.assertEqual(index.total_bytes, 90)
+        self.assertEqual(self.evicted, [])
+
+    def test_load_evicts_over_budget(self):
+        self.write(1, 60, mtime=1000)
+        self.write(2, 60, mtime=2000)
+
+        index = self.index()
+        index.load()
+
+        self.assertEqual(index.cached_ids(), [2])
+        self.assertEqual(self.evicted, [1])
+        self.assertFalse(os.path.exists(index.path(1)))
+
+    def test_prefetch_skips_cached_and_pending(self):
+        index = self.index()
+        self.download(index, 1, 10)
+
+        index.prefetch([(1, "url1"), (2, "url2")])
+        index.prefetch([(2, "url2")])
+
+        self.assertEqual([url for (url, path) in self.started], ["url1", "url2"])
+        self.assertTrue(index.is_pending(2))
+        self.assertEqual(self.cached, [1])
+
+    def test_lru_eviction(self):
+        index = self.index()
+        self.download(index, 1, 40)
+        self.download(index, 2, 40)
+
+        # using 1 makes 2 the least recently used
+        self.assertEqual(index.local_path(1), index.path(1))
+        self.download(index, 3, 40)
+
+        self.assertEqual(self.evicted, [2])
+        self.assertEqual(index.cached_ids(), [1, 3])
+        self.assertEqual(index.total_bytes, 80)
+        self.assertEqual(index.local_path(2), None)
+        self.assertFalse(os.path.exists(index.path(2)))
+
+    def test_new_file_is_kept_even_when_too_big(self):
+        index = self.index()
+        self.download(index, 1, 40)
+        self.download(index, 2, 150)
+
+        self.assertEqual(self.evicted, [1])
+        self.assertEqual(index.cached_ids(), [2])
+
+    def test_prefetch_stops_downloads_no_longer_wanted(self):
+        index = self.index()
+        index.prefetch([(1, "url1"), (2, "url2")])
+        index.prefetch([(3, "url3")], keep=[2])
+
+        self.assertEqual(self.stopped, [1])
+        self.assertFalse(index.is_pending(1))
+        self.assertTrue(index.is_pending(2))
+
+    def test_cancelled_download_that_finishes_is_cached(self):
+        index = self.index()
+        index.prefetch([(1, "url1")])
+        self.write(1, 10, part=True)
+        index.prefetch([])
+        self.assertEqual(self.stopped, [1])
+
+        # a download that had already started still writes its file ...
+        os.remove(index.path(1) + ".part")
+        self.write(1, 10)
+        index.completed(1, 10)
+
+        self.assertEqual(self.cached, [1])
+        self.assertEqual(index.local_path(1), index.path(1))
+
+    def test_cancelled_download_found_on_disk(self):
+        index = self.index()
+        index.prefetch([(1, "url1"), (2, "url2")])
+        self.write(1, 10, part=True)
+        index.prefetch([])
+
+        # ... and one we never hear about again is found on disk, once its
+        # ".part" file is gone
+        os.remove(index.path(1) + ".part")
+        self.write(1, 10)
+
+        # 1 still downloading, so not started again; 2 never started
+        index.prefetch([(1, "url1")])
+        self.assertEqual(self.cached, [1])
+        self.assertEqual(len(self.started), 2)
+
+        index.prefetch([(2, "url2")])
+        self.assertEqual(len(self.started), 3)
+
+    def test_stopped_download_is_not_restarted_while_running(self):
+        index = self.index()
+        index.prefetch([(1, "url1")])
+        self.write(1, 10, part=True)
+        index.prefetch([])
+
+        index.prefetch([(1, "url1")])
+        self.assertEqual(len(self.started), 1)
+
+    def test_failed(self):
+        index = self.index()
+        index.prefetch([(1, "url1"), (2, "url2")])
+        index.prefetch([(1, "url1")])
+
+        self.assertEqual(index.failed(1), 1)
+        self.assertEqual(index.failed(2), None)
+        self.assertFalse(index.is_pending(1))
+
+        # the stream can be asked for again
+        index.prefetch([(1, "url1")])
+        self.assertEqual(len(self.started), 3)
+
+    def test_clear(self):
+        index = self.index()
+        self.download(index, 1, 10)
+        index.prefetch([(2, "url2")])
+
+        index.clear()
+
+        self.assertEqual(self.stopped, [2])
+        self.assertEqual(self.evicted, [1])
+        self.assertEqual(index.cached_ids(), [])
+        self.assertEqual(index.total_bytes, 0)
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def test_owns(self):
+        index = self.index()
+        self.assertTrue(index.owns(index.path(1)))
+        self.assertFalse(index.owns(os.path.join(self.dir, "sub", "1.mp4")))
+
+
+if __name__ == "__main__":
+    unittest.main()
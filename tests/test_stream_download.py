@@ -0,0 +1,83 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+try:
+    from http.server import HTTPServer, SimpleHTTPRequestHandler
+    from urllib.request import urlopen
+except ImportError:
+    from BaseHTTPServer import HTTPServer
+    from SimpleHTTPServer import SimpleHTTPRequestHandler
+    from urllib2 import urlopen
+
+from stream_download import download_stream
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Shotgun(object):
+    """
+    Stands in for the Shotgun API, fetching attachments straight from url.
+    """
+
+    def download_attachment(self, url, file_path):
+        response = urlopen(url)
+        try:
+            with open(file_path, "wb") as f:
+                f.write(response.read())
+        finally:
+            response.close()
+
+
+class TestDownloadStream(unittest.TestCase):
+
+    def setUp(self):
+        self.served = tempfile.mkdtemp()
+        self.cache = tempfile.mkdtemp()
+
+        with open(os.path.join(self.served, "123.mp4"), "wb") as f:
+            f.write(b"\0" * 10000)
+
+        # SimpleHTTPRequestHandler serves the current directory
+        self.cwd = os.getcwd()
+        os.chdir(self.served)
+
+        self.server = HTTPServer(("127.0.0.1", 0), _QuietHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+        self.url = "http://127.0.0.1:%d/" % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.served)
+        shutil.rmtree(self.cache)
+
+    def test_download(self):
+        path = os.path.join(self.cache, "123.mp4")
+
+        self.assertEqual(download_stream(_Shotgun(), self.url + "123.mp4", path), 10000)
+        self.assertEqual(os.listdir(self.cache), ["123.mp4"])
+
+        # downloading again replaces the file
+        self.assertEqual(download_stream(_Shotgun(), self.url + "123.mp4", path), 10000)
+        self.assertEqual(os.listdir(self.cache), ["123.mp4"])
+
+    def test_failed_download_leaves_nothing(self):
+        path = os.path.join(self.cache, "456.mp4")
+
+        self.assertRaises(Exception, download_stream, _Shotgun(), self.url + "456.mp4", path)
+        self.assertEqual(os.listdir(self.cache), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+import random
+import time
+import unittest
+
+from tray_sort_keys import SortKey, key_less_than, version_positions
+
+
+def legacy_less_than(sg_left, sg_right, order):
+    """
+    TraySortFilter.lessThan as it was before sort keys, searching
+    version_order for every comparison.
+    """
+    if 'cut_order' in sg_left and 'cut_order' in sg_right:
+        return sg_left['cut_order'] < sg_right['cut_order']
+    elif ('playlists.PlaylistVersionConnection.sg_sort_order' in sg_left and
+            'playlists.PlaylistVersionConnection.sg_sort_order' in sg_right):
+        if (sg_left['playlists.PlaylistVersionConnection.sg_sort_order'] ==
+                sg_right['playlists.PlaylistVersionConnection.sg_sort_order']):
+            return sg_left['playlists.PlaylistVersionConnection.id'] < sg_right['playlists.PlaylistVersionConnection.id']
+
+        return (sg_left['playlists.PlaylistVersionConnection.sg_sort_order'] <
+                sg_right['playlists.PlaylistVersionConnection.sg_sort_order'])
+    elif sg_left.get("type") == "Version" and sg_right.get("type") == "Version":
+        left_id = sg_left.get("id")
+        right_id = sg_right.get("id")
+        if left_id in order and right_id in order:
+            return order.index(left_id) < order.index(right_id)
+        else:
+            return True
+    else:
+        return True
+
+
+class _Ordered(object):
+    """
+    Sorts by a lessThan style function alone, as the proxy model does.
+    """
+    __slots__ = ("value", "less_than")
+
+    def __init__(self, value, less_than):
+        self.value = value
+        self.less_than = less_than
+
+    def __lt__(self, other):
+        return self.less_than(self.value, other.value)
+
+
+def sort_rows(rows, less_than):
+    return [o.value for o in sorted(_Ordered(r, less_than) for r in rows)]
+
+
+class TestTraySortKeys(unittest.TestCase):
+
+    ROWS = 5000
+
+    def setUp(self):
+        self.random = random.Random(1138)
+
+    def cut_rows(self):
+        orders = list(range(self.ROWS))
+        self.random.shuffle(orders)
+        return [{"type": "CutItem", "id": 1000 + n, "cut_order": o} for (n, o) in enumerate(orders)]
+
+    def playlist_rows(self):
+        # lots of repeated sort orders, so the connection id matters
+        return [{
+            "type": "Version",
+            "id": 1000 + n,
+            "playlists.PlaylistVersionConnection.sg_sort_order": self.random.randint(0, self.ROWS // 10),
+            "playlists.PlaylistVersionConnection.id": self.random.randint(0, 10 * self.ROWS),
+        } for n in range(self.ROWS)]
+
+    def version_rows(self):
+        ids = list(range(1000, 1000 + self.ROWS))
+        self.random.shuffle(ids)
+        order = list(ids)
+
+        # repeated ids keep their first position, ids missing from the
+        # order keep theirs in the tray
+        order.extend(self.random.sample(ids, 50))
+        for version_id in self.random.sample(ids, 20):
+            order.remove(version_id)
+        self.random.shuffle(ids)
+
+        return ([{"type": "Version", "id": version_id} for version_id in ids], order)
+
+    def check_same_order(self, rows, order=()):
+        """
+        Sort rows both ways, check they agree, and return the time each took.
+        """
+        order = list(order)
+
+        start = time.time()
+        legacy = sort_rows(rows, lambda l, r: legacy_less_than(l, r, order))
+        legacy_time = time.time() - start
+
+        start = time.time()
+        positions = version_positions(order)
+        keys = [(SortKey(sg), sg) for sg in rows]
+        current = [sg for (key, sg) in sort_rows(keys, lambda l, r: key_less_than(l[0], r[0], positions))]
+        current_time = time.time() - start
+
+        self.assertEqual([sg["id"] for sg in legacy], [sg["id"] for sg in current])
+
+        return (legacy_time, current_time)
+
+    def assert_no_slower(self, times):
+        # building the keys costs about as much as the comparisons save;
+        # allow for timer noise on a loaded machine
+        (legacy_time, current_time) = times
+        self.assertLess(current_time, 3 * legacy_time + 0.1)
+
+    def test_cut_order(self):
+        self.assert_no_slower(self.check_same_order(self.cut_rows()))
+
+    def test_playlist_order(self):
+        self.assert_no_slower(self.check_same_order(self.playlist_rows()))
+
+    def test_version_order(self):
+        (rows, order) = self.version_rows()
+        (legacy_time, current_time) = self.check_same_order(rows, order)
+
+        # list.index() per comparison is quadratic, the positions aren't
+        self.assertLess(current_time * 20, legacy_time)
+
+    def test_version_positions_keep_first(self):
+        self.assertEqual(version_positions([3, 1, 3, 2]), {3: 0, 1: 1, 2: 3})
+
+
+if __name__ == "__main__":
+    unittest.main()